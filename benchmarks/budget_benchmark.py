@@ -0,0 +1,87 @@
+import os
+import sys
+import time
+import argparse
+import contextlib
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pymoji
+
+# Runs tight loops compiled without and with an execution budget (--budget) large enough never to
+# run out, and prints the best wall time of each with the overhead of the budget checks
+
+programs = {
+    'while': '''▶️
+🔢 i = 0
+🐳 i 🐜 {n} 🔓
+  i = i 🤰 1
+🔒
+📤 i
+⏹️''',
+    'while sum': '''▶️
+🔢 i = 0
+🔢 total = 0
+🐳 i 🐜 {n} 🔓
+  total = total 🤰 i 🙅 2
+  i = i 🤰 1
+🔒
+📤 total
+⏹️''',
+    'for': '''▶️
+🔢 total = 0
+🔂 i ⛳ {n} 🔓
+  total = total 🤰 i
+🔒
+📤 total
+⏹️''',
+    'nested for': '''▶️
+🔢 total = 0
+🔂 i ⛳ {outer} 🔓
+  🔂 j ⛳ 4 🔓
+    total = total 🤰 j
+  🔒
+🔒
+📤 total
+⏹️''',
+    'nested while': '''▶️
+🔢 i = 0
+🔢 j = 0
+🔢 total = 0
+🐳 i 🐜 {outer} 🔓
+  j = 0
+  🐳 j 🐜 4 🔓
+    total = total 🤰 j
+    j = j 🤰 1
+  🔒
+  i = i 🤰 1
+🔒
+📤 total
+⏹️''',
+}
+
+def best_times(codes, repeat):
+    # The runs of the variants alternate, so that a slower stretch of the machine hits all of them
+    best = [float('inf')] * len(codes)
+    for _ in range(repeat):
+        for index, code in enumerate(codes):
+            with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+                start = time.perf_counter()
+                exec(code, {'__name__': '__main__'})
+                best[index] = min(best[index], time.perf_counter() - start)
+    return best
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Measure the overhead of execution budgets on tight loops.')
+    parser.add_argument('--n', type=int, default=1_000_000, help='loop iterations per program (default: 1000000)')
+    parser.add_argument('--repeat', type=int, default=15, help='runs per program, the best one is reported (default: 15)')
+    parser.add_argument('--function', action='store_true', help='wrap the programs in main() (--function)')
+    args = parser.parse_args()
+
+    print(f'{"program":<14} {"plain":>10} {"budget":>10} {"overhead":>9}')
+    for name, template in programs.items():
+        source = template.format(n=args.n, outer=args.n // 4)
+        plain = pymoji.compile_code(source, filename=name, function=args.function)
+        budgeted = pymoji.compile_code(source, filename=name, function=args.function, budget=10 * args.n)
+        plain_time, budget_time = best_times((plain, budgeted), args.repeat)
+        print(f'{name:<14} {plain_time * 1000:>8.1f}ms {budget_time * 1000:>8.1f}ms {(budget_time / plain_time - 1) * 100:>8.1f}%')
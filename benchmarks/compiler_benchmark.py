@@ -0,0 +1,156 @@
+import os
+import sys
+import gc
+import json
+import time
+import platform
+import argparse
+import datetime
+import subprocess
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pymoji
+from program_generator import ProgramGenerator, parse_size, parse_mix
+
+# Times every phase of the front end on generated programs of growing size, then runs the phases
+# once more under tracemalloc for their peak memory (tracing slows them down, so it never overlaps
+# the timed runs). Results are written as JSON with the commit they were measured on, and
+# --compare prints the ratio against an earlier result file
+
+phases = ('tokenize', 'parse', 'analyze', 'transpile')
+default_sizes = '1K,10K,100K,1M,10M,100M'
+
+def run_phases(source):
+    # Returns the duration of each phase and what the later phases need
+    durations = {}
+    start = time.perf_counter()
+    tokens = pymoji.tokenize(source)
+    durations['tokenize'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    ast = pymoji.Parser(tokens).parse()
+    durations['parse'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    pymoji.SemanticAnalyzer(ast).analyze()
+    durations['analyze'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    python_code = pymoji.Transpiler(ast).transpile()
+    durations['transpile'] = time.perf_counter() - start
+    return durations, tokens, ast, python_code
+
+def peak_memory(source):
+    # Peak traced memory of each phase, counting what the earlier phases left alive
+    peaks = {}
+    tracemalloc.start()
+    try:
+        tokens = pymoji.tokenize(source)
+        peaks['tokenize'] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.reset_peak()
+        ast = pymoji.Parser(tokens).parse()
+        peaks['parse'] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.reset_peak()
+        pymoji.SemanticAnalyzer(ast).analyze()
+        peaks['analyze'] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.reset_peak()
+        pymoji.Transpiler(ast).transpile()
+        peaks['transpile'] = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return peaks
+
+def benchmark_size(source, repeat, trace):
+    size = len(source.encode('utf-8'))
+    best = dict.fromkeys(phases, float('inf'))
+    for _ in range(repeat):
+        gc.collect()
+        durations, tokens, ast, python_code = run_phases(source)
+        for phase in phases:
+            best[phase] = min(best[phase], durations[phase])
+    result = {
+        'bytes': size,
+        'tokens': len(tokens),
+        'nodes': sum(pymoji.count_nodes(ast).values()),
+        'output_bytes': len(python_code.encode('utf-8')),
+        'phases': {phase: {'seconds': best[phase], 'mb_per_second': size / best[phase] / 1024 / 1024} for phase in phases},
+    }
+    del tokens, ast, python_code
+    if trace:
+        gc.collect()
+        for phase, peak in peak_memory(source).items():
+            result['phases'][phase]['peak_bytes'] = peak
+    return result
+
+def git_commit():
+    directory = os.path.dirname(os.path.abspath(__file__))
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=directory, capture_output=True, text=True, check=True).stdout.strip()
+        dirty = bool(subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=directory, capture_output=True, text=True, check=True).stdout.strip())
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+    return commit, dirty
+
+def compare(results, baseline):
+    # Prints new/old time ratios for the sizes both runs have
+    old = {result['label']: result for result in baseline['results']}
+    print(f'\ncompared with {(baseline.get("commit") or "?")[:12]} (time ratio, below 1 is faster)')
+    for result in results:
+        previous = old.get(result['label'])
+        if previous is None:
+            continue
+        ratios = ' '.join(f'{phase} {result["phases"][phase]["seconds"] / previous["phases"][phase]["seconds"]:.2f}x' for phase in phases)
+        print(f'{result["label"]:>6}  {ratios}')
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Time the compiler phases on generated programs of growing size.')
+    parser.add_argument('--sizes', default=default_sizes, help=f'comma separated program sizes (default: {default_sizes})')
+    parser.add_argument('--seed', type=int, default=0, help='generator seed (default: 0)')
+    parser.add_argument('--depth', type=int, default=3, help='maximum nesting of 🍷🗿/🐳/🔂 blocks (default: 3)')
+    parser.add_argument('--block-size', type=int, default=4, help='maximum statements per block (default: 4)')
+    parser.add_argument('--expression-size', type=int, default=3, help='maximum binary operators per expression (default: 3)')
+    parser.add_argument('--mix', type=parse_mix, default={}, help='statement weights, e.g. declaration=3,while=0')
+    parser.add_argument('--repeat', type=int, default=3, help='timed runs per size, the best one is kept (default: 3)')
+    parser.add_argument('--no-memory', action='store_true', help='skip the tracemalloc pass')
+    parser.add_argument('--output', default=None, help='JSON result file (default: benchmarks/results/<commit>.json)')
+    parser.add_argument('--compare', default=None, help='earlier JSON result file to compare with')
+    args = parser.parse_args()
+
+    commit, dirty = git_commit()
+    report = {
+        'commit': commit,
+        'dirty': dirty,
+        'date': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'machine': platform.machine(),
+        'generator': {'seed': args.seed, 'depth': args.depth, 'block_size': args.block_size, 'expression_size': args.expression_size, 'mix': args.mix},
+        'results': [],
+    }
+
+    print(f'{"size":>6} {"tokens":>10} ' + ' '.join(f'{phase:>20}' for phase in phases))
+    for label in args.sizes.split(','):
+        generator = ProgramGenerator(args.seed, args.depth, args.block_size, args.expression_size, args.mix)
+        source = generator.generate(parse_size(label))
+        result = {'label': label, **benchmark_size(source, args.repeat, not args.no_memory)}
+        del source
+        report['results'].append(result)
+
+        columns = []
+        for phase in phases:
+            timing = result['phases'][phase]
+            peak = f' {timing["peak_bytes"] / 1024 / 1024:6.1f}MB' if 'peak_bytes' in timing else ''
+            columns.append(f'{timing["seconds"] * 1000:9.1f}ms{peak}'.rjust(20))
+        print(f'{label:>6} {result["tokens"]:>10} ' + ' '.join(columns), flush=True)
+
+    output = args.output or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results', f'{(commit or "unknown")[:12]}{"-dirty" if dirty else ""}.json')
+    os.makedirs(os.path.dirname(output) or os.curdir, exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as file:
+        json.dump(report, file, indent=2, ensure_ascii=False)
+    print(f'results written to {output}')
+
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as file:
+            compare(report['results'], json.load(file))
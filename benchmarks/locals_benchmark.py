@@ -0,0 +1,75 @@
+import os
+import sys
+import time
+import argparse
+import contextlib
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pymoji
+
+# Runs loop heavy programs compiled as module level code and wrapped in main() (--function),
+# and prints the best wall time of each
+
+programs = {
+    'while': '''▶️
+🔢 i = 0
+🔢 total = 0
+🐳 i 🐜 {n} 🔓
+  total = total 🤰 i 🙅 2
+  i = i 🤰 1
+🔒
+📤 total
+⏹️''',
+    'nested for': '''▶️
+🔢 total = 0
+🔂 i ⛳ {root} 🔓
+  🔂 j ⛳ {root} 🔓
+    total = total 🤰 i 🙅 j 🔫 j
+  🔒
+🔒
+📤 total
+⏹️''',
+    'fibonacci': '''▶️
+🔢 a = 0
+🔢 b = 1
+🔢 t = 0
+🔂 i ⛳ {n} 🔓
+  t = a 🤰 b
+  a = b
+  b = t
+  🍷🗿 b 🐘 1000000 🔓
+    a = 0
+    b = 1
+  🔒
+🔒
+📤 a
+⏹️''',
+    'print loop': '''▶️
+🔂 i ⛳ {n} 🔓
+  📤 i
+🔒
+⏹️''',
+}
+
+def best_time(code, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            start = time.perf_counter()
+            exec(code, {'__name__': '__main__'})
+            best = min(best, time.perf_counter() - start)
+    return best
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compare module level and main() code generation.')
+    parser.add_argument('--n', type=int, default=1_000_000, help='loop iterations per program (default: 1000000)')
+    parser.add_argument('--repeat', type=int, default=5, help='runs per program, the best one is reported (default: 5)')
+    args = parser.parse_args()
+
+    print(f'{"program":<12} {"module":>10} {"main()":>10} {"speedup":>8}')
+    for name, template in programs.items():
+        source = template.format(n=args.n, root=int(args.n ** 0.5))
+        module_time = best_time(compile(pymoji.compile_source(source), name, 'exec'), args.repeat)
+        function_time = best_time(compile(pymoji.compile_source(source, function=True), name, 'exec'), args.repeat)
+        print(f'{name:<12} {module_time * 1000:>8.1f}ms {function_time * 1000:>8.1f}ms {module_time / function_time:>7.2f}x')
@@ -0,0 +1,187 @@
+import random
+import argparse
+
+# Seeded generator of valid emojicode programs for the benchmarks. Every program it writes passes
+# the SemanticAnalyzer: variables are declared before use, with a fresh name each time, and every
+# expression has the type its context expects. Programs are only compiled, never run, so 🐳 loops
+# may well be infinite
+
+statement_kinds = ('declaration', 'assignment', 'output', 'input', 'conditional', 'while', 'for')
+
+default_mix = {
+    'declaration': 3,
+    'assignment': 3,
+    'output': 2,
+    'input': 1,
+    'conditional': 2,
+    'while': 1,
+    'for': 1,
+}
+
+declaration_emojis = {'number': '🔢', 'string': '🧵', 'boolean': '✳️'}
+arithmetic_operators = ('🤰', '🔫', '🙅', '🇦🇴')
+comparison_operators = ('♊', '♓', '🐜', '🐘', '🐜🐞', '🐘🦣')
+words = ('abc', 'olá mundo', 'x y z', 'senha123', 'emoji 🎉', 'Digite um número: ')
+
+class ProgramGenerator:
+    # max_depth bounds the nesting of 🍷🗿/🐳/🔂 blocks, block_size the statements per block,
+    # expression_size the binary operators per expression and mix the relative weight of each
+    # statement kind
+    def __init__(self, seed=0, max_depth=3, block_size=4, expression_size=3, mix=None):
+        self.random = random.Random(seed)
+        self.max_depth = max_depth
+        self.block_size = block_size
+        self.expression_size = expression_size
+        mix = {**default_mix, **(mix or {})}
+        self.kinds = [kind for kind in statement_kinds if mix[kind] > 0]
+        self.weights = [mix[kind] for kind in self.kinds]
+        self.variables = {'number': [], 'string': [], 'boolean': []}
+        self.counter = 0
+
+    def generate(self, size):
+        # Returns a program of at least size bytes of UTF-8
+        lines = ['▶️']
+        total = len(lines[0].encode('utf-8')) + 1
+        while total < size:
+            for line in self.statement(0):
+                lines.append(line)
+                total += len(line.encode('utf-8')) + 1
+        lines.append('⏹️')
+        return '\n'.join(lines) + '\n'
+
+    def statement(self, depth):
+        kind = self.random.choices(self.kinds, self.weights)[0]
+        if depth >= self.max_depth and kind in ('conditional', 'while', 'for'):
+            kind = 'output'
+        if kind == 'assignment' and not any(self.variables.values()):
+            kind = 'declaration'
+        return getattr(self, f'generate_{kind}')(depth, '  ' * depth)
+
+    def block(self, depth):
+        lines = []
+        for _ in range(self.random.randint(1, self.block_size)):
+            lines.extend(self.statement(depth + 1))
+        return lines
+
+    def new_name(self, prefix):
+        self.counter += 1
+        return f'{prefix}{self.counter}'
+
+    def generate_declaration(self, depth, indent):
+        value_type = self.random.choice(('number', 'number', 'string', 'boolean'))
+        value = self.expression(value_type)
+        name = self.new_name('v')
+        self.variables[value_type].append(name)
+        return [f'{indent}{declaration_emojis[value_type]} {name} = {value}']
+
+    def generate_assignment(self, depth, indent):
+        value_type = self.random.choice([value_type for value_type, names in self.variables.items() if names])
+        return [f'{indent}{self.random.choice(self.variables[value_type])} = {self.expression(value_type)}']
+
+    def generate_output(self, depth, indent):
+        return [f'{indent}📤 {self.expression(self.random.choice(("number", "string", "boolean")))}']
+
+    def generate_input(self, depth, indent):
+        return [f'{indent}📥 🌪️{self.random.choice(words)}🌪️']
+
+    def generate_conditional(self, depth, indent):
+        lines = [f'{indent}🍷🗿 {self.expression("boolean")} 🔓']
+        lines.extend(self.block(depth))
+        if self.random.random() < 0.5:
+            lines.append(f'{indent}🔒 ☝️🤓 🔓')
+            lines.extend(self.block(depth))
+        lines.append(f'{indent}🔒')
+        return lines
+
+    def generate_while(self, depth, indent):
+        lines = [f'{indent}🐳 {self.expression("boolean")} 🔓']
+        lines.extend(self.block(depth))
+        lines.append(f'{indent}🔒')
+        return lines
+
+    def generate_for(self, depth, indent):
+        name = self.new_name('i')
+        lines = [f'{indent}🔂 {name} ⛳ {self.random.randint(1, 100)} 🔓']
+        self.variables['number'].append(name)
+        lines.extend(self.block(depth))
+        lines.append(f'{indent}🔒')
+        return lines
+
+    def operand(self, value_type):
+        names = self.variables[value_type]
+        if names and self.random.random() < 0.6:
+            return self.random.choice(names)
+        if value_type == 'number':
+            return str(self.random.randint(0, 1000))
+        elif value_type == 'string':
+            if self.random.random() < 0.2:
+                return f'📥🌪️{self.random.choice(words)}🌪️'
+            return f'🌪️{self.random.choice(words)}🌪️'
+        return self.random.choice(('✅', '❎'))
+
+    def expression(self, value_type):
+        size = self.random.randint(0, self.expression_size)
+        if value_type == 'number':
+            parts = [self.operand('number')]
+            for _ in range(size):
+                parts.append(self.random.choice(arithmetic_operators))
+                parts.append(self.operand('number'))
+            return ' '.join(parts)
+        elif value_type == 'string':
+            return self.operand('string')
+        # Booleans: comparisons and boolean operands joined by 😍😍/😘🤨
+        parts = [self.comparison()]
+        for _ in range(size // 2):
+            parts.append(self.random.choice(('😍😍', '😘🤨')))
+            parts.append(self.comparison())
+        return ' '.join(parts)
+
+    def comparison(self):
+        choice = self.random.random()
+        if choice < 0.3:
+            return self.operand('boolean')
+        elif choice < 0.8:
+            left = ' '.join(self.arithmetic(1))
+            right = ' '.join(self.arithmetic(1))
+            return f'{left} {self.random.choice(comparison_operators)} {right}'
+        return f'{self.operand("string")} {self.random.choice(("♊", "♓"))} {self.operand("string")}'
+
+    def arithmetic(self, size):
+        parts = [self.operand('number')]
+        for _ in range(size):
+            parts.append(self.random.choice(arithmetic_operators))
+            parts.append(self.operand('number'))
+        return parts
+
+def parse_size(text):
+    # 1K, 10M, 1G or a plain number of bytes
+    units = {'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3}
+    text = text.strip().upper().removesuffix('B')
+    if text and text[-1] in units:
+        return int(float(text[:-1]) * units[text[-1]])
+    return int(text)
+
+def parse_mix(text):
+    # declaration=3,while=0,...
+    mix = {}
+    for item in filter(None, text.split(',')):
+        kind, _, weight = item.partition('=')
+        if kind not in statement_kinds:
+            raise argparse.ArgumentTypeError(f'Unknown statement kind: {kind}')
+        mix[kind] = float(weight)
+    return mix
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Write a random valid emojicode program.')
+    parser.add_argument('--size', type=parse_size, default=parse_size('10K'), help='minimum program size, e.g. 1K or 10M (default: 10K)')
+    parser.add_argument('--seed', type=int, default=0, help='random seed (default: 0)')
+    parser.add_argument('--depth', type=int, default=3, help='maximum nesting of 🍷🗿/🐳/🔂 blocks (default: 3)')
+    parser.add_argument('--block-size', type=int, default=4, help='maximum statements per block (default: 4)')
+    parser.add_argument('--expression-size', type=int, default=3, help='maximum binary operators per expression (default: 3)')
+    parser.add_argument('--mix', type=parse_mix, default={}, help='statement weights, e.g. declaration=3,while=0 (kinds: ' + ', '.join(statement_kinds) + ')')
+    parser.add_argument('--out', dest='output_file', default='generated.pye', help='output file path (default: generated.pye)')
+    args = parser.parse_args()
+
+    generator = ProgramGenerator(args.seed, args.depth, args.block_size, args.expression_size, args.mix)
+    with open(args.output_file, 'w', encoding='utf-8') as file:
+        file.write(generator.generate(args.size))
@@ -0,0 +1,46 @@
+import os
+import sys
+import time
+import argparse
+import concurrent.futures
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pymoji
+from program_generator import ProgramGenerator, parse_size
+
+# Times the compilation of generated programs through one CompilerSession with growing numbers of
+# threads. On CPython builds with the GIL the compilation itself runs one thread at a time,
+# free-threaded builds can scale. tests/test_sessions.py checks that concurrent compilations give
+# the results of sequential ones
+
+def throughput(sources, threads, repeat):
+    # Best programs per second over repeat runs
+    session = pymoji.CompilerSession()
+    best = float('inf')
+    with concurrent.futures.ThreadPoolExecutor(threads) as executor:
+        for _ in range(repeat):
+            start = time.perf_counter()
+            list(executor.map(session.compile_code, sources))
+            best = min(best, time.perf_counter() - start)
+    return len(sources) / best
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Time concurrent compilations through CompilerSession.')
+    parser.add_argument('--programs', type=int, default=64, help='generated programs (default: 64)')
+    parser.add_argument('--size', default='8K', help='size of each program (default: 8K)')
+    parser.add_argument('--threads', default='1,2,4,8', help='comma separated thread counts of the scaling pass (default: 1,2,4,8)')
+    parser.add_argument('--repeat', type=int, default=3, help='timed runs per thread count, the best one is kept (default: 3)')
+    args = parser.parse_args()
+
+    sources = [ProgramGenerator(seed).generate(parse_size(args.size)) for seed in range(args.programs)]
+    thread_counts = [int(count) for count in args.threads.split(',')]
+    gil = sys._is_gil_enabled() if hasattr(sys, '_is_gil_enabled') else True
+    print(f'Python {sys.version.split()[0]}, GIL {"enabled" if gil else "disabled"}, {os.cpu_count()} CPUs')
+
+    print(f'{"threads":>7} {"programs/s":>11} {"speedup":>8}')
+    base = None
+    for threads in thread_counts:
+        rate = throughput(sources, threads, args.repeat)
+        base = base or rate
+        print(f'{threads:>7} {rate:>11.1f} {rate / base:>7.2f}x')
@@ -1,7 +1,40 @@
 import re
+import io
 import sys
 import os
 import argparse
+import hashlib
+import importlib.util
+import marshal
+import pickle
+import tempfile
+import time
+import types
+import gc
+import json
+import contextlib
+import tracemalloc
+import glob
+import itertools
+import concurrent.futures
+import bisect
+import array
+import threading
+import math
+import operator
+import keyword
+import unicodedata
+import ast as ast_module
+from enum import IntEnum
+from pymoji_ast import (
+    VariableDeclaration, VariableAssignment, Output, Input, Conditional, WhileLoop, ForLoop,
+    Operation, NumberLiteral, StringLiteral, BooleanLiteral, Identifier, VectorLoop, Node,
+)
+import pymoji_runtime
+import pymoji_profiler
+import pymoji_binary
+
+__version__ = '0.2.0'
 
 token_specification = [
     ('PROGRAM_START', r'▶️'),
@@ -20,7 +53,7 @@ token_specification = [
     ('BLOCK_END', r'🔒'),
     ('OPERATION_AND', r'😍😍'),
     ('OPERATION_OR', r'😘🤨'),
-    ('OPERATION', r'♊|♓|🐜|🐘|🐜🐞|🐘🦣'),
+    ('OPERATION', r'♊|♓|🐜🐞|🐘🦣|🐜|🐘'),
     ('EXPRESSION', r'🤰|🔫'),
     ('TERM', r'🙅|🇦🇴'),
     ('WHILE_LOOP', r'🐳'),
@@ -45,7 +78,7 @@ token_type_to_emoji = {
     'BLOCK_START': '🔓',
     'BLOCK_END': '🔒',
     'NUMBER': 'number',
-    'OPERATION': '😍😍|😘🤨|♊|♓|🐜|🐘|🐜🐞|🐘🦣',
+    'OPERATION': '😍😍|😘🤨|♊|♓|🐜🐞|🐘🦣|🐜|🐘',
     'EXPRESSION': '🤰|🔫',
     'TERM': '🙅|🇦🇴',
     'WHILE_LOOP': '🐳',
@@ -54,511 +87,2842 @@ token_type_to_emoji = {
     'NEWLINE': 'newline',
     'SKIP': 'space or tab',
     'MISMATCH': 'mismatch',
+    'EOF': 'end of file',
 }
 
-def debug_print(text):
-    if args.debug:
-        print(text)
+# Token kinds are small integer codes in the order of token_specification
+TokenKind = IntEnum('TokenKind', [name for name, _ in token_specification] + ['EOF'], start=0)
 
-def tokenize(code):
-    tokens = []
-    for mo in re.finditer('|'.join(f'(?P<{pair[0]}>{pair[1]})' for pair in token_specification), code):
-        kind = mo.lastgroup
-        value = mo.group()
-        if kind == 'SKIP':
+token_regex = re.compile('|'.join(f'(?P<{name}>{pattern})' for name, pattern in token_specification))
+group_kinds = [None] * (token_regex.groups + 1)
+for name, index in token_regex.groupindex.items():
+    group_kinds[index] = TokenKind[name]
+
+EOF_TOKEN = (TokenKind.EOF, '', -1)
+BODY_END = {TokenKind.PROGRAM_END, TokenKind.BLOCK_END, TokenKind.EOF}
+
+# Binding power of the binary operators, from 😘🤨 (loosest) to 🙅/🇦🇴 (tightest)
+binary_precedence = {
+    '😘🤨': 1,
+    '😍😍': 2,
+    '♊': 3, '♓': 3,
+    '🐜': 4, '🐘': 4, '🐜🐞': 4, '🐘🦣': 4,
+    '🤰': 5, '🔫': 5,
+    '🙅': 6, '🇦🇴': 6,
+}
+
+def scan_regex(code, offset=0):
+    # Reference scanner: tries every alternative of token_specification in order
+    for mo in token_regex.finditer(code):
+        kind = group_kinds[mo.lastindex]
+        if kind is TokenKind.SKIP:
+            continue
+        elif kind is TokenKind.MISMATCH:
+            raise RuntimeError(f'Unexpected character: >{mo.group()}<')
+        yield (kind, mo.group(), offset + mo.start())
+
+def build_scanner_table():
+    # Maps the first code point of every fixed emoji/operator to its (literal, kind) pairs,
+    # longest literal first so that 🐜🐞 wins over 🐜
+    table = {'\n': [('\n', TokenKind.NEWLINE)]}
+    for name, pattern in token_specification:
+        alternatives = pattern.strip('()').split('|')
+        if any(re.escape(literal) != literal for literal in alternatives):
+            continue
+        for literal in alternatives:
+            table.setdefault(literal[0], []).append((literal, TokenKind[name]))
+    for candidates in table.values():
+        candidates.sort(key=lambda candidate: -len(candidate[0]))
+    return table
+
+scanner_table = build_scanner_table()
+STRING_QUOTE = '🌪️'
+digits_regex = re.compile(r'\d+')
+word_regex = re.compile(r'\w+')
+blank_regex = re.compile(r'[ \t]+')
+
+def scan(code, offset=0):
+    # Tokens are (kind, value, start) tuples, start being the character offset in the source, and
+    # fixed tokens share the text of their literal (tokenize stores them in a TokenList).
+    # Dispatches on the first code point of each token and yields the same tokens as scan_regex
+    pos = 0
+    end = len(code)
+    table = scanner_table
+    while pos < end:
+        char = code[pos]
+        if char == ' ' or char == '\t':
+            pos = blank_regex.match(code, pos).end()
             continue
-        elif kind == 'NEWLINE':
-            tokens.append(('NEWLINE', '\n'))
-        elif kind == 'MISMATCH':
-            raise RuntimeError(f'Unexpected character: >{value}<')
+        candidates = table.get(char)
+        if candidates is not None:
+            for literal, kind in candidates:
+                if code.startswith(literal, pos):
+                    yield (kind, literal, offset + pos)
+                    pos += len(literal)
+                    break
+            else:
+                raise RuntimeError(f'Unexpected character: >{char}<')
+        elif char.isdecimal():
+            stop = digits_regex.match(code, pos).end()
+            yield (TokenKind.NUMBER, code[pos:stop], offset + pos)
+            pos = stop
+        elif char.isalnum() or char == '_':
+            stop = word_regex.match(code, pos).end()
+            yield (TokenKind.IDENTIFIER, code[pos:stop], offset + pos)
+            pos = stop
+        elif code.startswith(STRING_QUOTE, pos):
+            # Strings never span lines
+            stop = code.find(STRING_QUOTE, pos + len(STRING_QUOTE))
+            if stop == -1 or code.find('\n', pos, stop) != -1:
+                raise RuntimeError(f'Unexpected character: >{char}<')
+            stop += len(STRING_QUOTE)
+            yield (TokenKind.STRING, code[pos:stop], offset + pos)
+            pos = stop
         else:
-            tokens.append((kind, value))
-    return tokens
+            raise RuntimeError(f'Unexpected character: >{char}<')
+
+def build_token_codes():
+    # Token codes of TokenList: one per fixed emoji/operator, which gives its kind and its text,
+    # and one per kind whose text is sliced out of the source
+    literals = [(kind, literal) for candidates in scanner_table.values() for literal, kind in candidates]
+    literals += [(TokenKind.NUMBER, None), (TokenKind.IDENTIFIER, None), (TokenKind.STRING, None)]
+    return literals, {literal if literal is not None else kind: code for code, (kind, literal) in enumerate(literals)}
+
+token_literals, token_codes = build_token_codes()
+
+class TokenList:
+    # The tokens of a whole source, one byte of token code and one word of start offset each
+    # instead of a tuple, an int and often a str. Iterating and indexing give the same (kind,
+    # value, start) tuples as scan: fixed tokens share the text of their literal and the value of
+    # number, identifier and string tokens is sliced out of the source again when it is read
+    __slots__ = ('source', 'codes', 'starts')
+
+    def __init__(self, source):
+        self.source = source
+        self.codes = array.array('B')
+        self.starts = array.array('I' if len(source) <= 0xFFFFFFFF else 'Q')
+        codes = self.codes.append
+        starts = self.starts.append
+        literal_code = token_codes.get
+        for kind, value, start in scan(source):
+            code = literal_code(value)
+            codes(code if code is not None else token_codes[kind])
+            starts(start)
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __iter__(self):
+        source = self.source
+        literals = token_literals
+        number, identifier = token_codes[TokenKind.NUMBER], token_codes[TokenKind.IDENTIFIER]
+        digits = digits_regex.match
+        word = word_regex.match
+        for code, start in zip(self.codes, self.starts):
+            kind, literal = literals[code]
+            if literal is not None:
+                yield (kind, literal, start)
+            elif code == identifier:
+                yield (kind, source[start:word(source, start).end()], start)
+            elif code == number:
+                yield (kind, source[start:digits(source, start).end()], start)
+            else:
+                yield (kind, source[start:value_end(source, kind, start)], start)
+
+    def __getitem__(self, index):
+        kind, literal = token_literals[self.codes[index]]
+        start = self.starts[index]
+        if literal is not None:
+            return (kind, literal, start)
+        return (kind, self.source[start:value_end(self.source, kind, start)], start)
+
+    def kinds(self):
+        # The kind of every token, without building the tokens
+        return (token_literals[code][0] for code in self.codes)
+
+def value_end(source, kind, start):
+    # End of the number, identifier or string token at start, found the way scan found it
+    if kind is TokenKind.NUMBER:
+        return digits_regex.match(source, start).end()
+    elif kind is TokenKind.IDENTIFIER:
+        return word_regex.match(source, start).end()
+    return source.index(STRING_QUOTE, start + len(STRING_QUOTE)) + len(STRING_QUOTE)
+
+def tokenize(code):
+    return TokenList(code)
+
+def iter_tokens(stream, chunk_size=1 << 16):
+    # No token spans a newline, so every chunk is scanned up to its last complete line
+    # and the remainder (possibly half an emoji sequence) is carried over to the next one
+    offset = 0
+    pending = ''
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            break
+        pending += chunk
+        cut = pending.rfind('\n') + 1
+        if cut:
+            yield from scan(pending[:cut], offset)
+            offset += cut
+            pending = pending[cut:]
+    if pending:
+        yield from scan(pending, offset)
+
+class LineIndex:
+    # Turns the character offsets of tokens and nodes into 1-based (line, column) positions. The
+    # lines are indexed on the first lookup, so an index made only for error messages costs
+    # nothing when there is no error. source may also be a function returning the text, for
+    # programs that are not kept in memory
+    def __init__(self, source):
+        self.source = source
+        self.starts = None
+
+    def index(self):
+        source = self.source() if callable(self.source) else self.source
+        starts = [0]
+        newline = source.find('\n')
+        while newline != -1:
+            starts.append(newline + 1)
+            newline = source.find('\n', newline + 1)
+        return starts
+
+    def position(self, offset):
+        if self.starts is None:
+            self.starts = self.index()
+        line = bisect.bisect_right(self.starts, offset)
+        return line, offset - self.starts[line - 1] + 1
 
 class Parser:
-    def __init__(self, tokens):
-        self.tokens = tokens
-        self.pos = 0
+    # Every node built for one occurrence in the source gets the offset and end_offset of the text
+    # it was parsed from, character offsets like the ones of the tokens (LineIndex turns them into
+    # lines and columns). For error messages the parser also counts lines on the NEWLINE
+    # tokens between statements, the only place they can appear; line and line_start give the
+    # position of the first token when the tokens come from the middle of a source
+    def __init__(self, tokens, line=1, line_start=0):
+        # Only the current token is buffered, so tokens may come from a lazy stream
+        self.tokens = iter(tokens)
+        self.token = next(self.tokens, EOF_TOKEN)
+        self.last = None
+        self.line = line
+        self.line_start = line_start
+        self.block_openers = {
+            TokenKind.CONDITIONAL_IF: self.parse_conditional_header,
+            TokenKind.WHILE_LOOP: self.parse_while_loop_header,
+            TokenKind.FOR_LOOP: self.parse_for_loop_header,
+        }
 
     def parse(self):
-        self.consume('PROGRAM_START')
-        body = self.parse_body()
-        self.consume('PROGRAM_END')
-        return body
+        return list(self.iter_program())
+
+    def iter_program(self):
+        # Yields the top level statements one by one as soon as they are parsed
+        self.consume(TokenKind.PROGRAM_START)
+        yield from self.iter_body()
+        self.consume(TokenKind.PROGRAM_END)
 
     def parse_body(self):
-        statements = []
-        while self.pos < len(self.tokens) and self.tokens[self.pos][0] not in {'PROGRAM_END', 'BLOCK_END'}:
-            if self.tokens[self.pos][0] == 'NEWLINE':
-                self.pos += 1
+        return self.parse_blocks()
+
+    def iter_body(self):
+        while self.token[0] not in BODY_END:
+            if self.token[0] is TokenKind.NEWLINE:
+                self.skip_newline()
             else:
-                statements.append(self.parse_statement())
-        return statements
+                yield self.parse_statement()
 
     def parse_statement(self):
-        token = self.tokens[self.pos]
-        if token[0] == 'VARIABLE':
+        token = self.token
+        if token[0] is TokenKind.VARIABLE:
             return self.parse_variable_declaration()
-        elif token[0] == 'OUTPUT':
+        elif token[0] is TokenKind.OUTPUT:
             return self.parse_output()
-        elif token[0] == 'INPUT':
+        elif token[0] is TokenKind.INPUT:
             return self.parse_input()
-        elif token[0] == 'CONDITIONAL_IF':
+        elif token[0] is TokenKind.CONDITIONAL_IF:
             return self.parse_conditional()
-        elif token[0] == 'WHILE_LOOP':
+        elif token[0] is TokenKind.WHILE_LOOP:
             return self.parse_while_loop()
-        elif token[0] == 'FOR_LOOP':
+        elif token[0] is TokenKind.FOR_LOOP:
             return self.parse_for_loop()
-        elif token[0] == 'IDENTIFIER':
+        elif token[0] is TokenKind.IDENTIFIER:
             return self.parse_variable_assignment()
         else:
-            raise RuntimeError(f'Unexpected token: {token}')
+            raise RuntimeError(f'Unexpected token: {(token[0].name, token[1])}{self.where(token)}')
 
     def parse_variable_declaration(self):
-        self.consume('VARIABLE')
-        var_type = self.tokens[self.pos - 1][1]
-        identifier = self.consume('IDENTIFIER')
+        start = self.token[2]
+        var_type = self.consume(TokenKind.VARIABLE)
+        identifier = self.variable_name(self.consume(TokenKind.IDENTIFIER))
+        self.consume(TokenKind.ASSIGN)
+        value = self.parse_expression()
+        return self.located(VariableDeclaration(var_type, sys.intern(identifier), value), start)
+
+    def variable_name(self, identifier):
+        # Declared and 🔂 variables start with a letter, which leaves the names starting with _ to
+        # the variables of the generated code (the temporaries of CodeMotion, the _pymoji helpers)
         if not identifier[0].isalpha():
             raise RuntimeError(f'Variable name must start with an alphabetical character, but got: {identifier}')
-        self.consume('ASSIGN')
-        value = self.parse_expression()
-        return ('variable_declaration', var_type, identifier, value)
+        return identifier
     
     def parse_variable_assignment(self):
-        identifier = self.consume('IDENTIFIER')
-        self.consume('ASSIGN')
+        start = self.token[2]
+        identifier = self.consume(TokenKind.IDENTIFIER)
+        self.consume(TokenKind.ASSIGN)
         value = self.parse_expression()
-        return ('variable_assignment', identifier, value)
+        return self.located(VariableAssignment(sys.intern(identifier), value), start)
 
     def parse_output(self):
-        self.consume('OUTPUT')
+        start = self.token[2]
+        self.consume(TokenKind.OUTPUT)
         value = self.parse_expression()
-        return ('output', value)
+        return self.located(Output(value), start)
 
     def parse_input(self):
-        self.consume('INPUT')
+        start = self.token[2]
+        self.consume(TokenKind.INPUT)
         value = self.parse_expression()
-        return ('input', value)
+        return self.located(Input(value), start)
 
     def parse_conditional(self):
-        self.consume('CONDITIONAL_IF')
-        condition = self.parse_expression()
-        self.consume('BLOCK_START')
-        body = self.parse_body()
-        self.consume('BLOCK_END')
-
-        if self.pos < len(self.tokens) and self.tokens[self.pos][0] == 'CONDITIONAL_ELSE':
-            self.consume('CONDITIONAL_ELSE')
-            self.consume('BLOCK_START')
-            else_body = self.parse_body()
-            self.consume('BLOCK_END')
-            return ('conditional', condition, body, else_body)
-
-        return ('conditional', condition, body)
+        return self.parse_blocks(self.parse_conditional_header)
 
     def parse_while_loop(self):
-        self.consume('WHILE_LOOP')
-        condition = self.parse_expression()
-        self.consume('BLOCK_START')
-        body = self.parse_body()
-        self.consume('BLOCK_END')
-        return ('while_loop', condition, body)
+        return self.parse_blocks(self.parse_while_loop_header)
     
     def parse_for_loop(self):
-        self.consume('FOR_LOOP')
-        variable = self.consume('IDENTIFIER')
-        self.consume('LOOP_TO')
-        end = self.consume('NUMBER')
-        self.consume('BLOCK_START')
-        body = self.parse_body()
-        self.consume('BLOCK_END')
-        return ('for_loop', variable, end, body)
-
-    def parse_expression(self):
-        return self.parse_or()
-
-    def parse_or(self):
-        left = self.parse_and()
-        while self.match('OPERATION_OR'):
-            operator = self.consume('OPERATION_OR')
-            right = self.parse_and()
-            left = ('operation', left, operator, right)
-        return left
+        return self.parse_blocks(self.parse_for_loop_header)
 
-    def parse_and(self):
-        left = self.parse_equality()
-        while self.match('OPERATION_AND'):
-            operator = self.consume('OPERATION_AND')
-            right = self.parse_equality()
-            left = ('operation', left, operator, right)
-        return left
+    def parse_conditional_header(self):
+        start = self.token[2]
+        self.consume(TokenKind.CONDITIONAL_IF)
+        condition = self.parse_expression()
+        self.consume(TokenKind.BLOCK_START)
+        return ('conditional', condition, start)
 
-    def parse_equality(self):
-        left = self.parse_comparison()
-        while self.pos < len(self.tokens) and self.tokens[self.pos][0] == 'OPERATION' and self.tokens[self.pos][1] in {'♊', '♓'}:
-            op = self.consume('OPERATION')
-            right = self.parse_comparison()
-            left = ('operation', left, op, right)
-        return left
+    def parse_while_loop_header(self):
+        start = self.token[2]
+        self.consume(TokenKind.WHILE_LOOP)
+        condition = self.parse_expression()
+        self.consume(TokenKind.BLOCK_START)
+        return ('while_loop', condition, start)
 
-    def parse_comparison(self):
-        left = self.parse_term()
-        while self.pos < len(self.tokens) and self.tokens[self.pos][0] == 'OPERATION' and self.tokens[self.pos][1] in {'🐜', '🐘', '🐜🐞', '🐘🦣'}:
-            op = self.consume('OPERATION')
-            right = self.parse_term()
-            left = ('operation', left, op, right)
-        return left
+    def parse_for_loop_header(self):
+        start = self.token[2]
+        self.consume(TokenKind.FOR_LOOP)
+        variable = sys.intern(self.variable_name(self.consume(TokenKind.IDENTIFIER)))
+        self.consume(TokenKind.LOOP_TO)
+        end = int(self.consume(TokenKind.NUMBER))
+        self.consume(TokenKind.BLOCK_START)
+        return ('for_loop', (variable, end), start)
 
-    def parse_term(self):
-        left = self.parse_factor()
-        while self.pos < len(self.tokens) and self.tokens[self.pos][0] == 'EXPRESSION' and self.tokens[self.pos][1] in {'🤰', '🔫'}:
-            op = self.consume('EXPRESSION')
-            right = self.parse_factor()
-            left = ('operation', left, op, right)
-        return left
+    def parse_blocks(self, open_block=None):
+        # Nested 🔓...🔒 blocks are kept on an explicit stack of (kind, header, start, parent
+        # statements) frames instead of the Python call stack, so nesting depth is only limited by
+        # memory. Without open_block a whole body is parsed, otherwise the single block statement
+        # it opens
+        stack = []
+        statements = []
+        if open_block is not None:
+            stack.append(open_block() + (statements,))
+            statements = []
+        while True:
+            kind = self.token[0]
+            if kind is TokenKind.NEWLINE:
+                self.skip_newline()
+            elif kind not in BODY_END:
+                open_nested = self.block_openers.get(kind)
+                if open_nested is None:
+                    statements.append(self.parse_statement())
+                else:
+                    stack.append(open_nested() + (statements,))
+                    statements = []
+            elif not stack:
+                return statements
+            else:
+                self.consume(TokenKind.BLOCK_END)
+                block, header, start, parent = stack.pop()
+                if block == 'conditional' and self.match(TokenKind.CONDITIONAL_ELSE):
+                    self.consume(TokenKind.CONDITIONAL_ELSE)
+                    self.consume(TokenKind.BLOCK_START)
+                    stack.append(('else', (header, statements), start, parent))
+                    statements = []
+                    continue
+
+                if block == 'conditional':
+                    statement = Conditional(header, statements)
+                elif block == 'else':
+                    statement = Conditional(header[0], header[1], statements)
+                elif block == 'while_loop':
+                    statement = WhileLoop(header, statements)
+                else:
+                    statement = ForLoop(header[0], header[1], statements)
+                self.located(statement, start)
+
+                if not stack and open_block is not None:
+                    return statement
+                parent.append(statement)
+                statements = parent
 
-    def parse_factor(self):
+    def parse_expression(self, min_precedence=1):
+        # Pratt parser over binary_precedence. Every operator is left associative, so the
+        # recursion depth is bounded by the number of precedence levels
+        start = self.token[2]
         left = self.parse_primary()
-        while self.pos < len(self.tokens) and self.tokens[self.pos][0] == 'TERM' and self.tokens[self.pos][1] in {'🙅', '🇦🇴'}:
-            op = self.consume('TERM')
-            right = self.parse_primary()
-            left = ('operation', left, op, right)
+        precedence = binary_precedence.get(self.token[1], 0)
+        while precedence >= min_precedence:
+            operator = self.advance()[1]
+            right = self.parse_expression(precedence + 1)
+            left = Operation(left, operator, right)
+            left.offset = start
+            last = self.last
+            left.end_offset = last[2] + len(last[1])
+            precedence = binary_precedence.get(self.token[1], 0)
         return left
 
     def parse_primary(self):
-        token = self.tokens[self.pos]
-        if token[0] == 'STRING':
-            return self.consume('STRING')
-        elif token[0] == 'IDENTIFIER':
-            return self.consume('IDENTIFIER')
-        elif token[0] == 'NUMBER':
-            return self.consume('NUMBER')
-        elif token[0] == 'BOOLEAN':
-            return self.consume('BOOLEAN')
-        elif token[0] == 'INPUT':
-            self.consume('INPUT')
-            if self.tokens[self.pos][0] == 'STRING':
-                prompt = self.consume('STRING')
-                return ('input', prompt)
+        token = self.token
+        if token[0] is TokenKind.STRING:
+            node = StringLiteral(self.consume(TokenKind.STRING)[len(STRING_QUOTE):-len(STRING_QUOTE)])
+        elif token[0] is TokenKind.IDENTIFIER:
+            node = Identifier(self.consume(TokenKind.IDENTIFIER))
+        elif token[0] is TokenKind.NUMBER:
+            node = NumberLiteral(int(self.consume(TokenKind.NUMBER)))
+        elif token[0] is TokenKind.BOOLEAN:
+            node = BooleanLiteral(self.consume(TokenKind.BOOLEAN) == '✅')
+        elif token[0] is TokenKind.INPUT:
+            self.consume(TokenKind.INPUT)
+            if self.match(TokenKind.STRING):
+                prompt = self.parse_primary()
+                node = Input(prompt)
             else:
-                return ('input', None)
+                node = Input(None)
         else:
-            raise RuntimeError(f'Unexpected token in expression: {token}')
+            raise RuntimeError(f'Unexpected token in expression: {(token[0].name, token[1])}{self.where(token)}')
+        node.offset = token[2]
+        last = self.last
+        node.end_offset = last[2] + len(last[1])
+        return node
+
+    def advance(self):
+        token = self.last = self.token
+        self.token = next(self.tokens, EOF_TOKEN)
+        return token
+
+    def skip_newline(self):
+        self.line += 1
+        self.line_start = self.token[2] + 1
+        self.advance()
 
     def consume(self, expected_type):
-        token = self.tokens[self.pos]
-        if token[0] == expected_type:
-            self.pos += 1
+        token = self.token
+        if token[0] is expected_type:
+            self.last = token
+            self.token = next(self.tokens, EOF_TOKEN)
             return token[1]
         else:
-            # TODO: Put error line and column number
-            # raise RuntimeError(f'Expected {expected_type} but got {token[0]}')
-            expected_value = token_type_to_emoji.get(expected_type, expected_type)
-            actual_value = token_type_to_emoji.get(token[0], token[0])
-            raise RuntimeError(f'Expected {expected_value} but got {actual_value}')
+            expected_value = token_type_to_emoji.get(expected_type.name, expected_type.name)
+            actual_value = token_type_to_emoji.get(token[0].name, token[0].name)
+            raise RuntimeError(f'Expected {expected_value} but got {actual_value}{self.where(token)}')
+
+    def located(self, node, start):
+        # The node spans from start to the end of the last consumed token
+        node.offset = start
+        last = self.last
+        node.end_offset = last[2] + len(last[1])
+        return node
+
+    def where(self, token):
+        # Position of a token of the current line for error messages, the end of file speaks
+        # for itself
+        if token[0] is TokenKind.EOF:
+            return ''
+        return f' at line {self.line}, column {token[2] - self.line_start + 1}'
         
     def match(self, expected_type):
-        return self.pos < len(self.tokens) and self.tokens[self.pos][0] == expected_type
+        return self.token[0] is expected_type
+
+variable_types = {
+    '🧵': 'string',
+    '🔢': 'number',
+    '✳️': 'boolean',
+}
+
+arithmetic_names = {
+    '🤰': 'addition',
+    '🔫': 'subtraction',
+    '🙅': 'multiplication',
+    '🇦🇴': 'division',
+}
+
+nesting_error = 'Program is nested too deeply: its blocks or chained operations go deeper than the compiler can follow'
+
+@contextlib.contextmanager
+def nesting_limit():
+    # The parser builds trees of any depth, but the passes after it recurse over them and the
+    # generated Python could not be compiled either, so going past the recursion limit is a
+    # compile error like any other
+    try:
+        yield
+    except RecursionError:
+        raise RuntimeError(nesting_error) from None
 
 class SemanticAnalyzer:
-    def __init__(self, ast):
+    # Given the LineIndex of the source, errors give the line and column of the node they are
+    # about. offset_shift is added to the offsets of the nodes, for statements that moved since
+    # they were parsed (see IncrementalCompiler)
+    def __init__(self, ast, lines=None):
         self.ast = ast
+        self.lines = lines
+        self.offset_shift = 0
         self.symbol_table = {}
+        self.statement_handlers = {
+            VariableDeclaration: self.analyze_variable_declaration,
+            VariableAssignment: self.analyze_variable_assignment,
+            Output: self.analyze_output,
+            Input: self.analyze_input,
+            Conditional: self.analyze_conditional,
+            WhileLoop: self.analyze_while_loop,
+            ForLoop: self.analyze_for_loop,
+        }
+        self.expression_handlers = {
+            Operation: self.analyze_operation,
+            Input: self.analyze_input_expression,
+            NumberLiteral: self.analyze_literal,
+            StringLiteral: self.analyze_literal,
+            BooleanLiteral: self.analyze_literal,
+            Identifier: self.analyze_identifier,
+        }
 
     def analyze(self):
         for statement in self.ast:
             self.analyze_statement(statement)
+
+    def where(self, node):
+        # Nodes built by the optimizer or read from an AST file may have no position
+        offset = getattr(node, 'offset', None)
+        if self.lines is None or offset is None:
+            return ''
+        line, column = self.lines.position(offset + self.offset_shift)
+        return f' at line {line}, column {column}'
     
     def analyze_body(self, body):
         for statement in body:
             self.analyze_statement(statement)
 
     def analyze_statement(self, statement):
-        if statement[0] == 'variable_declaration':
-            self.analyze_variable_declaration(statement)
-        elif statement[0] == 'variable_assignment':
-            self.analyze_variable_assignment(statement)
-        elif statement[0] == 'output':
-            self.analyze_output(statement)
-        elif statement[0] == 'input':
-            self.analyze_input(statement)
-        elif statement[0] == 'conditional':
-            self.analyze_conditional(statement)
-        elif statement[0] == 'while_loop':
-            self.analyze_while_loop(statement)
-        elif statement[0] == 'for_loop':
-            self.analyze_for_loop(statement)
-        else:
-            raise RuntimeError(f'Unknown statement type: {statement[0]}')
+        handler = self.statement_handlers.get(type(statement))
+        if handler is None:
+            raise RuntimeError(f'Unknown statement type: {type(statement).__name__}')
+        handler(statement)
 
     def analyze_variable_declaration(self, statement):
-        _, var_type, identifier, value = statement
+        identifier = statement.identifier
         if identifier in self.symbol_table:
-            raise RuntimeError(f'Variable {identifier} already declared')
+            raise RuntimeError(f'Variable {identifier} already declared{self.where(statement)}')
         
-        value_type = self.analyze_expression(value)
-        if var_type == '🧵' and value_type != 'string':
-            raise RuntimeError(f'Type error: Expected string for variable {identifier}, but got {value_type}')
-        elif var_type == '🔢' and value_type != 'number':
-            raise RuntimeError(f'Type error: Expected number for variable {identifier}, but got {value_type}')
-        elif var_type == '✳️' and value_type != 'boolean':
-            raise RuntimeError(f'Type error: Expected boolean for variable {identifier}, but got {value_type}')
+        value_type = self.analyze_expression(statement.value)
+        expected_type = variable_types[statement.var_type]
+        if value_type != expected_type:
+            raise RuntimeError(f'Type error: Expected {expected_type} for variable {identifier}, but got {value_type}{self.where(statement.value)}')
 
         self.symbol_table[identifier] = value_type
 
     def analyze_variable_assignment(self, statement):
-        _, identifier, value = statement
+        identifier = statement.identifier
         if identifier not in self.symbol_table:
-            raise RuntimeError(f'Undefined variable: {identifier}')
+            raise RuntimeError(f'Undefined variable: {identifier}{self.where(statement)}')
         
-        value_type = self.analyze_expression(value)
+        value_type = self.analyze_expression(statement.value)
         if self.symbol_table[identifier] != value_type:
-            raise RuntimeError(f'Type error: Expected {self.symbol_table[identifier]} for variable {identifier}, but got {value_type}')
+            raise RuntimeError(f'Type error: Expected {self.symbol_table[identifier]} for variable {identifier}, but got {value_type}{self.where(statement.value)}')
 
     def analyze_input(self, statement):
-        _, value = statement
-        self.analyze_expression(value)
+        self.analyze_expression(statement.prompt)
     
     def analyze_output(self, statement):
-        _, value = statement
-        self.analyze_expression(value)
+        self.analyze_expression(statement.value)
 
     def analyze_conditional(self, statement):
-        if len(statement) == 4:
-            _, condition, if_body, else_body = statement
-        else:
-            _, condition, if_body = statement
-            else_body = None
-        condition_type = self.analyze_expression(condition)
+        condition_type = self.analyze_expression(statement.condition)
         if condition_type != 'boolean':
-            raise RuntimeError(f'Type error: Expected boolean expression in if condition, but got {condition_type}')
+            raise RuntimeError(f'Type error: Expected boolean expression in if condition, but got {condition_type}{self.where(statement.condition)}')
 
-        self.analyze_body(if_body)
+        self.analyze_body(statement.body)
 
-        if else_body:
-            self.analyze_body(else_body)
+        if statement.else_body:
+            self.analyze_body(statement.else_body)
 
     def analyze_while_loop(self, statement):
-        _, condition, body = statement
-        condition_type = self.analyze_expression(condition)
+        condition_type = self.analyze_expression(statement.condition)
         if condition_type != 'boolean':
-            raise RuntimeError(f'Type error: Expected boolean expression in while condition, but got {condition_type}')
+            raise RuntimeError(f'Type error: Expected boolean expression in while condition, but got {condition_type}{self.where(statement.condition)}')
 
-        self.analyze_body(body)
+        self.analyze_body(statement.body)
     
     def analyze_for_loop(self, statement):
-        _, variable, end, body = statement
+        variable = statement.variable
         if variable in self.symbol_table:
-            raise RuntimeError(f'Variable {variable} already declared')
+            raise RuntimeError(f'Variable {variable} already declared{self.where(statement)}')
         self.symbol_table[variable] = 'number'
-        self.analyze_body(body)
+        self.analyze_body(statement.body)
 
     def analyze_expression(self, expression):
-        if type(expression) is tuple:
-            if expression[0] == 'operation':
-                _, left, op, right = expression
-                left_type = self.analyze_expression(left)
-                right_type = self.analyze_expression(right)
-                # AND / OR
-                if op in {'😍😍', '😘🤨'}:
-                    if left_type == 'boolean' and right_type == 'boolean':
-                        return 'boolean'
-                    else:
-                        raise RuntimeError(f'Type error: Expected boolean operands for {op}, but got {left_type} and {right_type}')
-                # == / !+ / < / > / <= / >=
-                elif op in {'♊', '♓', '🐜', '🐘', '🐜🐞', '🐘🦣'}:
-                    if left_type == right_type:
-                        return 'boolean'
-                    else:
-                        raise RuntimeError(f'Type error: Expected matching types for {op}, but got {left_type} and {right_type}')
-                # +
-                elif op == '🤰':
-                    # TODO: Concatenate strings?
-                    if left_type == right_type == 'number':
-                        return 'number'
-                    else:
-                        raise RuntimeError(f'Type error: Expected number operands for addition, but got {left_type} and {right_type}')
-                # -
-                elif op == '🔫':
-                    if left_type == right_type == 'number':
-                        return 'number'
-                    else:
-                        raise RuntimeError(f'Type error: Expected number operands for subtraction, but got {left_type} and {right_type}')
-                # *
-                elif op == '🙅':
-                    if left_type == right_type == 'number':
-                        return 'number'
-                    else:
-                        raise RuntimeError(f'Type error: Expected number operands for multiplication, but got {left_type} and {right_type}')
-                # /
-                elif op == '🇦🇴':
-                    if left_type == right_type == 'number':
-                        return 'number'
-                    else:
-                        raise RuntimeError(f'Type error: Expected number operands for division, but got {left_type} and {right_type}')
-            elif expression[0] == 'input':
-                return 'string'
-        elif type(expression) is str:
-            if expression.isdigit():
-                return 'number'
-            elif expression == '✅' or expression == '❎':
+        handler = self.expression_handlers.get(type(expression))
+        if handler is None:
+            raise RuntimeError(f'Unexpected expression type: {expression}')
+        return handler(expression)
+
+    def analyze_operation(self, expression):
+        op = expression.operator
+        left_type = self.analyze_expression(expression.left)
+        right_type = self.analyze_expression(expression.right)
+        # AND / OR
+        if op in {'😍😍', '😘🤨'}:
+            if left_type == 'boolean' and right_type == 'boolean':
                 return 'boolean'
-            elif expression.startswith('🌪️') and expression.endswith('🌪️'):
-                return 'string'
-            elif expression in self.symbol_table:
-                return self.symbol_table[expression]
             else:
-                raise RuntimeError(f'Undefined variable: {expression}')
+                raise RuntimeError(f'Type error: Expected boolean operands for {op}, but got {left_type} and {right_type}{self.where(expression)}')
+        # == / != / < / > / <= / >=
+        elif op in {'♊', '♓', '🐜', '🐘', '🐜🐞', '🐘🦣'}:
+            if left_type == right_type:
+                return 'boolean'
+            else:
+                raise RuntimeError(f'Type error: Expected matching types for {op}, but got {left_type} and {right_type}{self.where(expression)}')
+        # + / - / * / /
+        else:
+            # TODO: Concatenate strings?
+            if left_type == right_type == 'number':
+                return 'number'
+            else:
+                raise RuntimeError(f'Type error: Expected number operands for {arithmetic_names[op]}, but got {left_type} and {right_type}{self.where(expression)}')
+
+    def analyze_input_expression(self, expression):
+        return 'string'
+
+    def analyze_literal(self, expression):
+        return expression.kind
+
+    def analyze_identifier(self, expression):
+        if expression.name in self.symbol_table:
+            return self.symbol_table[expression.name]
         else:
+            raise RuntimeError(f'Undefined variable: {expression.name}{self.where(expression)}')
+
+operator_functions = {
+    '♊': operator.eq,
+    '♓': operator.ne,
+    '🐜': operator.lt,
+    '🐘': operator.gt,
+    '🐜🐞': operator.le,
+    '🐘🦣': operator.ge,
+    '🤰': operator.add,
+    '🔫': operator.sub,
+    '🙅': operator.mul,
+    '🇦🇴': operator.truediv,
+}
+
+def literal_value(expression):
+    # The Python value of a literal node, or None when it is not a literal that can be folded.
+    # Strings are evaluated the way the generated quotes would be, escapes included
+    if type(expression) is NumberLiteral or type(expression) is BooleanLiteral:
+        return expression.value
+    elif type(expression) is StringLiteral:
+        if '\\' not in expression.value and '\'' not in expression.value:
+            # Nothing to unescape
+            return expression.value
+        try:
+            return ast_module.literal_eval(f'\'{expression.value}\'')
+        except (SyntaxError, ValueError):
+            return None
+    return None
+
+def is_pure(expression):
+    # Whether evaluating the expression can be skipped: it reads no 📥 input and has no 🇦🇴 that
+    # could raise ZeroDivisionError
+    if type(expression) is Input:
+        return False
+    elif type(expression) is Operation:
+        return expression.operator != '🇦🇴' and is_pure(expression.left) and is_pure(expression.right)
+    return True
+
+def assigned_names(body):
+    names = set()
+    stack = list(body)
+    while stack:
+        statement = stack.pop()
+        if type(statement) is VariableAssignment:
+            names.add(statement.identifier)
+        elif type(statement) is ForLoop:
+            names.add(statement.variable)
+            stack.extend(statement.body)
+        elif type(statement) is WhileLoop:
+            stack.extend(statement.body)
+        elif type(statement) is Conditional:
+            stack.extend(statement.body)
+            stack.extend(statement.else_body or [])
+    return names
+
+class Optimizer:
+    # Runs between SemanticAnalyzer and Transpiler. Level 1 folds constant arithmetic, comparisons
+    # and 😍😍/😘🤨, drops 🍷🗿/☝️🤓 branches that can never run and 🐳/🔂 loops that are never
+    # entered. Level 2 also propagates 🔢 variables declared at the top level with a constant and
+    # never reassigned. Every rewrite keeps the type the analyzer gave to the expression.
+    # Statement nodes are updated in place
+    def __init__(self, ast, level=1):
+        self.ast = ast
+        self.level = level
+        self.depth = 0
+        self.constants = {}
+        self.assigned = set()
+        # Variables declared at the top level so far, which are bound whenever the statement
+        # being optimized runs
+        self.bound = set()
+        self.statement_handlers = {
+            VariableDeclaration: self.optimize_variable_declaration,
+            VariableAssignment: self.optimize_variable_assignment,
+            Output: self.optimize_output,
+            Input: self.optimize_input,
+            Conditional: self.optimize_conditional,
+            WhileLoop: self.optimize_while_loop,
+            ForLoop: self.optimize_for_loop,
+        }
+        self.expression_handlers = {
+            Operation: self.fold_operation,
+            Input: self.fold_input,
+            NumberLiteral: self.fold_literal,
+            StringLiteral: self.fold_literal,
+            BooleanLiteral: self.fold_literal,
+            Identifier: self.fold_identifier,
+        }
+
+    def optimize(self):
+        if self.level >= 2:
+            self.assigned = assigned_names(self.ast)
+        return self.optimize_body(self.ast)
+
+    def optimize_body(self, body):
+        result = []
+        for statement in body:
+            result.extend(self.optimize_statement(statement))
+        return result
+
+    def optimize_nested_body(self, body):
+        self.depth += 1
+        result = self.optimize_body(body)
+        self.depth -= 1
+        return result
+
+    def optimize_statement(self, statement):
+        # Returns the statements that replace this one
+        handler = self.statement_handlers.get(type(statement))
+        if handler is None:
+            raise RuntimeError(f'Unknown statement type: {type(statement).__name__}')
+        return handler(statement)
+
+    def optimize_variable_declaration(self, statement):
+        statement.value = self.fold(statement.value)
+        if self.depth == 0:
+            self.bound.add(statement.identifier)
+        if (self.level >= 2 and self.depth == 0 and statement.var_type == '🔢'
+                and statement.identifier not in self.assigned and type(statement.value) is NumberLiteral):
+            self.constants[statement.identifier] = statement.value
+        return [statement]
+
+    def optimize_variable_assignment(self, statement):
+        statement.value = self.fold(statement.value)
+        return [statement]
+
+    def optimize_output(self, statement):
+        statement.value = self.fold(statement.value)
+        return [statement]
+
+    def optimize_input(self, statement):
+        statement.prompt = self.fold(statement.prompt)
+        return [statement]
+
+    def optimize_conditional(self, statement):
+        statement.condition = self.fold(statement.condition)
+        if type(statement.condition) is BooleanLiteral:
+            # The branch that is always taken runs exactly like the statements around it
+            return self.optimize_body(statement.body if statement.condition.value else statement.else_body or [])
+        statement.body = self.optimize_nested_body(statement.body)
+        if statement.else_body:
+            statement.else_body = self.optimize_nested_body(statement.else_body) or None
+        return [statement]
+
+    def optimize_while_loop(self, statement):
+        statement.condition = self.fold(statement.condition)
+        if type(statement.condition) is BooleanLiteral and not statement.condition.value:
+            return []
+        statement.body = self.optimize_nested_body(statement.body)
+        return [statement]
+
+    def optimize_for_loop(self, statement):
+        if statement.end <= 0:
+            return []
+        statement.body = self.optimize_nested_body(statement.body)
+        return [statement]
+
+    def fold(self, expression):
+        handler = self.expression_handlers.get(type(expression))
+        if handler is None:
             raise RuntimeError(f'Unexpected expression type: {expression}')
+        return handler(expression)
+
+    def fold_operation(self, expression):
+        left = self.fold(expression.left)
+        right = self.fold(expression.right)
+        op = expression.operator
+
+        if op in {'😍😍', '😘🤨'}:
+            # ✅ is the identity of 😍😍 and ❎ the identity of 😘🤨, the other one decides the result.
+            # A decided left operand short-circuits the right one, a decided right operand can only
+            # replace a left operand that can be skipped
+            identity = op == '😍😍'
+            if type(left) is BooleanLiteral:
+                return right if left.value == identity else left
+            if type(right) is BooleanLiteral:
+                if right.value == identity:
+                    return left
+                if self.skippable(left):
+                    return right
+        else:
+            left_value = literal_value(left)
+            right_value = literal_value(right)
+            if left_value is not None and right_value is not None:
+                try:
+                    value = operator_functions[op](left_value, right_value)
+                except (ZeroDivisionError, OverflowError):
+                    value = None
+                if type(value) is bool:
+                    return BooleanLiteral(value)
+                elif type(value) is int or (type(value) is float and math.isfinite(value)):
+                    return NumberLiteral(value)
+
+        if left is expression.left and right is expression.right:
+            return expression
+        return Operation(left, op, right)
+
+    def skippable(self, expression):
+        # Whether dropping the expression changes nothing: it is pure (see is_pure) and only reads
+        # variables that are surely bound, so that it cannot raise NameError either
+        if type(expression) is Identifier:
+            return expression.name in self.bound
+        elif type(expression) is Operation:
+            return expression.operator != '🇦🇴' and self.skippable(expression.left) and self.skippable(expression.right)
+        return type(expression) is not Input
+
+    def fold_input(self, expression):
+        if expression.prompt is None:
+            return expression
+        prompt = self.fold(expression.prompt)
+        return expression if prompt is expression.prompt else Input(prompt)
+
+    def fold_literal(self, expression):
+        return expression
+
+    def fold_identifier(self, expression):
+        return self.constants.get(expression.name, expression)
+
+boolean_operators = frozenset(('♊', '♓', '🐜', '🐘', '🐜🐞', '🐘🦣', '😍😍', '😘🤨'))
+
+def expression_key(expression):
+    # A hashable value equal for structurally equal expressions. Literals keep their Python type
+    # so that 1, 1.0 and ✅ stay apart
+    kind = type(expression)
+    if kind is Operation:
+        return (expression.operator, expression_key(expression.left), expression_key(expression.right))
+    elif kind is Identifier:
+        return ('name', expression.name)
+    elif kind is Input:
+        return ('input', id(expression))
+    return (kind.__name__, type(expression.value), expression.value)
+
+def declared_names(body):
+    # assigned_names plus the variables declared in the body, at any depth
+    names = assigned_names(body)
+    stack = list(body)
+    while stack:
+        statement = stack.pop()
+        if type(statement) is VariableDeclaration:
+            names.add(statement.identifier)
+        elif type(statement) is WhileLoop or type(statement) is ForLoop:
+            stack.extend(statement.body)
+        elif type(statement) is Conditional:
+            stack.extend(statement.body)
+            stack.extend(statement.else_body or [])
+    return names
+
+class CodeMotion:
+    # Optimization level 3, run after Optimizer. Pure operations (see is_pure) of a 🐳/🔂 loop, its
+    # 🐳 condition included, whose variables are not assigned anywhere in the loop are computed
+    # once into a temporary declared before the loop, outer loops first. Operations that repeat
+    # within one statement are computed once into a temporary declared before the statement. Only
+    # variables declared before the loop or statement in the bodies enclosing it are read by the
+    # temporaries, since one declared in a branch that did not run would raise NameError. 📥 and
+    # 🇦🇴 are never moved. The temporaries are named _t0, _t1..., names Parser.variable_name
+    # rejects for emojicode variables, and get their type in the symbol table of the SemanticAnalyzer
+    def __init__(self, symbol_table):
+        self.symbol_table = symbol_table
+        self.count = 0
+
+    def move(self, body):
+        return self.move_body(body, set())
+
+    def move_body(self, body, defined):
+        # defined holds the variables that certainly exist before the body runs
+        defined = set(defined)
+        result = []
+        for statement in body:
+            result.extend(self.move_statement(statement, defined))
+            if type(statement) is VariableDeclaration:
+                defined.add(statement.identifier)
+            elif type(statement) is ForLoop:
+                # The optimizer already dropped the loops that are never entered
+                defined.add(statement.variable)
+        return result
+
+    def move_statement(self, statement, defined):
+        # Returns the declarations of the temporaries followed by the statement
+        kind = type(statement)
+        temporaries = []
+        if kind is WhileLoop or kind is ForLoop:
+            variant = declared_names(statement.body)
+            if kind is ForLoop:
+                variant.add(statement.variable)
+            hoisted = {}
+            if kind is WhileLoop:
+                statement.condition = self.hoist(statement.condition, variant, defined, hoisted, temporaries, statement)
+            self.hoist_body(statement.body, variant, defined, hoisted, temporaries, statement)
+            inner = defined | set(hoisted.values())
+            if kind is ForLoop:
+                inner.add(statement.variable)
+            statement.body = self.move_body(statement.body, inner)
+        elif kind is Conditional:
+            statement.condition = self.share(statement.condition, defined, temporaries, statement)
+            statement.body = self.move_body(statement.body, defined)
+            if statement.else_body:
+                statement.else_body = self.move_body(statement.else_body, defined)
+        elif kind is Input:
+            pass
+        else:
+            statement.value = self.share(statement.value, defined, temporaries, statement)
+        return temporaries + [statement]
+
+    def hoist_body(self, body, variant, defined, hoisted, temporaries, loop):
+        # Hoists the invariant operations of every statement of the body, nested ones included
+        stack = list(body)
+        while stack:
+            statement = stack.pop()
+            kind = type(statement)
+            if kind is WhileLoop or kind is Conditional:
+                statement.condition = self.hoist(statement.condition, variant, defined, hoisted, temporaries, loop)
+                stack.extend(statement.body)
+                if kind is Conditional:
+                    stack.extend(statement.else_body or [])
+            elif kind is ForLoop:
+                stack.extend(statement.body)
+            elif kind is not Input:
+                statement.value = self.hoist(statement.value, variant, defined, hoisted, temporaries, loop)
+
+    def hoist(self, expression, variant, defined, hoisted, temporaries, loop):
+        expression, invariant = self.invariant(expression, variant, defined, hoisted, temporaries, loop)
+        if invariant and type(expression) is Operation:
+            return self.temporary(expression, hoisted, temporaries, loop)
+        return expression
+
+    def invariant(self, expression, variant, defined, hoisted, temporaries, loop):
+        # Returns the expression with its largest invariant operations replaced by temporaries,
+        # unless the whole expression is invariant, and whether it is
+        kind = type(expression)
+        if kind is Identifier:
+            return expression, expression.name in defined and expression.name not in variant
+        elif kind is Input:
+            return expression, False
+        elif kind is not Operation:
+            return expression, True
+
+        left, left_invariant = self.invariant(expression.left, variant, defined, hoisted, temporaries, loop)
+        right, right_invariant = self.invariant(expression.right, variant, defined, hoisted, temporaries, loop)
+        if left_invariant and right_invariant and expression.operator != '🇦🇴':
+            return expression, True
+        if left_invariant and type(left) is Operation:
+            left = self.temporary(left, hoisted, temporaries, loop)
+        if right_invariant and type(right) is Operation:
+            right = self.temporary(right, hoisted, temporaries, loop)
+        if left is expression.left and right is expression.right:
+            return expression, False
+        return Operation(left, expression.operator, right), False
+
+    def share(self, expression, defined, temporaries, statement):
+        # Computes the operations that occur more than once in the expression only once
+        counts = {}
+        self.count_operations(expression, counts)
+        if not any(count > 1 for count in counts.values()):
+            return expression
+        return self.replace_shared(expression, counts, defined, {}, temporaries, statement)
+
+    def count_operations(self, expression, counts):
+        # Counts the pure operations by key and returns the key of the expression, or None when it
+        # is not pure
+        kind = type(expression)
+        if kind is Operation:
+            left = self.count_operations(expression.left, counts)
+            right = self.count_operations(expression.right, counts)
+            if left is None or right is None or expression.operator == '🇦🇴':
+                return None
+            key = (expression.operator, left, right)
+            counts[key] = counts.get(key, 0) + 1
+            return key
+        elif kind is Input:
+            return None
+        return expression_key(expression)
+
+    def replace_shared(self, expression, counts, defined, shared, temporaries, statement):
+        if type(expression) is not Operation:
+            return expression
+        if is_pure(expression):
+            key = expression_key(expression)
+            if counts.get(key, 0) > 1 and self.reads_defined(expression, defined):
+                name = shared.get(key)
+                if name is None:
+                    name = self.declare(expression, temporaries, statement)
+                    shared[key] = name
+                return Identifier(name)
+        left = self.replace_shared(expression.left, counts, defined, shared, temporaries, statement)
+        right = self.replace_shared(expression.right, counts, defined, shared, temporaries, statement)
+        if left is expression.left and right is expression.right:
+            return expression
+        return Operation(left, expression.operator, right)
+
+    def reads_defined(self, expression, defined):
+        stack = [expression]
+        while stack:
+            node = stack.pop()
+            if type(node) is Operation:
+                stack.append(node.left)
+                stack.append(node.right)
+            elif type(node) is Identifier and node.name not in defined:
+                return False
+        return True
+
+    def temporary(self, expression, hoisted, temporaries, loop):
+        key = expression_key(expression)
+        name = hoisted.get(key)
+        if name is None:
+            name = self.declare(expression, temporaries, loop)
+            hoisted[key] = name
+        return Identifier(name)
+
+    def declare(self, expression, temporaries, statement):
+        # Declares a new temporary holding the expression before the statement, at its position
+        name = f'_t{self.count}'
+        self.count += 1
+        boolean = expression.operator in boolean_operators
+        self.symbol_table[name] = 'boolean' if boolean else 'number'
+        declaration = VariableDeclaration('✳️' if boolean else '🔢', name, expression)
+        if hasattr(statement, 'offset'):
+            declaration.offset = statement.offset
+            declaration.end_offset = statement.end_offset
+        temporaries.append(declaration)
+        return name
+
+vector_operators = {'🤰': '+', '🔫': '-', '🙅': '*', '🇦🇴': '/'}
+
+class Vectorizer:
+    # Runs after SemanticAnalyzer and Optimizer for the --numpy backend. A 🔂 loop of at least
+    # minimum_iterations whose body only assigns 🔢 variables, each one once, becomes a
+    # VectorLoop when every assignment is either a reduction (acc = acc 🤰/🔫 ..., acc = acc 🙅 ...
+    # or the same with acc on the right of 🤰/🙅) or a value computed from the loop variable and
+    # variables the body does not assign. Loops with 📤, 📥, branches, nested loops or any other
+    # statement stay scalar. The plans are run by pymoji_numpy, see there for the format
+    minimum_iterations = 1000
+
+    def __init__(self, symbol_table):
+        self.symbol_table = symbol_table
+
+    def vectorize(self, body):
+        # Replaces the loops in place, at any depth, and returns the body
+        stack = [body]
+        while stack:
+            statements = stack.pop()
+            for index, statement in enumerate(statements):
+                if type(statement) is ForLoop:
+                    vector_loop = self.vector_loop(statement)
+                    if vector_loop is not None:
+                        statements[index] = vector_loop
+                    else:
+                        stack.append(statement.body)
+                elif type(statement) is WhileLoop:
+                    stack.append(statement.body)
+                elif type(statement) is Conditional:
+                    stack.append(statement.body)
+                    if statement.else_body:
+                        stack.append(statement.else_body)
+        return body
+
+    def vector_loop(self, loop):
+        if loop.end < self.minimum_iterations or not loop.body:
+            return None
+        targets = []
+        for statement in loop.body:
+            if type(statement) is VariableDeclaration:
+                if statement.var_type != '🔢':
+                    return None
+            elif type(statement) is not VariableAssignment or self.symbol_table.get(statement.identifier) != 'number':
+                return None
+            if statement.identifier in targets or statement.identifier == loop.variable:
+                return None
+            targets.append(statement.identifier)
+
+        self.loop_variable = loop.variable
+        self.targets = set(targets)
+        self.inputs = []
+        plan = []
+        for statement in loop.body:
+            reduction = self.reduction(statement.identifier, statement.value)
+            if reduction is not None:
+                operator, terms = reduction
+                trees = []
+                for sign, term in terms:
+                    tree = self.tree(term)
+                    if tree is None:
+                        return None
+                    trees.append((sign, tree))
+                plan.append(('reduce', operator, self.input(statement.identifier), tuple(trees)))
+            else:
+                tree = self.tree(statement.value)
+                if tree is None:
+                    return None
+                plan.append(('last', tree))
+
+        vector_loop = VectorLoop(loop, tuple(plan), tuple(self.inputs), tuple(targets))
+        vector_loop.offset = loop.offset
+        vector_loop.end_offset = loop.end_offset
+        return vector_loop
+
+    def reduction(self, target, value):
+        # Returns ('+', [(sign, term), ...]) or ('*', [(1, term), ...]) when value updates target
+        # with a chain of 🤰/🔫 or 🙅 starting from target itself, otherwise None
+        if type(value) is not Operation:
+            return None
+        for symbol, signs in (('+', {'🤰': 1, '🔫': -1}), ('*', {'🙅': 1})):
+            if value.operator not in signs:
+                continue
+            terms = []
+            node = value
+            while type(node) is Operation and node.operator in signs:
+                terms.append((signs[node.operator], node.right))
+                node = node.left
+            if type(node) is Identifier and node.name == target:
+                terms.reverse()
+                return symbol, terms
+            # acc on the right of a commutative operator
+            if value.operator != '🔫' and type(value.right) is Identifier and value.right.name == target:
+                return symbol, [(1, value.left)]
+        return None
+
+    def tree(self, expression):
+        # The plan tree of an arithmetic expression over the loop variable and variables the body
+        # does not assign, or None
+        if type(expression) is NumberLiteral:
+            return ('n', expression.value)
+        elif type(expression) is Identifier:
+            if expression.name == self.loop_variable:
+                return ('i',)
+            if expression.name in self.targets or self.symbol_table.get(expression.name) != 'number':
+                return None
+            return ('v', self.input(expression.name))
+        elif type(expression) is Operation and expression.operator in vector_operators:
+            left = self.tree(expression.left)
+            right = self.tree(expression.right)
+            if left is None or right is None:
+                return None
+            return (vector_operators[expression.operator], left, right)
+        return None
+
+    def input(self, name):
+        if name not in self.inputs:
+            self.inputs.append(name)
+        return self.inputs.index(name)
+
+operator_map = {
+    '😍😍': 'and',
+    '😘🤨': 'or',
+    '♊': '==',
+    '♓': '!=',
+    '🐜': '<',
+    '🐘': '>',
+    '🐜🐞': '<=',
+    '🐘🦣': '>=',
+    '🤰': '+',
+    '🔫': '-',
+    '🙅': '*',
+    '🇦🇴': '/',
+}
+
+comparison_operators = frozenset(('♊', '♓', '🐜', '🐘', '🐜🐞', '🐘🦣'))
+
+def is_chained(operator, operand):
+    # Python chains comparisons (a < b == c means a < b and b == c), so a comparison that is the
+    # operand of another comparison is generated in parentheses to keep the grouping of the parser
+    return operator in comparison_operators and type(operand) is Operation and operand.operator in comparison_operators
+
+class Emitter:
+    # Writes each generated line once, at the current indentation level, straight to the output.
+    # With a mappings list the origin of every line is appended to it
+    indentation = '    '
+    # CPython does not compile source indented 100 levels or more
+    max_level = 99
+
+    def __init__(self, output, mappings=None):
+        self.write = output.write
+        self.level = 0
+        self.separator = ''
+        self.mappings = mappings
+        self.origin = None
+
+    def line(self, text):
+        self.write(f'{self.separator}{self.indentation * self.level}{text}')
+        self.separator = '\n'
+        if self.mappings is not None:
+            self.mappings.append(self.origin)
+
+    def indent(self):
+        if self.level == self.max_level:
+            raise RuntimeError(nesting_error)
+        self.level += 1
+
+    def dedent(self):
+        self.level -= 1
+
+# Builtins bound to default arguments of the generated main(), so the program reads them from
+# fast locals instead of looking them up in the globals and builtins on every call
+hoisted_builtins = ('print', 'input')
+
+# Emoji of the statements in source maps and profiles, declarations use their type emoji
+statement_emojis = {
+    VariableAssignment: '=',
+    Output: '📤',
+    Input: '📥',
+    Conditional: '🍷🗿',
+    WhileLoop: '🐳',
+    ForLoop: '🔂',
+    VectorLoop: '🔂',
+}
 
 class Transpiler:
-    def __init__(self, ast):
+    # With function=True the program is wrapped in a generated main(), where every variable is a
+    # fast local instead of a module global. Given the LineIndex of the source, the transpiler
+    # also builds the source map: mappings gets one entry per generated line, None for the lines
+    # of the main() wrapper, otherwise the (line, column, statement emoji, parent) of the
+    # statement it was generated from, parent being the generated line of the enclosing block
+    # statement (0 at the top level)
+    #
+    # With a budget the program raises pymoji_runtime.BudgetExceeded once it would run more than
+    # that many loop iterations, 🐳 and 🔂 together. They are counted by _pymoji_ticks, an
+    # itertools.repeat of () holding one item per iteration left. A 🐳 loop checks its condition
+    # once and then becomes a for loop over _pymoji_ticks, checking the condition again at the
+    # end of every iteration. Taking the next () and unpacking it into no targets costs about as
+    # much as the jump back of the while loop it replaces, with no counter to update. When the
+    # repeat runs out the condition was true, so the loop was about to run once more. A 🔂 loop
+    # takes all its iterations from _pymoji_ticks before it starts, together with the ones of the
+    # 🔂 loops directly in its body, which then take nothing. islice skips them in C, at about
+    # 2 ns each, and when fewer are left the loop does not start
+    function_header = f'def main({", ".join(f"{name}={name}" for name in hoisted_builtins)}):'
+
+    def __init__(self, ast, function=False, lines=None, budget=None):
         self.ast = ast
+        self.function = function
+        self.lines = lines
+        self.budget = budget
+        self.charged = set()
+        self.mappings = None
+        self.parent = 0
+        self.emitter = None
+        self.statement_handlers = {
+            VariableDeclaration: self.transpile_variable_declaration,
+            VariableAssignment: self.transpile_variable_assignment,
+            Output: self.transpile_output,
+            Input: self.transpile_input_statement,
+            Conditional: self.transpile_conditional,
+            WhileLoop: self.transpile_while_loop,
+            ForLoop: self.transpile_for_loop,
+            VectorLoop: self.transpile_vector_loop,
+        }
+        self.expression_handlers = {
+            Operation: self.transpile_operation,
+            Input: self.transpile_input,
+            NumberLiteral: self.transpile_number,
+            StringLiteral: self.transpile_string,
+            BooleanLiteral: self.transpile_boolean,
+            Identifier: self.transpile_identifier,
+        }
 
     def transpile(self):
-        return self.transpile_body(self.ast)
+        buffer = io.StringIO()
+        self.transpile_to(buffer)
+        return buffer.getvalue()
+
+    def transpile_to(self, output):
+        if self.lines is not None:
+            self.mappings = []
+            self.parent = 0
+        self.emitter = Emitter(output, self.mappings)
+        with nesting_limit():
+            if self.function:
+                self.emitter.line(self.function_header)
+                self.emitter.indent()
+                self.transpile_budget()
+                self.emitter.dedent()
+                self.transpile_body(self.ast)
+                self.emitter.line('main()')
+            else:
+                self.transpile_budget()
+                for statement in self.ast:
+                    self.transpile_statement(statement)
+
+    def transpile_budget(self):
+        if self.budget is None:
+            return
+        self.emitter.line('try:')
+        self.emitter.indent()
+        self.emitter.line('from pymoji_runtime import BudgetExceeded as _pymoji_BudgetExceeded')
+        self.emitter.dedent()
+        self.emitter.line('except ImportError:')
+        self.emitter.indent()
+        self.emitter.line('_pymoji_BudgetExceeded = RuntimeError')
+        self.emitter.dedent()
+        self.emitter.line('from itertools import repeat as _pymoji_repeat, islice as _pymoji_islice')
+        self.emitter.line('_pymoji_next = next')
+        self.emitter.line(f'_pymoji_ticks = _pymoji_repeat((), {self.budget})')
+
+    def budget_error(self, statement, emoji):
+        message = f'execution budget of {self.budget} loop iterations exceeded by the {emoji} loop'
+        if self.lines is not None:
+            line, column = self.lines.position(statement.offset)
+            message += f' at line {line}, column {column}'
+        return f'raise _pymoji_BudgetExceeded({message!r})'
     
     def transpile_body(self, body):
-        result = []
+        self.emitter.indent()
+        if not body:
+            self.emitter.line('pass')
         for statement in body:
-            result.append(self.transpile_statement(statement))
-
-        return '\n'.join(result)
+            self.transpile_statement(statement)
+        self.emitter.dedent()
     
     def transpile_statement(self, statement):
-        if statement[0] == 'variable_declaration':
-            return self.transpile_variable_declaration(statement)
-        elif statement[0] == 'variable_assignment':
-            return self.transpile_variable_assignment(statement)
-        elif statement[0] == 'output':
-            return self.transpile_output(statement)
-        elif statement[0] == 'input':
-            return self.transpile_input(statement)
-        elif statement[0] == 'conditional':
-            return self.transpile_conditional(statement)
-        elif statement[0] == 'while_loop':
-            return self.transpile_while_loop(statement)
-        elif statement[0] == 'for_loop':
-            return self.transpile_for_loop(statement)
-        else:
-            raise RuntimeError(f'Unknown statement type: {statement[0]}')
+        handler = self.statement_handlers.get(type(statement))
+        if handler is None:
+            raise RuntimeError(f'Unknown statement type: {type(statement).__name__}')
+        if self.mappings is None:
+            handler(statement)
+            return
+
+        emitter = self.emitter
+        origin = emitter.origin
+        parent = self.parent
+        line, column = self.lines.position(statement.offset)
+        emoji = statement.var_type if type(statement) is VariableDeclaration else statement_emojis[type(statement)]
+        emitter.origin = (line, column, emoji, parent)
+        self.parent = len(self.mappings) + 1
+        handler(statement)
+        emitter.origin = origin
+        self.parent = parent
         
     def transpile_variable_declaration(self, statement):
-        _, var_type, identifier, value = statement
-        return f'{identifier} = {self.transpile_expression(value)}'
+        self.emitter.line(f'{statement.identifier} = {self.transpile_expression(statement.value)}')
     
     def transpile_variable_assignment(self, statement):
-        _, identifier, value = statement
-        return f'{identifier} = {self.transpile_expression(value)}'
+        self.emitter.line(f'{statement.identifier} = {self.transpile_expression(statement.value)}')
     
     def transpile_output(self, statement):
-        _, value = statement
-        return f'print({self.transpile_expression(value)})'
-    
-    def transpile_input(self, statement):
-        _, value = statement
-        if value:
-            return f'input({self.transpile_expression(value)})'
-        else:
-            return 'input()'
+        self.emitter.line(f'print({self.transpile_expression(statement.value)})')
+
+    def transpile_input_statement(self, statement):
+        self.emitter.line(self.transpile_input(statement))
         
     def transpile_conditional(self, statement):
-        if len(statement) == 4:
-            _, condition, if_body, else_body = statement
-        else:
-            _, condition, if_body = statement
-            else_body = None
-        result = []
-        result.append(f'if {self.transpile_expression(condition)}:')
-        result.append(self.indent_code(self.transpile_body(if_body)))
-
-        if else_body:
-            result.append('else:')
-            result.append(self.indent_code(self.transpile_body(else_body)))
+        self.emitter.line(f'if {self.transpile_expression(statement.condition)}:')
+        self.transpile_body(statement.body)
 
-        return '\n'.join(result)
+        if statement.else_body:
+            self.emitter.line('else:')
+            self.transpile_body(statement.else_body)
     
     def transpile_while_loop(self, statement):
-        _, condition, body = statement
-        result = []
-        result.append(f'while {self.transpile_expression(condition)}:')
-        result.append(self.indent_code(self.transpile_body(body)))
-        return '\n'.join(result)
+        condition = self.transpile_expression(statement.condition)
+        if self.budget is None:
+            self.emitter.line(f'while {condition}:')
+            self.transpile_body(statement.body)
+            return
+
+        self.emitter.line(f'if {condition}:')
+        self.emitter.indent()
+        self.emitter.line('for () in _pymoji_ticks:')
+        self.emitter.indent()
+        for nested in statement.body:
+            self.transpile_statement(nested)
+        self.emitter.line(f'if not ({condition}):')
+        self.emitter.indent()
+        self.emitter.line('break')
+        self.emitter.dedent()
+        self.emitter.dedent()
+        self.emitter.line('else:')
+        self.emitter.indent()
+        self.emitter.line(self.budget_error(statement, '🐳'))
+        self.emitter.dedent()
+        self.emitter.dedent()
     
     def transpile_for_loop(self, statement):
-        _, variable, end, body = statement
-        result = []
-        result.append(f'for {variable} in range({end}):')
-        result.append(self.indent_code(self.transpile_body(body)))
-        return '\n'.join(result)
+        self.charge(statement)
+        self.transpile_range_loop(statement)
+
+    def transpile_range_loop(self, statement):
+        self.emitter.line(f'for {statement.variable} in range({statement.end}):')
+        self.transpile_body(statement.body)
+
+    def charge(self, loop):
+        if self.budget is None or id(loop) in self.charged:
+            return
+        iterations = self.iterations(loop)
+        if iterations == 0:
+            return
+        if iterations > self.budget:
+            self.emitter.line(self.budget_error(loop, '🔂'))
+            return
+        # The last of the iterations taken, None when fewer are left
+        self.emitter.line(f'if _pymoji_next(_pymoji_islice(_pymoji_ticks, {iterations - 1}, None), None) is None:')
+        self.emitter.indent()
+        self.emitter.line(self.budget_error(loop, '🔂'))
+        self.emitter.dedent()
+
+    def iterations(self, loop):
+        # The iterations of a 🔂 loop and of the 🔂 loops every one of its iterations runs, which
+        # are charged with it and marked so that they do not charge again
+        inner = 0
+        for statement in loop.body:
+            if type(statement) is VectorLoop:
+                statement = statement.loop
+            if type(statement) is ForLoop:
+                self.charged.add(id(statement))
+                inner += self.iterations(statement)
+        return loop.end * (1 + inner)
+
+    def transpile_vector_loop(self, statement):
+        # Parser.variable_name keeps emojicode variables from starting with _, so the _pymoji names
+        # never clash with them. Where
+        # pymoji_numpy cannot be imported the generated code still runs, with the scalar loop
+        loop = statement.loop
+        inputs = ''.join(f'{name}, ' for name in statement.inputs)
+        self.charge(loop)
+        self.emitter.line('try:')
+        self.emitter.indent()
+        self.emitter.line('from pymoji_numpy import vectorize as _pymoji_vectorize')
+        self.emitter.line(f'_pymoji_result = _pymoji_vectorize({loop.end}, {statement.plan!r}, ({inputs}))')
+        self.emitter.dedent()
+        self.emitter.line('except ImportError:')
+        self.emitter.indent()
+        self.emitter.line('_pymoji_result = None')
+        self.emitter.dedent()
+        self.emitter.line('if _pymoji_result is None:')
+        self.emitter.indent()
+        self.transpile_range_loop(loop)
+        self.emitter.dedent()
+        self.emitter.line('else:')
+        self.emitter.indent()
+        self.emitter.line(f'{", ".join(statement.targets + (loop.variable,))} = _pymoji_result')
+        self.emitter.dedent()
     
     def transpile_expression(self, expression):
-        if type(expression) is tuple:
-            if expression[0] == 'operation':
-                _, left, op, right = expression
-                op_map = {
-                    '😍😍': 'and',
-                    '😘🤨': 'or',
-                    '♊': '==',
-                    '♓': '!=',
-                    '🐜': '<',
-                    '🐘': '>',
-                    '🐜🐞': '<=',
-                    '🐘🦣': '>=',
-                    '🤰': '+',
-                    '🔫': '-',
-                    '🙅': '*',
-                    '🇦🇴': '/',
-                }
-
-                return f'{self.transpile_expression(left)} {op_map[op]} {self.transpile_expression(right)}'
-            elif expression[0] == 'input':
-                return f'input({self.transpile_expression(expression[1])})'
-        elif type(expression) is str:
-            if expression.isdigit():
-                return expression
-            elif expression == '✅':
-                return 'True'
-            elif expression == '❎':
-                return 'False'
-            elif expression.startswith('🌪️') and expression.endswith('🌪️'):
-                return f'\'{expression[2:-2]}\''
+        handler = self.expression_handlers.get(type(expression))
+        if handler is None:
+            raise RuntimeError(f'Unexpected expression type: {expression}')
+        return handler(expression)
+
+    def transpile_operation(self, expression):
+        left = self.transpile_operand(expression.left, expression.operator)
+        right = self.transpile_operand(expression.right, expression.operator)
+        return f'{left} {operator_map[expression.operator]} {right}'
+
+    def transpile_operand(self, operand, operator):
+        text = self.transpile_expression(operand)
+        return f'({text})' if is_chained(operator, operand) else text
+
+    def transpile_input(self, expression):
+        if expression.prompt is not None:
+            return f'input({self.transpile_expression(expression.prompt)})'
+        else:
+            return 'input()'
+
+    def transpile_number(self, expression):
+        return str(expression.value)
+
+    def transpile_string(self, expression):
+        return f'\'{expression.value}\''
+
+    def transpile_boolean(self, expression):
+        return 'True' if expression.value else 'False'
+
+    def transpile_identifier(self, expression):
+        return expression.name
+
+python_operators = {
+    '😍😍': ast_module.And,
+    '😘🤨': ast_module.Or,
+    '♊': ast_module.Eq,
+    '♓': ast_module.NotEq,
+    '🐜': ast_module.Lt,
+    '🐘': ast_module.Gt,
+    '🐜🐞': ast_module.LtE,
+    '🐘🦣': ast_module.GtE,
+    '🤰': ast_module.Add,
+    '🔫': ast_module.Sub,
+    '🙅': ast_module.Mult,
+    '🇦🇴': ast_module.Div,
+}
+
+class SharedSwitch:
+    # A process wide setting that compilations running in several threads turn on for a while,
+    # like pausing the garbage collector. The first one to enter turns it on, unless it already
+    # was, and the last one to leave turns it back off. The settings belong to the whole process,
+    # not to the compilations: while any AstTranspiler runs, the garbage collector is off for
+    # every thread of the host, and while any compilation traces memory, every allocation of the
+    # process is traced
+    def __init__(self, is_on, turn_on, turn_off):
+        self.is_on = is_on
+        self.turn_on = turn_on
+        self.turn_off = turn_off
+        self.lock = threading.Lock()
+        self.users = 0
+        self.owned = False
+
+    def enter(self):
+        with self.lock:
+            if self.users == 0:
+                self.owned = not self.is_on()
+                if self.owned:
+                    self.turn_on()
+            self.users += 1
+
+    def leave(self):
+        with self.lock:
+            self.users -= 1
+            if self.users == 0 and self.owned:
+                self.turn_off()
+                self.owned = False
+
+    def __enter__(self):
+        self.enter()
+
+    def __exit__(self, *exception):
+        self.leave()
+
+collector_paused = SharedSwitch(lambda: not gc.isenabled(), gc.disable, gc.enable)
+memory_tracing = SharedSwitch(tracemalloc.is_tracing, tracemalloc.start, tracemalloc.stop)
+
+def python_name(name):
+    # The name CPython reads for an identifier of the generated text
+    if not name.isidentifier() or keyword.iskeyword(name):
+        raise SyntaxError(f'{name!r} is not a valid Python name')
+    return name if name.isascii() else unicodedata.normalize('NFKC', name)
+
+def text_width(text):
+    # AST columns count UTF-8 bytes
+    return len(text) if text.isascii() else len(text.encode('utf-8'))
+
+class AstTranspiler:
+    # Builds the ast.Module of the program directly, so it is compiled without generating and
+    # parsing source text. Each node gets the line and column it has in the text written by
+    # Transpiler, so tracebacks point at the matching line of the --out file
+    load = ast_module.Load()
+    store = ast_module.Store()
+
+    def __init__(self, ast, function=False):
+        self.ast = ast
+        self.function = function
+        self.lineno = 0
+        self.level = 0
+        # Python name and text width of every identifier seen so far
+        self.names = {}
+        self.statement_handlers = {
+            VariableDeclaration: self.transpile_variable_assignment,
+            VariableAssignment: self.transpile_variable_assignment,
+            Output: self.transpile_output,
+            Input: self.transpile_input_statement,
+            Conditional: self.transpile_conditional,
+            WhileLoop: self.transpile_while_loop,
+            ForLoop: self.transpile_for_loop,
+        }
+        self.expression_handlers = {
+            Operation: self.transpile_operation,
+            Input: self.transpile_input,
+            NumberLiteral: self.transpile_number,
+            StringLiteral: self.transpile_string,
+            BooleanLiteral: self.transpile_boolean,
+            Identifier: self.transpile_identifier,
+        }
+
+    def transpile(self):
+        self.lineno = 0
+        self.level = 0
+        # The tree has no cycles, so the collector is paused instead of scanning the growing
+        # number of new nodes over and over, which otherwise takes most of the time
+        with collector_paused, nesting_limit():
+            if self.function:
+                body = [self.transpile_function()]
+                col = self.begin_line()
+                call = self.transpile_call('main', None, col)
+                body.append(self.located_statement(ast_module.Expr(call), self.lineno, col, call))
             else:
-                return expression
-            
+                body = [self.transpile_statement(statement) for statement in self.ast]
+        return ast_module.Module(body, [])
+
+    def compile(self, filename='<emojicode>'):
+        module = self.transpile()
+        with nesting_limit():
+            return compile(module, filename, 'exec')
+
+    def begin_line(self):
+        # Moves to the next generated line and returns its indentation column
+        self.lineno += 1
+        return self.level * len(Emitter.indentation)
+
+    def located(self, node, col, end):
+        # Expressions never span lines. Attributes are set one by one, which is about twice as
+        # fast as passing them to the node constructor
+        node.lineno = node.end_lineno = self.lineno
+        node.col_offset = col
+        node.end_col_offset = end
+        return node
+
+    def located_statement(self, node, lineno, col, last):
+        # A statement ends where its last child ends
+        node.lineno = lineno
+        node.col_offset = col
+        node.end_lineno = last.end_lineno
+        node.end_col_offset = last.end_col_offset
+        return node
+
+    def name(self, identifier):
+        entry = self.names.get(identifier)
+        if entry is None:
+            entry = self.names[identifier] = (python_name(identifier), text_width(identifier))
+        return entry
+
+    def transpile_function(self):
+        col = self.begin_line()
+        lineno = self.lineno
+        arguments = []
+        defaults = []
+        argument_col = len('def main(')
+        for name in hoisted_builtins:
+            end = argument_col + len(name)
+            arguments.append(self.located(ast_module.arg(name), argument_col, end))
+            defaults.append(self.located(ast_module.Name(name, self.load), end + 1, end + 1 + len(name)))
+            argument_col = end + 1 + len(name) + len(', ')
+        signature = ast_module.arguments([], arguments, None, [], [], None, defaults)
+        body = self.transpile_body(self.ast)
+        return self.located_statement(ast_module.FunctionDef('main', signature, body, []), lineno, col, body[-1])
+
+    def transpile_body(self, body):
+        self.level += 1
+        if body:
+            statements = [self.transpile_statement(statement) for statement in body]
         else:
+            col = self.begin_line()
+            statements = [self.located(ast_module.Pass(), col, col + len('pass'))]
+        self.level -= 1
+        return statements
+
+    def transpile_statement(self, statement):
+        handler = self.statement_handlers.get(type(statement))
+        if handler is None:
+            raise RuntimeError(f'Unknown statement type: {type(statement).__name__}')
+        return handler(statement)
+
+    def transpile_variable_assignment(self, statement):
+        col = self.begin_line()
+        name, width = self.name(statement.identifier)
+        target = self.located(ast_module.Name(name, self.store), col, col + width)
+        value = self.transpile_expression(statement.value, col + width + len(' = '))
+        return self.located_statement(ast_module.Assign([target], value), self.lineno, col, value)
+
+    def transpile_output(self, statement):
+        col = self.begin_line()
+        call = self.transpile_call('print', statement.value, col)
+        return self.located_statement(ast_module.Expr(call), self.lineno, col, call)
+
+    def transpile_input_statement(self, statement):
+        col = self.begin_line()
+        call = self.transpile_input(statement, col)
+        return self.located_statement(ast_module.Expr(call), self.lineno, col, call)
+
+    def transpile_conditional(self, statement):
+        col = self.begin_line()
+        lineno = self.lineno
+        test = self.transpile_expression(statement.condition, col + len('if '))
+        body = self.transpile_body(statement.body)
+        orelse = []
+        if statement.else_body:
+            # The else: line
+            self.begin_line()
+            orelse = self.transpile_body(statement.else_body)
+        return self.located_statement(ast_module.If(test, body, orelse), lineno, col, (orelse or body)[-1])
+
+    def transpile_while_loop(self, statement):
+        col = self.begin_line()
+        lineno = self.lineno
+        test = self.transpile_expression(statement.condition, col + len('while '))
+        body = self.transpile_body(statement.body)
+        return self.located_statement(ast_module.While(test, body, []), lineno, col, body[-1])
+
+    def transpile_for_loop(self, statement):
+        col = self.begin_line()
+        lineno = self.lineno
+        name, width = self.name(statement.variable)
+        target_col = col + len('for ')
+        target = self.located(ast_module.Name(name, self.store), target_col, target_col + width)
+        iterator = self.transpile_call('range', NumberLiteral(statement.end), target_col + width + len(' in '))
+        body = self.transpile_body(statement.body)
+        return self.located_statement(ast_module.For(target, iterator, body, []), lineno, col, body[-1])
+
+    def transpile_call(self, name, argument, col):
+        # name(argument), or name() when argument is None
+        function = self.located(ast_module.Name(name, self.load), col, col + len(name))
+        end = col + len(name) + len('(')
+        if argument is None:
+            arguments = []
+        else:
+            arguments = [self.transpile_expression(argument, end)]
+            end = arguments[0].end_col_offset
+        return self.located(ast_module.Call(function, arguments, []), col, end + len(')'))
+
+    def transpile_expression(self, expression, col):
+        handler = self.expression_handlers.get(type(expression))
+        if handler is None:
             raise RuntimeError(f'Unexpected expression type: {expression}')
-        
-    def indent_code(self, code):
-        indentation = '    '
-        return '\n'.join(indentation + line for line in code.split('\n'))
+        return handler(expression, col)
+
+    def transpile_operation(self, expression, col):
+        operator = expression.operator
+        python_operator = python_operators[operator]
+        if operator in comparison_operators:
+            left, left_end = self.transpile_comparison_operand(expression.left, col)
+            right, right_end = self.transpile_comparison_operand(expression.right, left_end + len(operator_map[operator]) + len('  '))
+            return self.located(ast_module.Compare(left, [python_operator()], [right]), col, right_end)
+
+        left = self.transpile_expression(expression.left, col)
+        right = self.transpile_expression(expression.right, left.end_col_offset + len(operator_map[operator]) + len('  '))
+        if python_operator is ast_module.And or python_operator is ast_module.Or:
+            # a and b and c is a single BoolOp for CPython
+            if type(left) is ast_module.BoolOp and type(left.op) is python_operator:
+                left.values.append(right)
+                left.end_col_offset = right.end_col_offset
+                return left
+            return self.located(ast_module.BoolOp(python_operator(), [left, right]), col, right.end_col_offset)
+        return self.located(ast_module.BinOp(left, python_operator(), right), col, right.end_col_offset)
+
+    def transpile_comparison_operand(self, operand, col):
+        # Returns the node and the column where its text ends, including the parentheses around
+        # a chained comparison
+        if type(operand) is Operation and operand.operator in comparison_operators:
+            node = self.transpile_expression(operand, col + len('('))
+            return node, node.end_col_offset + len(')')
+        node = self.transpile_expression(operand, col)
+        return node, node.end_col_offset
+
+    def transpile_input(self, expression, col):
+        return self.transpile_call('input', expression.prompt, col)
+
+    def transpile_number(self, expression, col):
+        text = str(expression.value)
+        end = col + len(text)
+        if text.startswith('-'):
+            # Folded negative numbers read as a unary minus in the text
+            operand = self.located(ast_module.Constant(-expression.value), col + len('-'), end)
+            return self.located(ast_module.UnaryOp(ast_module.USub(), operand), col, end)
+        return self.located(ast_module.Constant(expression.value), col, end)
+
+    def transpile_string(self, expression, col):
+        value = literal_value(expression)
+        if value is None:
+            raise SyntaxError(f'Invalid string literal: {expression.value!r}')
+        return self.located(ast_module.Constant(value), col, col + text_width(f'\'{expression.value}\''))
+
+    def transpile_boolean(self, expression, col):
+        return self.located(ast_module.Constant(expression.value), col, col + len('True' if expression.value else 'False'))
+
+    def transpile_identifier(self, expression, col):
+        name, width = self.name(expression.name)
+        return self.located(ast_module.Name(name, self.load), col, col + width)
+
+def collect_names(statement):
+    # Returns the names a statement reads or assigns, including the ones inside its blocks
+    names = set()
+    stack = [statement]
+    while stack:
+        node = stack.pop()
+        if type(node) is list:
+            stack.extend(node)
+        elif type(node) is Identifier:
+            names.add(node.name)
+        elif type(node) is VariableDeclaration or type(node) is VariableAssignment:
+            names.add(node.identifier)
+            stack.append(node.value)
+        elif type(node) is ForLoop:
+            names.add(node.variable)
+            stack.append(node.body)
+        elif type(node) is Conditional:
+            stack.extend((node.condition, node.body, node.else_body or []))
+        elif type(node) is WhileLoop:
+            stack.extend((node.condition, node.body))
+        elif type(node) is Operation:
+            stack.extend((node.left, node.right))
+        elif type(node) is Output:
+            stack.append(node.value)
+        elif type(node) is Input and node.prompt is not None:
+            stack.append(node.prompt)
+    return names
 
-parser = argparse.ArgumentParser(description='Transpile Python code and optionally run it.')
+class StatementRecord:
+    # A top level statement of a watched program. Its source region runs from start up to the
+    # start of the next record, declares maps the names it declares to their types. moved is how
+    # far the statement moved since it was parsed, its nodes keep their offsets from then
+    __slots__ = ('statement', 'index', 'names', 'declares', 'python', 'moved')
 
-parser.add_argument('--in', dest='input_file', default='example.pye', help='input Python file path (default: example.pye)')
-parser.add_argument('--out', dest='output_file', default='example.py', help='output transpiled file path (default: example.py)')
-parser.add_argument('--run', action='store_true', help='run the transpiled code')
-parser.add_argument('--debug', action='store_true', help='print debug information')
+    def __init__(self, statement):
+        self.statement = statement
+        self.index = 0
+        self.moved = 0
+        self.names = collect_names(statement)
+        self.declares = {}
+        self.python = ''
 
-args = parser.parse_args()
+class PrefixSymbols:
+    # Symbol table seen by the record at position limit: the declarations of the records before it,
+    # plus the ones the record itself makes while it is analyzed
+    def __init__(self, declared, limit):
+        self.declared = declared
+        self.limit = limit
+        self.local = {}
+
+    def __contains__(self, name):
+        if name in self.local:
+            return True
+        record = self.declared.get(name)
+        return record is not None and record.index < self.limit
+
+    def __getitem__(self, name):
+        if name in self.local:
+            return self.local[name]
+        record = self.declared.get(name)
+        if record is None or record.index >= self.limit:
+            raise KeyError(name)
+        return record.declares[name]
+
+    def __setitem__(self, name, value_type):
+        self.local[name] = value_type
+
+class IncrementalCompiler:
+    # Keeps the top level statements of a program with their types and generated code. On every
+    # update only the statements whose source region overlaps the edit are lexed, parsed and
+    # transpiled again, and only the statements depending on the names they declare are checked
+    # again. Whenever the edit cannot be handled locally (it touches ▶️/⏹️, leaves a block open,
+    # or the previous update failed) the whole program is compiled from scratch
+    def __init__(self, function=False):
+        self.function = function
+        self.source = None
+        self.lines = None
+        self.records = []
+        self.starts = []
+        self.body_start = 0
+        self.body_end = 0
+        self.declared = {}
+        self.dependents = {}
+        self.reparsed = 0
+
+    @property
+    def python_code(self):
+        body = '\n'.join(record.python for record in self.records)
+        if not self.function:
+            return body
+        return f'{Transpiler.function_header}\n{body or Emitter.indentation + "pass"}\nmain()'
+
+    def update(self, source):
+        # Returns the generated Python for the new source, raising RuntimeError on invalid programs
+        try:
+            with nesting_limit():
+                # Positions of the analysis errors
+                self.lines = LineIndex(source)
+                if self.source is None or not self.update_incrementally(source):
+                    self.compile_from_scratch(source)
+        except RuntimeError:
+            self.source = None
+            raise
+        self.source = source
+        return self.python_code
+
+    def compile_from_scratch(self, source):
+        parser = Parser(tokenize(source))
+        start_token = parser.token
+        parser.consume(TokenKind.PROGRAM_START)
+        self.body_start = start_token[2] + len(start_token[1])
+        spans = self.parse_statements(parser)
+        self.body_end = parser.token[2]
+        parser.consume(TokenKind.PROGRAM_END)
+
+        self.records = []
+        self.starts = []
+        self.declared = {}
+        self.dependents = {}
+        self.splice(0, 0, spans, self.body_start)
+        self.reparsed = len(spans)
+
+    def parse_statements(self, parser):
+        spans = []
+        while parser.token[0] not in BODY_END:
+            if parser.token[0] is TokenKind.NEWLINE:
+                parser.skip_newline()
+            else:
+                start = parser.token[2]
+                spans.append((start, parser.parse_statement()))
+        return spans
 
-with open(args.input_file, 'r', encoding='utf-8') as file:
-    emojicode = file.read()
+    def update_incrementally(self, source):
+        old_source = self.source
+        prefix = common_prefix_length(old_source, source)
+        suffix = common_suffix_length(old_source, source, prefix)
+        old_end = len(old_source) - suffix
+        delta = len(source) - len(old_source)
+        if prefix == len(old_source) == len(source):
+            self.reparsed = 0
+            return True
+        if not self.records or prefix < self.body_start or old_end > self.body_end:
+            return False
 
-tokens = tokenize(emojicode)
-parser = Parser(tokens)
-ast = parser.parse()
+        # Damaged records are the ones whose region overlaps or touches the edit
+        first = bisect.bisect_right(self.starts, prefix) - 1
+        if first > 0 and self.starts[first] == prefix:
+            first -= 1
+        first = max(first, 0)
+        last = max(bisect.bisect_right(self.starts, old_end) - 1, first)
+        region_start = self.starts[first]
+        region_end = (self.starts[last + 1] if last + 1 < len(self.starts) else self.body_end) + delta
 
-semantic_analyzer = SemanticAnalyzer(ast)
-semantic_analyzer.analyze()
+        try:
+            line_start = source.rfind('\n', 0, region_start) + 1
+            parser = Parser(scan(source[region_start:region_end], region_start), source.count('\n', 0, region_start) + 1, line_start)
+            spans = self.parse_statements(parser)
+        except RuntimeError:
+            return False
+        if parser.token[0] is not TokenKind.EOF:
+            # The edit left a 🔒 or ⏹️ behind, so the statements after it must be parsed again too
+            return False
 
-transpiler = Transpiler(ast)
-python_code = transpiler.transpile()
+        # Regions after the edit move by delta
+        if delta:
+            self.starts[last + 1:] = [start + delta for start in self.starts[last + 1:]]
+            for record in self.records[last + 1:]:
+                record.moved += delta
+            self.body_end += delta
+        self.splice(first, last + 1, spans, region_start)
+        self.reparsed = len(spans)
+        return True
 
-with open(args.output_file, 'w', encoding='utf-8') as output_file:
-    output_file.write(python_code)
+    def splice(self, first, stop, spans, region_start):
+        # Replaces the records first..stop with the parsed spans, then analyzes the new statements
+        # and every later statement using a name whose declaration may have changed
+        removed = self.records[first:stop]
+        changed = set()
+        for record in removed:
+            for name in record.declares:
+                changed.add(name)
+                if self.declared.get(name) is record:
+                    del self.declared[name]
+            for name in record.names:
+                self.dependents[name].discard(record)
+
+        records = [StatementRecord(statement) for _, statement in spans]
+        starts = [start for start, _ in spans]
+        if starts:
+            starts[0] = region_start
+        self.records[first:stop] = records
+        self.starts[first:stop] = starts
+        if self.starts:
+            self.starts[0] = self.body_start
+        if len(records) != len(removed):
+            for index in range(first, len(self.records)):
+                self.records[index].index = index
+        else:
+            for index, record in enumerate(records, first):
+                record.index = index
+
+        transpiler = Transpiler([])
+        for record in records:
+            self.analyze(record)
+            for name in record.names:
+                self.dependents.setdefault(name, set()).add(record)
+            changed.update(record.declares)
+            buffer = io.StringIO()
+            transpiler.emitter = Emitter(buffer)
+            if self.function:
+                transpiler.emitter.indent()
+            transpiler.transpile_statement(record.statement)
+            record.python = buffer.getvalue()
+
+        end = first + len(records)
+        affected = set()
+        for name in changed:
+            affected.update(record for record in self.dependents.get(name, ()) if record.index >= end)
+        for record in sorted(affected, key=lambda record: record.index):
+            self.analyze(record)
+
+    def analyze(self, record):
+        for name in record.declares:
+            if self.declared.get(name) is record:
+                del self.declared[name]
+        semantic_analyzer = SemanticAnalyzer([], self.lines)
+        semantic_analyzer.offset_shift = record.moved
+        semantic_analyzer.symbol_table = PrefixSymbols(self.declared, record.index)
+        semantic_analyzer.analyze_statement(record.statement)
+        record.declares = semantic_analyzer.symbol_table.local
+        for name in record.declares:
+            self.declared[name] = record
+
+def common_prefix_length(old, new, block=4096):
+    # Compares whole blocks first so that long unchanged prefixes are skipped at C speed
+    limit = min(len(old), len(new))
+    length = 0
+    while length + block <= limit and old[length:length + block] == new[length:length + block]:
+        length += block
+    while length < limit and old[length] == new[length]:
+        length += 1
+    return length
+
+def common_suffix_length(old, new, prefix, block=4096):
+    limit = min(len(old), len(new)) - prefix
+    length = 0
+    while length + block <= limit and old[len(old) - length - block:len(old) - length] == new[len(new) - length - block:len(new) - length]:
+        length += block
+    while length < limit and old[len(old) - length - 1] == new[len(new) - length - 1]:
+        length += 1
+    return length
+
+def watch_file(input_file, output_file, function=False, interval=0.2):
+    compiler = IncrementalCompiler(function)
+    last_stat = None
+    print(f'Watching {input_file} (Ctrl+C to stop)')
+    try:
+        while True:
+            try:
+                stat = os.stat(input_file)
+            except FileNotFoundError:
+                time.sleep(interval)
+                continue
+            if (stat.st_mtime_ns, stat.st_size) != last_stat:
+                last_stat = (stat.st_mtime_ns, stat.st_size)
+                with open(input_file, 'r', encoding='utf-8') as file:
+                    emojicode = file.read()
+                start = time.perf_counter()
+                try:
+                    python_code = compiler.update(emojicode)
+                except RuntimeError as error:
+                    print(f'Error: {error}')
+                else:
+                    with open(output_file, 'w', encoding='utf-8') as file:
+                        file.write(python_code)
+                    elapsed = (time.perf_counter() - start) * 1000
+                    print(f'Python code transpiled to {output_file} ({compiler.reparsed} statements re-parsed, {elapsed:.1f} ms)')
+            time.sleep(interval)
+    except KeyboardInterrupt:
+        pass
+
+class CompilationCache:
+    # Content addressed cache in the spirit of __pycache__. Each entry is one file named after the
+    # hash of the source, the compiler version and the options, holding the generated Python, its
+    # code object and optionally the pickled AST. Entries are written to a temporary file and
+    # renamed into place, so concurrent processes only ever see complete entries, and the least
+    # recently used ones are removed once the directory grows past max_size bytes
+    magic = b'PYMC'
+    suffix = '.pyec'
+    temp_prefix = '.tmp-'
+    # Temporary files older than this were left behind by a write that never finished
+    stale_age = 600
+
+    def __init__(self, directory, max_size=64 * 1024 * 1024):
+        self.directory = directory
+        self.max_size = max_size
+
+    def key(self, source, options=()):
+        digest = hashlib.sha256()
+        digest.update(f'{__version__}\0{importlib.util.MAGIC_NUMBER.hex()}\0{options!r}\0'.encode('utf-8'))
+        digest.update(source.encode('utf-8'))
+        return digest.hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, key + self.suffix)
+
+    def load(self, key):
+        path = self.path(key)
+        try:
+            with open(path, 'rb') as file:
+                data = file.read()
+            # Refresh the access time used for the LRU eviction
+            os.utime(path)
+        except OSError:
+            return None
+        if not data.startswith(self.magic):
+            return None
+        try:
+            entry = marshal.loads(data[len(self.magic):])
+        except (EOFError, ValueError, TypeError):
+            return None
+        if 'map' not in entry:
+            # Stored before source maps existed
+            return None
+        return entry
+
+    def entry_ast(self, entry):
+        # The AST of an entry stored with cache_ast, None otherwise. Entries keep it pickled, so
+        # the hits that do not need it never pay for unpickling it
+        ast = entry['ast']
+        return pickle.loads(ast) if ast is not None else None
+
+    def store(self, key, python_code, code=None, ast=None, mappings=None):
+        # ast is the pickled AST, as entry_ast reads it
+        entry = {
+            'python': python_code,
+            'code': code,
+            'map': mappings,
+            'ast': ast,
+        }
+        os.makedirs(self.directory, exist_ok=True)
+        descriptor, temp_path = tempfile.mkstemp(prefix=self.temp_prefix, dir=self.directory)
+        try:
+            with os.fdopen(descriptor, 'wb') as file:
+                file.write(self.magic + marshal.dumps(entry))
+            os.replace(temp_path, self.path(key))
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        self.evict()
+
+    def evict(self):
+        entries = []
+        total_size = 0
+        now = time.time()
+        for entry in os.scandir(self.directory):
+            if entry.name.startswith(self.temp_prefix):
+                self.remove_stale(entry, now)
+                continue
+            if not entry.name.endswith(self.suffix):
+                continue
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+            total_size += stat.st_size
+
+        entries.sort()
+        for _, size, path in entries:
+            if total_size <= self.max_size:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                # Already evicted by another process
+                pass
+            total_size -= size
+
+    def remove_stale(self, entry, now):
+        # Temporary files of writes in progress are recent, so only the old ones are removed
+        try:
+            if now - entry.stat().st_mtime > self.stale_age:
+                os.remove(entry.path)
+        except OSError:
+            pass
+
+# Functions called with (event, data) for every instrumented compilation, see add_compile_hook.
+# The tuple is replaced rather than changed, so a compilation in another thread always loops
+# over a complete one
+compile_hooks = ()
+hooks_lock = threading.Lock()
+
+def add_compile_hook(hook):
+    # Embedding hosts receive the measurements here instead of parsing the --profile output:
+    #   ('phase', {'phase': name, 'seconds': ..., 'peak_memory': ...})  as each phase finishes
+    #   ('finish', CompileStats.as_dict())                               once the compilation is over
+    # While a hook is registered every compilation is measured, even without a CompileStats
+    global compile_hooks
+    with hooks_lock:
+        compile_hooks += (hook,)
+
+def remove_compile_hook(hook):
+    global compile_hooks
+    with hooks_lock:
+        hooks = list(compile_hooks)
+        hooks.remove(hook)
+        compile_hooks = tuple(hooks)
+
+def count_nodes(ast):
+    # Number of AST nodes of each kind
+    counts = {}
+    stack = list(ast)
+    while stack:
+        node = stack.pop()
+        name = type(node).__name__
+        counts[name] = counts.get(name, 0) + 1
+        for field in node.__slots__:
+            value = getattr(node, field)
+            if type(value) is list:
+                stack.extend(value)
+            elif isinstance(value, Node):
+                stack.append(value)
+    return counts
+
+class CompileStats:
+    # Measurements of one compilation: the wall time of every phase, token and AST node counts by
+    # kind, symbol table size, input and output size and, with trace_memory, the peak memory traced
+    # by tracemalloc during each phase. Tracing slows the phases down, so it is off by default.
+    # tracemalloc counts the whole process, so the peaks include what other threads allocate, and
+    # every phase resets its process wide peak, so compilations tracing memory at the same time
+    # cut each other's peaks short. Only one of them at a time gets meaningful peaks.
+    # Besides the global compile hooks, the events go to the hooks given here
+    def __init__(self, trace_memory=False, hooks=()):
+        self.trace_memory = trace_memory
+        self.hooks = tuple(hooks)
+        self.phases = {}
+        self.peak_memory = {}
+        self.tokens = {}
+        self.nodes = {}
+        self.symbols = None
+        self.input_bytes = None
+        self.output_bytes = None
+        self.cache = None
+        self.error = None
+        self.started_tracing = False
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        if self.trace_memory:
+            if not self.started_tracing:
+                memory_tracing.enter()
+                self.started_tracing = True
+            tracemalloc.reset_peak()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            self.phases[name] = self.phases.get(name, 0.0) + seconds
+            event = {'phase': name, 'seconds': seconds}
+            if self.trace_memory:
+                peak = tracemalloc.get_traced_memory()[1]
+                self.peak_memory[name] = max(self.peak_memory.get(name, 0), peak)
+                event['peak_memory'] = peak
+            for hook in compile_hooks + self.hooks:
+                hook('phase', event)
+
+    def record_source(self, emojicode):
+        self.input_bytes = len(emojicode.encode('utf-8'))
+
+    def record_tokens(self, tokens):
+        counts = {}
+        for kind in tokens.kinds() if type(tokens) is TokenList else (token[0] for token in tokens):
+            counts[kind] = counts.get(kind, 0) + 1
+        self.tokens = {TokenKind(kind).name: count for kind, count in sorted(counts.items())}
+
+    def record_output(self, python_code):
+        self.output_bytes = len(python_code.encode('utf-8'))
+
+    def finish(self):
+        # Stops the memory tracing started here and reports the measurements to the hooks
+        if self.started_tracing:
+            memory_tracing.leave()
+            self.started_tracing = False
+        report = self.as_dict()
+        for hook in compile_hooks + self.hooks:
+            hook('finish', report)
+        return report
+
+    def as_dict(self):
+        report = {
+            'phases': dict(self.phases),
+            'total_seconds': sum(self.phases.values()),
+            'tokens': dict(self.tokens),
+            'token_count': sum(self.tokens.values()),
+            'nodes': dict(sorted(self.nodes.items())),
+            'node_count': sum(self.nodes.values()),
+            'symbols': self.symbols,
+            'input_bytes': self.input_bytes,
+            'output_bytes': self.output_bytes,
+            'cache': self.cache,
+            'error': self.error,
+        }
+        if self.trace_memory:
+            report['peak_memory'] = dict(self.peak_memory)
+        return report
+
+    def format(self):
+        # The --profile report
+        lines = [f'{"phase":<10} {"time":>11}' + (f' {"peak memory":>12}' if self.trace_memory else '')]
+        for name, seconds in self.phases.items():
+            line = f'{name:<10} {seconds * 1000:>8.2f} ms'
+            if name in self.peak_memory:
+                line += f' {self.peak_memory[name] / 1024 / 1024:>9.2f} MB'
+            lines.append(line)
+        lines.append(f'{"total":<10} {sum(self.phases.values()) * 1000:>8.2f} ms')
+        if self.tokens:
+            lines.append(f'tokens: {sum(self.tokens.values())} (' + ', '.join(f'{kind} {count}' for kind, count in self.tokens.items()) + ')')
+        if self.nodes:
+            lines.append(f'nodes: {sum(self.nodes.values())} (' + ', '.join(f'{kind} {count}' for kind, count in sorted(self.nodes.items())) + ')')
+        if self.symbols is not None:
+            lines.append(f'symbols: {self.symbols}')
+        sizes = []
+        if self.input_bytes is not None:
+            sizes.append(f'input {self.input_bytes} bytes')
+        if self.output_bytes is not None:
+            sizes.append(f'output {self.output_bytes} bytes')
+        if self.cache is not None:
+            sizes.append(f'cache {self.cache}')
+        if sizes:
+            lines.append(', '.join(sizes))
+        if self.error is not None:
+            lines.append(f'error: {self.error}')
+        return '\n'.join(lines)
+
+def measure(stats, name):
+    # Times a phase when the compilation is measured
+    return stats.phase(name) if stats is not None else contextlib.nullcontext()
+
+@contextlib.contextmanager
+def instrumented(stats, hooks=()):
+    # Yields the stats a compilation fills: the ones given by the caller, who finishes them, or
+    # new ones finished here when only hooks are listening
+    if stats is not None or not (compile_hooks or hooks):
+        yield stats
+        return
+    stats = CompileStats(hooks=hooks)
+    try:
+        yield stats
+    except RuntimeError as error:
+        stats.error = str(error)
+        raise
+    finally:
+        stats.finish()
+
+def parse_source(emojicode, optimize=0, stats=None, vectorize=False):
+    # Returns the checked (and optimized) AST of an emojicode program, raising RuntimeError on
+    # invalid programs. With vectorize the loops the --numpy backend handles become VectorLoops
+    with instrumented(stats) as stats:
+        with measure(stats, 'tokenize'):
+            tokens = tokenize(emojicode)
+        if stats is not None:
+            stats.record_source(emojicode)
+            stats.record_tokens(tokens)
+        with measure(stats, 'parse'):
+            parser = Parser(tokens)
+            ast = parser.parse()
+        return check_ast(ast, optimize, stats, vectorize, LineIndex(emojicode))
+
+def check_ast(ast, optimize=0, stats=None, vectorize=False, lines=None):
+    # The phases after the parser, for parsed programs and for the trees of AST files. lines, the
+    # LineIndex of the source, gives the position of the analysis errors
+    with nesting_limit():
+        with measure(stats, 'analyze'):
+            semantic_analyzer = SemanticAnalyzer(ast, lines)
+            semantic_analyzer.analyze()
+
+        if optimize:
+            with measure(stats, 'optimize'):
+                ast = Optimizer(ast, optimize).optimize()
+                if optimize >= 3:
+                    ast = CodeMotion(semantic_analyzer.symbol_table).move(ast)
+        if vectorize:
+            with measure(stats, 'vectorize'):
+                ast = Vectorizer(semantic_analyzer.symbol_table).vectorize(ast)
+    if stats is not None:
+        stats.symbols = len(semantic_analyzer.symbol_table)
+        stats.nodes = count_nodes(ast)
+    return ast
+
+def cached_compile(emojicode, cache, cache_ast=False, filename='<emojicode>', optimize=0, function=False, stats=None, vectorize=False, budget=None, code=False):
+    # Returns the cache entry of a program. The code object is compiled from the generated text,
+    # only when code is true, and then added to an entry stored without it. It stays None when
+    # the text does not compile
+    options = (('optimize', optimize), ('function', function))
+    if vectorize:
+        options += (('numpy', True),)
+    if budget is not None:
+        options += (('budget', budget),)
+    if cache_ast:
+        # Entries stored without the AST cannot serve a compilation that wants it
+        options += (('ast', True),)
+    cache_key = cache.key(emojicode, options)
+    with measure(stats, 'cache'):
+        entry = cache.load(cache_key)
+    if entry is not None:
+        if stats is not None:
+            stats.cache = 'hit'
+            stats.record_source(emojicode)
+            stats.record_output(entry['python'])
+        if code and entry['code'] is None:
+            entry['code'] = compile_text(entry['python'], filename, stats)
+            if entry['code'] is not None:
+                with measure(stats, 'store'):
+                    cache.store(cache_key, entry['python'], entry['code'], entry['ast'], entry['map'])
+        return entry
+
+    if stats is not None:
+        stats.cache = 'miss'
+    ast = parse_source(emojicode, optimize, stats, vectorize)
+    with measure(stats, 'transpile'):
+        transpiler = Transpiler(ast, function, LineIndex(emojicode), budget)
+        python_code = transpiler.transpile()
+    code = compile_text(python_code, filename, stats) if code else None
+    with measure(stats, 'store'), nesting_limit():
+        pickled_ast = pickle.dumps(ast, pickle.HIGHEST_PROTOCOL) if cache_ast else None
+        cache.store(cache_key, python_code, code, pickled_ast, transpiler.mappings)
+    if stats is not None:
+        stats.record_output(python_code)
+    return {'python': python_code, 'code': code, 'map': transpiler.mappings, 'ast': pickled_ast}
+
+def compile_text(python_code, filename, stats=None):
+    # The code object of the generated text, None when it does not compile
+    with measure(stats, 'compile'):
+        try:
+            return compile(python_code, filename, 'exec')
+        except SyntaxError:
+            return None
+
+def compile_source(emojicode, cache=None, cache_ast=False, filename='<emojicode>', optimize=0, function=False, stats=None, vectorize=False, budget=None):
+    # Returns the Python code for an emojicode program, raising RuntimeError on invalid programs.
+    # filename is only used for the code object stored in the cache. stats, a CompileStats, is
+    # filled with the measurements of the compilation. With a budget the program raises
+    # BudgetExceeded after that many loop iterations (see Transpiler)
+    with instrumented(stats) as stats:
+        if cache is not None:
+            return cached_compile(emojicode, cache, cache_ast, filename, optimize, function, stats, vectorize, budget)['python']
+        ast = parse_source(emojicode, optimize, stats, vectorize)
+        with measure(stats, 'transpile'):
+            python_code = Transpiler(ast, function, budget_lines(emojicode, budget), budget).transpile()
+        if stats is not None:
+            stats.record_output(python_code)
+        return python_code
+
+def compile_mapped(emojicode, cache=None, cache_ast=False, filename='<emojicode>', optimize=0, function=False, stats=None, vectorize=False, budget=None):
+    # Like compile_source, but returns the Python code with its source map entries (see Transpiler)
+    with instrumented(stats) as stats:
+        if cache is not None:
+            entry = cached_compile(emojicode, cache, cache_ast, filename, optimize, function, stats, vectorize, budget)
+            return entry['python'], entry['map']
+        ast = parse_source(emojicode, optimize, stats, vectorize)
+        with measure(stats, 'transpile'):
+            transpiler = Transpiler(ast, function, LineIndex(emojicode), budget)
+            python_code = transpiler.transpile()
+        if stats is not None:
+            stats.record_output(python_code)
+        return python_code, transpiler.mappings
+
+def compile_code(emojicode, cache=None, cache_ast=False, filename='<emojicode>', optimize=0, function=False, stats=None, vectorize=False, budget=None):
+    # Returns the code object for an emojicode program. Without a cache it is compiled from the
+    # Python AST without going through source text, except for the --numpy backend and budgeted
+    # programs. The cache already holds the generated text, which compiles faster
+    with instrumented(stats) as stats:
+        if cache is None:
+            ast = parse_source(emojicode, optimize, stats, vectorize)
+            with measure(stats, 'compile'):
+                if vectorize or budget is not None:
+                    return compile(Transpiler(ast, function, budget_lines(emojicode, budget), budget).transpile(), filename, 'exec')
+                return AstTranspiler(ast, function).compile(filename)
+        entry = cached_compile(emojicode, cache, cache_ast, filename, optimize, function, stats, vectorize, budget, code=True)
+        if entry['code'] is None:
+            # Raises the SyntaxError of the generated text
+            return compile(entry['python'], filename, 'exec')
+        return with_filename(entry['code'], filename)
+
+def budget_lines(emojicode, budget):
+    # The budget errors give the position of their loop in the source
+    return LineIndex(emojicode) if budget is not None else None
+
+def with_filename(code, filename):
+    # The cached code object keeps the file name of the compilation that stored it
+    if code.co_filename == filename:
+        return code
+    constants = tuple(with_filename(constant, filename) if type(constant) is types.CodeType else constant for constant in code.co_consts)
+    return code.replace(co_filename=filename, co_consts=constants)
+
+def compile_file(input_file, output_file, cache=None, cache_ast=False, optimize=0, function=False, stats=None, source_map=False, vectorize=False, budget=None):
+    # With source_map the source map is also written to output_file + '.map'
+    with open(input_file, 'r', encoding='utf-8') as file:
+        emojicode = file.read()
+
+    if source_map:
+        python_code, mappings = compile_mapped(emojicode, cache, cache_ast, output_file, optimize, function, stats, vectorize, budget)
+    else:
+        python_code = compile_source(emojicode, cache, cache_ast, output_file, optimize, function, stats, vectorize, budget)
+
+    with open(output_file, 'w', encoding='utf-8') as file:
+        file.write(python_code)
+    if source_map:
+        write_source_map(output_file + '.map', input_file, output_file, mappings)
+    return python_code
+
+def emit_file(input_file, tokens_file=None, ast_file=None):
+    # Writes the tokens and the parsed, unchecked AST of a program to pymoji_binary files, for
+    # the tools that read them and for --from-ast
+    with open(input_file, 'r', encoding='utf-8') as file:
+        emojicode = file.read()
+    tokens = tokenize(emojicode)
+    if tokens_file is not None:
+        pymoji_binary.write_tokens(tokens_file, tokens, [kind.name for kind in TokenKind])
+    if ast_file is not None:
+        pymoji_binary.write_ast(ast_file, Parser(tokens).parse())
+
+def compile_tree_file(ast_file, output_file, optimize=0, function=False, stats=None, vectorize=False, budget=None):
+    # Compiles the tree of an AST file written by --emit-ast, which is analyzed like a parsed
+    # program. Without the source there is no source map and the budget errors give no position
+    with instrumented(stats) as stats:
+        with measure(stats, 'read'):
+            ast = pymoji_binary.load_ast(ast_file)
+        ast = check_ast(ast, optimize, stats, vectorize)
+        with measure(stats, 'transpile'):
+            python_code = Transpiler(ast, function, None, budget).transpile()
+        if stats is not None:
+            stats.record_output(python_code)
+    with open(output_file, 'w', encoding='utf-8') as file:
+        file.write(python_code)
+    return python_code
+
+def write_source_map(path, input_file, output_file, mappings):
+    # One JSON line: the paths relative to the map and the mappings of the generated lines
+    directory = os.path.dirname(path) or os.curdir
+    source_map = {
+        'version': 1,
+        'file': os.path.relpath(output_file, directory),
+        'source': os.path.relpath(input_file, directory),
+        'mappings': mappings,
+    }
+    with open(path, 'w', encoding='utf-8') as file:
+        json.dump(source_map, file, ensure_ascii=False, separators=(',', ':'))
+
+def load_source_map(path):
+    # Returns the source map with its paths resolved against the directory of the map
+    with open(path, 'r', encoding='utf-8') as file:
+        source_map = json.load(file)
+    directory = os.path.dirname(path)
+    source_map['file'] = os.path.join(directory, source_map['file'])
+    source_map['source'] = os.path.join(directory, source_map['source'])
+    return source_map
+
+class CompilerSession:
+    # The compiler for embedding hosts, which may compile from many threads at once. A session
+    # holds its options, its cache and its hooks, which never change after it is created. Every
+    # compilation builds its own parser, analyzer, optimizer and transpiler, and the module level
+    # tables they read (token_regex, scanner_table, the operator maps...) are never modified. The
+    # process wide settings some phases change go through SharedSwitch, and the cache only ever
+    # renames complete entries into place, so one session, or several, can be used by any
+    # number of threads. The hooks get the events of the compilations the session measures
+    # itself, when no CompileStats is passed (see add_compile_hook)
+    def __init__(self, optimize=0, function=False, vectorize=False, budget=None, cache=None, cache_ast=False, hooks=()):
+        self.optimize = optimize
+        self.function = function
+        self.vectorize = vectorize
+        self.budget = budget
+        self.cache = cache
+        self.cache_ast = cache_ast
+        self.hooks = tuple(hooks)
+
+    def parse(self, emojicode, stats=None):
+        # With a cache and cache_ast the AST comes from the cache entry of the program
+        with instrumented(stats, self.hooks) as stats:
+            if self.cache is not None and self.cache_ast:
+                entry = cached_compile(emojicode, self.cache, True, '<emojicode>', self.optimize, self.function, stats, self.vectorize, self.budget)
+                return self.cache.entry_ast(entry)
+            return parse_source(emojicode, self.optimize, stats, self.vectorize)
+
+    def compile_source(self, emojicode, filename='<emojicode>', stats=None):
+        with instrumented(stats, self.hooks) as stats:
+            return compile_source(emojicode, self.cache, self.cache_ast, filename, self.optimize, self.function, stats, self.vectorize, self.budget)
+
+    def compile_mapped(self, emojicode, filename='<emojicode>', stats=None):
+        with instrumented(stats, self.hooks) as stats:
+            return compile_mapped(emojicode, self.cache, self.cache_ast, filename, self.optimize, self.function, stats, self.vectorize, self.budget)
+
+    def compile_code(self, emojicode, filename='<emojicode>', stats=None):
+        with instrumented(stats, self.hooks) as stats:
+            return compile_code(emojicode, self.cache, self.cache_ast, filename, self.optimize, self.function, stats, self.vectorize, self.budget)
+
+    def compile_file(self, input_file, output_file, stats=None, source_map=False):
+        with instrumented(stats, self.hooks) as stats:
+            return compile_file(input_file, output_file, self.cache, self.cache_ast, self.optimize, self.function, stats, source_map, self.vectorize, self.budget)
+
+def read_text(path):
+    with open(path, 'r', encoding='utf-8') as file:
+        return file.read()
+
+def stream_compile_file(input_file, output_file, optimize=0, function=False, vectorize=False):
+    # Each top level statement is analyzed and transpiled as soon as it is parsed, so only the
+    # current statement and the symbol table are kept in memory. Constant propagation needs the
+    # whole program, so only the level 1 optimizations are applied here, and the file is only
+    # read again for the position of an analysis error
+    semantic_analyzer = SemanticAnalyzer([], LineIndex(lambda: read_text(input_file)))
+    optimizer = Optimizer([], min(optimize, 1))
+    vectorizer = Vectorizer(semantic_analyzer.symbol_table)
+    transpiler = Transpiler([], function)
+    temp_file = f'{output_file}.tmp'
+    try:
+        with nesting_limit(), open(input_file, 'r', encoding='utf-8') as file, open(temp_file, 'w', encoding='utf-8') as output:
+            parser = Parser(iter_tokens(file))
+            transpiler.emitter = Emitter(output)
+            if function:
+                transpiler.emitter.line(transpiler.function_header)
+                transpiler.emitter.indent()
+            empty = True
+            for statement in parser.iter_program():
+                semantic_analyzer.analyze_statement(statement)
+                statements = optimizer.optimize_statement(statement) if optimize else [statement]
+                if vectorize:
+                    statements = vectorizer.vectorize(statements)
+                for optimized in statements:
+                    transpiler.transpile_statement(optimized)
+                    empty = False
+            if function:
+                if empty:
+                    transpiler.emitter.line('pass')
+                transpiler.emitter.dedent()
+                transpiler.emitter.line('main()')
+    except BaseException:
+        if os.path.exists(temp_file):
+            os.remove(temp_file)
+        raise
+    os.replace(temp_file, output_file)
+
+def open_cache(input_file, cache_dir, cache_size):
+    # The default cache lives next to the input, like __pycache__
+    directory = cache_dir or os.path.join(os.path.dirname(input_file), '__pymojicache__')
+    return CompilationCache(directory, cache_size * 1024 * 1024)
+
+def collect_batch_files(patterns, out_dir):
+    # Directories are searched recursively for .pye files and globs are expanded. Every input is
+    # mirrored under out_dir relative to the directory (or the fixed prefix of the glob) it came from.
+    # A file matched by several patterns is compiled once, for the first one
+    jobs = []
+    seen = set()
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            base = pattern
+            matches = glob.glob(os.path.join(glob.escape(pattern), '**', '*.pye'), recursive=True)
+        else:
+            parts = pattern.split(os.sep)
+            fixed = list(itertools.takewhile(lambda part: not glob.has_magic(part), parts[:-1]))
+            base = os.sep.join(fixed) or os.curdir
+            matches = glob.glob(pattern, recursive=True)
+        for input_file in sorted(matches):
+            if not os.path.isfile(input_file):
+                continue
+            resolved = os.path.realpath(input_file)
+            if resolved in seen:
+                continue
+            seen.add(resolved)
+            relative = os.path.relpath(input_file, base)
+            output_file = os.path.join(out_dir, os.path.splitext(relative)[0] + '.py')
+            jobs.append((input_file, output_file))
+    return jobs
+
+def batch_compile_job(job):
+    input_file, output_file, stream, use_cache, cache_dir, cache_size, cache_ast, optimize, function, source_map, vectorize, budget = job
+    start = time.perf_counter()
+    try:
+        os.makedirs(os.path.dirname(output_file) or os.curdir, exist_ok=True)
+        if stream:
+            stream_compile_file(input_file, output_file, optimize, function, vectorize)
+        else:
+            cache = open_cache(input_file, cache_dir, cache_size) if use_cache else None
+            compile_file(input_file, output_file, cache, cache_ast, optimize, function, source_map=source_map, vectorize=vectorize, budget=budget)
+        error = None
+    except (RuntimeError, OSError, UnicodeDecodeError) as exception:
+        error = str(exception)
+    return input_file, output_file, error, time.perf_counter() - start, os.path.getsize(input_file)
+
+def batch_compile(args):
+    files = collect_batch_files(args.batch, args.out_dir)
+    jobs = [
+        (input_file, output_file, args.stream, not args.no_cache, args.cache_dir, args.cache_size, args.cache_ast, args.optimize, args.function, args.source_map, args.numpy, args.budget)
+        for input_file, output_file in files
+    ]
+    if not jobs:
+        print('No .pye files found')
+        return 1
+
+    if args.jobs:
+        workers = args.jobs
+    elif hasattr(os, 'sched_getaffinity'):
+        workers = len(os.sched_getaffinity(0))
+    else:
+        workers = os.cpu_count() or 1
+    workers = max(1, min(workers, len(jobs)))
+    start = time.perf_counter()
+    failures = 0
+    total_bytes = 0
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+        chunksize = max(1, len(jobs) // (workers * 4))
+        for input_file, output_file, error, elapsed, size in executor.map(batch_compile_job, jobs, chunksize=chunksize):
+            total_bytes += size
+            if error is None:
+                print(f'ok     {input_file} -> {output_file} ({elapsed * 1000:.1f} ms)')
+            else:
+                failures += 1
+                print(f'error  {input_file}: {error}')
+    elapsed = time.perf_counter() - start
+
+    print(f'{len(jobs) - failures} compiled, {failures} failed, {len(jobs)} files in {elapsed:.2f} s with {workers} workers')
+    print(f'{len(jobs) / elapsed:.1f} files/s, {total_bytes / 1024 / elapsed:.1f} KB/s')
+    return 1 if failures else 0
+
+def main(argv=None):
+    # The command line interface. Returns the exit status
+    parser = argparse.ArgumentParser(description='Transpile Python code and optionally run it.')
+
+    parser.add_argument('--in', dest='input_file', default='example.pye', help='input Python file path (default: example.pye)')
+    parser.add_argument('--out', dest='output_file', default='example.py', help='output transpiled file path (default: example.py)')
+    parser.add_argument('--run', action='store_true', help='run the transpiled code')
+    parser.add_argument('--stream', action='store_true', help='tokenize, parse and transpile the input incrementally with bounded memory')
+    parser.add_argument('-O', dest='optimize', type=int, choices=(0, 1, 2, 3), nargs='?', const=1, default=0, help='optimization level: 1 folds constants and drops dead branches, 2 also propagates constant 🔢 variables, 3 also hoists loop invariant expressions and reuses repeated ones (default: 0, -O alone means 1)')
+    parser.add_argument('--function', action='store_true', help='wrap the program in a main() function so that variables are fast locals')
+    parser.add_argument('--numpy', action='store_true', help='run 🔂 loops that only do 🔢 arithmetic with NumPy when it is installed, falling back to the plain loop otherwise')
+    parser.add_argument('--budget', type=int, metavar='STEPS', default=None, help='make the program raise BudgetExceeded, with the position of the loop, when it would run more than this many 🐳 and 🔂 loop iterations in total')
+    parser.add_argument('--watch', action='store_true', help='recompile the changed statements whenever the input file changes')
+    parser.add_argument('--batch', nargs='+', metavar='PATH', help='transpile every .pye file under these directories or globs')
+    parser.add_argument('--out-dir', default='build', help='output directory mirroring the --batch inputs (default: build)')
+    parser.add_argument('--jobs', type=int, default=None, help='number of worker processes for --batch (default: available cores)')
+    parser.add_argument('--no-cache', action='store_true', help='always compile from scratch instead of using the compilation cache')
+    parser.add_argument('--cache-dir', default=None, help='compilation cache directory (default: __pymojicache__ next to the input file)')
+    parser.add_argument('--cache-size', type=int, default=64, help='maximum size of the compilation cache in MB (default: 64)')
+    parser.add_argument('--cache-ast', action='store_true', help='also store the parsed AST in the compilation cache')
+    parser.add_argument('--profile', action='store_true', help='print the time of every compiler phase, token and AST node counts and sizes to stderr')
+    parser.add_argument('--stats-json', metavar='FILE', default=None, help='write the --profile measurements as JSON to this file (- for stdout)')
+    parser.add_argument('--source-map', action='store_true', help='also write the source map of the output, mapping every generated line to its emojicode line, to OUTPUT FILE.map')
+    parser.add_argument('--profile-run', action='store_true', help='run the transpiled code under a sampling profiler and report the hottest emojicode lines and blocks to stderr (implies --source-map)')
+    parser.add_argument('--trace-memory', action='store_true', help='also report the peak traced memory of every phase (slows the compilation down)')
+    parser.add_argument('--emit-tokens', metavar='FILE', default=None, help='write the tokens of the input to this binary file instead of transpiling it (see pymoji_binary)')
+    parser.add_argument('--emit-ast', metavar='FILE', default=None, help='write the parsed AST of the input to this binary file instead of transpiling it (see pymoji_binary)')
+    parser.add_argument('--from-ast', metavar='FILE', default=None, help='transpile the AST stored in this file by --emit-ast instead of the --in input, always from scratch')
+
+    args = parser.parse_args(argv)
+
+    profiling = args.profile or args.stats_json or args.trace_memory
+    if profiling and (args.batch or args.watch or args.stream):
+        parser.error('--profile, --stats-json and --trace-memory cannot be combined with --batch, --watch or --stream')
+
+    if args.profile_run:
+        if args.batch or args.watch or args.stream:
+            parser.error('--profile-run cannot be combined with --batch, --watch or --stream')
+        args.source_map = True
+    if args.source_map and (args.watch or args.stream):
+        parser.error('--source-map cannot be combined with --watch or --stream')
+    if args.budget is not None:
+        if args.budget < 0:
+            parser.error('--budget must not be negative')
+        if args.watch or args.stream:
+            parser.error('--budget cannot be combined with --watch or --stream')
+
+    emitting = args.emit_tokens or args.emit_ast
+    if emitting and (args.batch or args.watch or args.stream or args.run or args.from_ast or profiling or args.source_map):
+        parser.error('--emit-tokens and --emit-ast cannot be combined with --batch, --watch, --stream, --run, --from-ast, --profile or --source-map')
+    if args.from_ast and (args.batch or args.watch or args.stream or args.source_map or args.profile_run):
+        parser.error('--from-ast cannot be combined with --batch, --watch, --stream, --source-map or --profile-run')
+
+    if emitting:
+        emit_file(args.input_file, args.emit_tokens, args.emit_ast)
+        for path in (args.emit_tokens, args.emit_ast):
+            if path:
+                print(f'{"Tokens" if path is args.emit_tokens else "AST"} written to {path}')
+        return 0
+
+    if args.batch:
+        if args.run:
+            parser.error('--run cannot be combined with --batch')
+        return batch_compile(args)
+
+    if args.watch:
+        if args.run or args.stream or args.numpy:
+            parser.error('--watch cannot be combined with --run, --stream or --numpy')
+        if args.optimize:
+            # The optimizer needs the whole program, the watched statements are compiled one by one
+            parser.error('--watch cannot be combined with -O')
+        watch_file(args.input_file, args.output_file, args.function)
+        return 0
+
+    stats = CompileStats(args.trace_memory) if profiling else None
+
+    def report_stats():
+        report = stats.finish()
+        if args.profile or args.trace_memory:
+            print(stats.format(), file=sys.stderr)
+        if args.stats_json == '-':
+            print(json.dumps(report, indent=2))
+        elif args.stats_json:
+            with open(args.stats_json, 'w', encoding='utf-8') as file:
+                json.dump(report, file, indent=2)
+
+    if args.from_ast:
+        cache = None
+        try:
+            python_code = compile_tree_file(args.from_ast, args.output_file, args.optimize, args.function, stats, args.numpy, args.budget)
+        except RuntimeError as error:
+            if stats is not None:
+                stats.error = str(error)
+                report_stats()
+            raise
+    elif args.stream:
+        # The streaming mode never holds the whole output, so it always compiles from scratch
+        cache = None
+        python_code = None
+        stream_compile_file(args.input_file, args.output_file, args.optimize, args.function, args.numpy)
+    else:
+        cache = None if args.no_cache else open_cache(args.input_file, args.cache_dir, args.cache_size)
+        try:
+            python_code = compile_file(args.input_file, args.output_file, cache, args.cache_ast, args.optimize, args.function, stats, args.source_map, args.numpy, args.budget)
+        except RuntimeError as error:
+            if stats is not None:
+                stats.error = str(error)
+                report_stats()
+            raise
     print(f'Python code transpiled to {args.output_file}')
 
-if args.run:
-    os.system(f'python {args.output_file}')
+    status = 0
+    if args.run or args.profile_run:
+        # Runs in this process, with the line numbers of the output file. The front end never runs
+        # a second time: with a cache the code object comes from the entry compile_file just
+        # stored, which keeps it for the next runs, otherwise the generated text is compiled,
+        # --stream reading it back from the output file
+        if cache is not None or args.profile_run:
+            with open(args.input_file, 'r', encoding='utf-8') as file:
+                emojicode = file.read()
+        with measure(stats, 'load'):
+            if cache is not None:
+                code = compile_code(emojicode, cache, args.cache_ast, args.output_file, args.optimize, args.function, vectorize=args.numpy, budget=args.budget)
+            else:
+                if python_code is None:
+                    with open(args.output_file, 'r', encoding='utf-8') as file:
+                        python_code = file.read()
+                code = compile(python_code, args.output_file, 'exec')
+        with measure(stats, 'run'):
+            if args.profile_run:
+                status, counts = pymoji_profiler.profile_run(code, args.output_file)
+                source_map = load_source_map(args.output_file + '.map')
+                print(pymoji_profiler.format_report(counts, source_map['mappings'], emojicode.splitlines()), file=sys.stderr)
+            else:
+                status = pymoji_runtime.run(code)
+    if stats is not None:
+        report_stats()
+    return status
+
+if __name__ == '__main__':
+    sys.exit(main())
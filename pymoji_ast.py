@@ -0,0 +1,139 @@
+import sys
+
+# AST node classes built by pymoji.Parser. Literal kinds are resolved by the parser, so the
+# later passes never have to look at the source text of a token again
+
+class Node:
+    # offset and end_offset locate the node in the source. They are set by the parser (see
+    # pymoji.Parser) and left out of the comparisons, which only look at the fields of the subclass
+    __slots__ = ('offset', 'end_offset')
+    kind = 'node'
+
+    @property
+    def span(self):
+        # Raises AttributeError for nodes without a position, like the ones built by the optimizer
+        return (self.offset, self.end_offset)
+
+    def __eq__(self, other):
+        return type(self) is type(other) and all(getattr(self, field) == getattr(other, field) for field in self.__slots__)
+
+    # Nodes compare by value but the optimizer updates them in place, so they are unhashable on
+    # purpose. Passes that need a set or a dict of nodes key them by id(node)
+    __hash__ = None
+
+    def __repr__(self):
+        values = ', '.join(repr(getattr(self, field)) for field in self.__slots__)
+        return f'{type(self).__name__}({values})'
+
+class VariableDeclaration(Node):
+    __slots__ = ('var_type', 'identifier', 'value')
+    kind = 'variable_declaration'
+
+    def __init__(self, var_type, identifier, value):
+        self.var_type = var_type
+        self.identifier = identifier
+        self.value = value
+
+class VariableAssignment(Node):
+    __slots__ = ('identifier', 'value')
+    kind = 'variable_assignment'
+
+    def __init__(self, identifier, value):
+        self.identifier = identifier
+        self.value = value
+
+class Output(Node):
+    __slots__ = ('value',)
+    kind = 'output'
+
+    def __init__(self, value):
+        self.value = value
+
+class Input(Node):
+    # Both the 📥 statement and the 📥 expression, prompt is an expression or None
+    __slots__ = ('prompt',)
+    kind = 'input'
+
+    def __init__(self, prompt):
+        self.prompt = prompt
+
+class Conditional(Node):
+    # else_body is None when there is no ☝️🤓 branch
+    __slots__ = ('condition', 'body', 'else_body')
+    kind = 'conditional'
+
+    def __init__(self, condition, body, else_body=None):
+        self.condition = condition
+        self.body = body
+        self.else_body = else_body
+
+class WhileLoop(Node):
+    __slots__ = ('condition', 'body')
+    kind = 'while_loop'
+
+    def __init__(self, condition, body):
+        self.condition = condition
+        self.body = body
+
+class ForLoop(Node):
+    # end is the int bound of the ⛳ range
+    __slots__ = ('variable', 'end', 'body')
+    kind = 'for_loop'
+
+    def __init__(self, variable, end, body):
+        self.variable = variable
+        self.end = end
+        self.body = body
+
+class Operation(Node):
+    __slots__ = ('left', 'operator', 'right')
+    kind = 'operation'
+
+    def __init__(self, left, operator, right):
+        self.left = left
+        self.operator = operator
+        self.right = right
+
+class NumberLiteral(Node):
+    __slots__ = ('value',)
+    kind = 'number'
+
+    def __init__(self, value):
+        self.value = value
+
+class StringLiteral(Node):
+    # value is the text between the 🌪️ quotes
+    __slots__ = ('value',)
+    kind = 'string'
+
+    def __init__(self, value):
+        self.value = value
+
+class BooleanLiteral(Node):
+    __slots__ = ('value',)
+    kind = 'boolean'
+
+    def __init__(self, value):
+        self.value = value
+
+class Identifier(Node):
+    __slots__ = ('name',)
+    kind = 'identifier'
+
+    def __init__(self, name):
+        # Names are interned so every occurrence of a variable shares one string
+        self.name = sys.intern(name)
+
+class VectorLoop(Node):
+    # A 🔂 loop the --numpy backend runs with pymoji_numpy, built by pymoji.Vectorizer after the
+    # analysis. loop is the original ForLoop, kept for the scalar fallback, plan the steps passed
+    # to pymoji_numpy.vectorize, inputs the variables whose values it reads and targets the
+    # variables it assigns, in the order of its results
+    __slots__ = ('loop', 'plan', 'inputs', 'targets')
+    kind = 'vector_loop'
+
+    def __init__(self, loop, plan, inputs, targets):
+        self.loop = loop
+        self.plan = plan
+        self.inputs = inputs
+        self.targets = targets
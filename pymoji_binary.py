@@ -0,0 +1,376 @@
+import sys
+import mmap
+import array
+import struct
+
+from pymoji_ast import (
+    VariableDeclaration, VariableAssignment, Output, Input, Conditional, WhileLoop, ForLoop,
+    Operation, NumberLiteral, StringLiteral, BooleanLiteral, Identifier,
+)
+
+# Flat binary files of the tokens (pymoji.py --emit-tokens) and of the parsed AST (--emit-ast),
+# for the tools that need them without running the compiler. A file is little endian and made
+# of 32 bit words after its header, so a reader maps it and indexes the words in place:
+#   header   magic b'PYMB', u16 version, u16 content (CONTENT_TOKENS or CONTENT_AST) and eight
+#            u32: string count, string offsets, string data, record count, records, extra
+#            count, extra and root (the positions are byte offsets from the start of the file)
+#   strings  string count + 1 offsets into the UTF-8 data, string i being data[offset i:offset
+#            i + 1]. Every distinct string is stored once and records refer to it by index
+#   records  tokens: 3 words each, kind code, string index of the text, source offset
+#            nodes: 6 words each, kind code | flags << 8, offset, end offset, fields a, b, c
+#   extra    tokens: the string index of the name of every token kind code, so that the codes
+#            of pymoji.TokenKind can change without breaking readers
+#            AST: the lists of node indices of the bodies, each a count followed by the
+#            indices, root being the position of the program in it
+# Node kind codes and the meaning of the fields a, b and c are given by node_kinds below. A field
+# holds a string index, a node index, a list position, or NONE when it is None. A node that
+# appears more than once in the tree is written once. Offsets the node does not have are NONE.
+# A new version is needed whenever any of this changes
+
+MAGIC = b'PYMB'
+VERSION = 1
+CONTENT_TOKENS = 1
+CONTENT_AST = 2
+NONE = 0xFFFFFFFF
+FLOAT = 1
+
+header = struct.Struct('<4sHH8I')
+token_words = 3
+node_words = 6
+
+# The kind code of a node is its position here plus one. The field types are
+#   node, body (a list position), string, int and number (stored as their decimal text, the
+#   FLOAT flag marking floats) and boolean (the word 0 or 1)
+node_kinds = (
+    (VariableDeclaration, ('string', 'string', 'node')),
+    (VariableAssignment, ('string', 'node')),
+    (Output, ('node',)),
+    (Input, ('node',)),
+    (Conditional, ('node', 'body', 'body')),
+    (WhileLoop, ('node', 'body')),
+    (ForLoop, ('string', 'int', 'body')),
+    (Operation, ('node', 'string', 'node')),
+    (NumberLiteral, ('number',)),
+    (StringLiteral, ('string',)),
+    (BooleanLiteral, ('boolean',)),
+    (Identifier, ('string',)),
+)
+kind_codes = {node_class: code for code, (node_class, _) in enumerate(node_kinds, 1)}
+
+def words(values):
+    # A u32 array in the byte order of the files
+    data = array.array('I', values)
+    if sys.byteorder == 'big':
+        data.byteswap()
+    return data
+
+class StringTable:
+    # The interned strings of a file being written
+    def __init__(self):
+        self.indexes = {}
+        self.strings = []
+
+    def add(self, text):
+        index = self.indexes.get(text)
+        if index is None:
+            index = self.indexes[text] = len(self.strings)
+            self.strings.append(text)
+        return index
+
+def pack(content, strings, records, record_count, extra, extra_count, root=0):
+    # The bytes of a file, with every section aligned to 4 bytes
+    data = [string.encode('utf-8') for string in strings.strings]
+    offsets = [0]
+    for text in data:
+        offsets.append(offsets[-1] + len(text))
+    blob = b''.join(data)
+    blob += b'\0' * (-len(blob) % 4)
+    offsets = words(offsets).tobytes()
+    records = records.tobytes()
+
+    string_offsets = header.size
+    string_data = string_offsets + len(offsets)
+    records_start = string_data + len(blob)
+    extra_start = records_start + len(records)
+    head = header.pack(
+        MAGIC, VERSION, content, len(strings.strings), string_offsets, string_data,
+        record_count, records_start, extra_count, extra_start, root,
+    )
+    return b''.join((head, offsets, blob, records, extra.tobytes()))
+
+def encode_tokens(tokens, kind_names):
+    # tokens are (kind code, text, offset) tuples like the ones of pymoji.tokenize, kind_names
+    # the name of every code
+    strings = StringTable()
+    kinds = words(strings.add(name) for name in kind_names)
+    records = array.array('I')
+    count = 0
+    for kind, text, offset in tokens:
+        records.extend((kind, strings.add(text), offset & NONE))
+        count += 1
+    if sys.byteorder == 'big':
+        records.byteswap()
+    return pack(CONTENT_TOKENS, strings, records, count, kinds, len(kind_names))
+
+def encode_ast(ast):
+    # ast is a list of statements as built by pymoji.Parser. The tree is walked with an explicit
+    # stack, chains of operations can nest deeper than the recursion limit
+    strings = StringTable()
+    indexes = {}
+    nodes = []
+    stack = list(reversed(ast))
+    while stack:
+        node = stack.pop()
+        if id(node) in indexes:
+            continue
+        if type(node) not in kind_codes:
+            raise RuntimeError(f'{type(node).__name__} nodes cannot be written to AST files')
+        indexes[id(node)] = len(nodes)
+        nodes.append(node)
+        children = []
+        for field, field_type in zip(node.__slots__, node_kinds[kind_codes[type(node)] - 1][1]):
+            value = getattr(node, field)
+            if value is None:
+                continue
+            if field_type == 'node':
+                children.append(value)
+            elif field_type == 'body':
+                children.extend(value)
+        stack.extend(reversed(children))
+
+    lists = array.array('I')
+
+    def add_list(body):
+        position = len(lists)
+        lists.append(len(body))
+        lists.extend(indexes[id(node)] for node in body)
+        return position
+
+    records = array.array('I')
+    for node in nodes:
+        code = kind_codes[type(node)]
+        flags = 0
+        fields = [NONE, NONE, NONE]
+        for number, (field, field_type) in enumerate(zip(node.__slots__, node_kinds[code - 1][1])):
+            value = getattr(node, field)
+            if value is None:
+                continue
+            if field_type == 'node':
+                fields[number] = indexes[id(value)]
+            elif field_type == 'body':
+                fields[number] = add_list(value)
+            elif field_type == 'boolean':
+                fields[number] = int(value)
+            elif field_type == 'string':
+                fields[number] = strings.add(value)
+            else:
+                if type(value) is float:
+                    flags |= FLOAT
+                fields[number] = strings.add(repr(value))
+        records.extend((
+            code | flags << 8,
+            getattr(node, 'offset', NONE),
+            getattr(node, 'end_offset', NONE),
+            *fields,
+        ))
+    root = add_list(ast)
+    if sys.byteorder == 'big':
+        records.byteswap()
+        lists.byteswap()
+    return pack(CONTENT_AST, strings, records, len(nodes), lists, len(lists), root)
+
+def write_tokens(path, tokens, kind_names):
+    with open(path, 'wb') as file:
+        file.write(encode_tokens(tokens, kind_names))
+
+def write_ast(path, ast):
+    with open(path, 'wb') as file:
+        file.write(encode_ast(ast))
+
+class BinaryFile:
+    # A file written by this module, mapped in memory. Nothing is decoded up front: records are
+    # read from the mapping when asked for and strings decoded once on first use, so a tool can
+    # look at a few nodes of a large file without reading the rest. Node indices go from 0 to
+    # len(file) - 1, the records of a tokens file are its tokens
+    def __init__(self, path):
+        with open(path, 'rb') as file:
+            try:
+                self.map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                # An empty file cannot be mapped
+                raise RuntimeError(f'{path} is not a pymoji binary file') from None
+        try:
+            self.view = memoryview(self.map)
+            if len(self.map) < header.size:
+                raise RuntimeError(f'{path} is not a pymoji binary file')
+            (magic, version, self.content, self.string_count, string_offsets, self.string_data,
+             self.count, records, extra_count, extra, self.root) = header.unpack_from(self.map)
+            if magic != MAGIC:
+                raise RuntimeError(f'{path} is not a pymoji binary file')
+            if version != VERSION:
+                raise RuntimeError(f'{path} has version {version} of the pymoji binary format, this reader only knows version {VERSION}')
+            record_words = token_words if self.content == CONTENT_TOKENS else node_words
+            self.string_offsets = self.section(string_offsets, self.string_count + 1)
+            self.records = self.section(records, self.count * record_words)
+            self.extra = self.section(extra, extra_count)
+        except BaseException:
+            self.close()
+            raise
+        self.strings = {}
+
+    def section(self, start, count):
+        # The words of a section, in place unless the machine is big endian
+        view = self.view[start:start + 4 * count].cast('I')
+        if sys.byteorder == 'big':
+            view = words(view)
+            view.byteswap()
+        return view
+
+    def close(self):
+        for name in ('string_offsets', 'records', 'extra', 'view'):
+            view = self.__dict__.pop(name, None)
+            if type(view) is memoryview:
+                view.release()
+        self.map.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self):
+        return self.count
+
+    def string(self, index):
+        if index == NONE:
+            return None
+        text = self.strings.get(index)
+        if text is None:
+            start = self.string_data + self.string_offsets[index]
+            end = self.string_data + self.string_offsets[index + 1]
+            text = self.strings[index] = str(self.view[start:end], 'utf-8')
+        return text
+
+    def expect(self, content):
+        if self.content != content:
+            raise RuntimeError(f'this is not {"a tokens" if content == CONTENT_TOKENS else "an AST"} file')
+
+    # Tokens
+
+    def tokens(self):
+        # Yields (kind name, text, offset) tuples
+        self.expect(CONTENT_TOKENS)
+        names = [self.string(index) for index in self.extra]
+        records = self.records
+        for start in range(0, self.count * token_words, token_words):
+            offset = records[start + 2]
+            yield names[records[start]], self.string(records[start + 1]), -1 if offset == NONE else offset
+
+    # AST
+
+    def program(self):
+        # The node indices of the top level statements
+        return self.body(self.root)
+
+    def body(self, position):
+        if position == NONE:
+            return None
+        self.expect(CONTENT_AST)
+        count = self.extra[position]
+        return list(self.extra[position + 1:position + 1 + count])
+
+    def layout(self, index):
+        # The pymoji_ast class of a node and the types of its fields
+        return node_kinds[(self.records[index * node_words] & 0xFF) - 1]
+
+    def kind(self, index):
+        # The kind of a node, like 'operation' (see pymoji_ast)
+        return self.layout(index)[0].kind
+
+    def span(self, index):
+        # (offset, end_offset) of a node in the source, None for nodes without a position
+        start = index * node_words
+        offset = self.records[start + 1]
+        return None if offset == NONE else (offset, self.records[start + 2])
+
+    def fields(self, index):
+        # The fields of a node by name, with node indices for the child nodes and lists of node
+        # indices for the bodies
+        start = index * node_words
+        node_class, field_types = self.layout(index)
+        flags = self.records[start] >> 8
+        fields = {}
+        for number, (field, field_type) in enumerate(zip(node_class.__slots__, field_types)):
+            value = self.records[start + 3 + number]
+            if value == NONE:
+                fields[field] = None
+            elif field_type == 'node':
+                fields[field] = value
+            elif field_type == 'body':
+                fields[field] = self.body(value)
+            elif field_type == 'boolean':
+                fields[field] = bool(value)
+            elif field_type == 'string':
+                fields[field] = self.string(value)
+            elif field_type == 'number' and flags & FLOAT:
+                fields[field] = float(self.string(value))
+            else:
+                fields[field] = int(self.string(value))
+        return fields
+
+    def children(self, index):
+        # The indices of the child nodes of a node, in source order
+        children = []
+        node_class, field_types = self.layout(index)
+        fields = self.fields(index)
+        for field, field_type in zip(node_class.__slots__, field_types):
+            value = fields[field]
+            if value is None:
+                continue
+            if field_type == 'node':
+                children.append(value)
+            elif field_type == 'body':
+                children.extend(value)
+        return children
+
+    def build(self):
+        # The pymoji_ast statements of the program, ready for pymoji.SemanticAnalyzer. Nodes
+        # shared in the file are shared in the tree. Children are built before their parents
+        # with an explicit stack
+        self.expect(CONTENT_AST)
+        built = {}
+        stack = [(index, False) for index in reversed(self.program())]
+        while stack:
+            index, ready = stack.pop()
+            if index in built:
+                continue
+            if not ready:
+                stack.append((index, True))
+                stack.extend((child, False) for child in reversed(self.children(index)) if child not in built)
+                continue
+            node_class, field_types = self.layout(index)
+            fields = self.fields(index)
+            for field, field_type in zip(node_class.__slots__, field_types):
+                value = fields[field]
+                if value is None:
+                    continue
+                if field_type == 'node':
+                    fields[field] = built[value]
+                elif field_type == 'body':
+                    fields[field] = [built[child] for child in value]
+            node = node_class(*fields.values())
+            span = self.span(index)
+            if span is not None:
+                node.offset, node.end_offset = span
+            built[index] = node
+        return [built[index] for index in self.program()]
+
+def load_ast(path):
+    # The statements of an AST file
+    with BinaryFile(path) as file:
+        return file.build()
+
+def load_tokens(path):
+    with BinaryFile(path) as file:
+        return list(file.tokens())
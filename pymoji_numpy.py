@@ -0,0 +1,122 @@
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Runtime of the 🔂 loops vectorized by pymoji.py --numpy. The loop body is a plan of steps over
+# the loop variable i, with every iteration computed at once on a float64 array of i values:
+#   ('reduce', '+', input, terms)  acc = acc ± term ± term..., terms being (sign, tree) pairs
+#   ('reduce', '*', input, terms)  acc = acc 🙅 term 🙅 term..., signs are all 1
+#   ('last', tree)                 x = tree, only the value of the last iteration is kept
+# where trees are ('i',), ('n', number), ('v', input) or (operator, left, right) with operator
+# one of + - * /. Reductions run with numpy.add/multiply.accumulate, which adds up in order like
+# the scalar loop does (numpy.sum would not). The results match the scalar loop exactly or are
+# not used: an int value is only trusted below 2**53, where float64 holds it exactly, floats must
+# stay finite and no divisor may be zero, since the scalar loop raises ZeroDivisionError there.
+# Otherwise vectorize returns None and the generated code runs the scalar loop instead
+
+exact_limit = 2 ** 53
+# Iterations computed at once, which bounds the memory of the temporary arrays
+chunk_size = 1 << 16
+
+class Fallback(Exception):
+    pass
+
+def vectorize(count, plan, inputs):
+    # Returns the values of the assigned variables, in the order of the plan, followed by the one
+    # of the loop variable, or None when the loop has to run scalar
+    if numpy is None or count <= 0:
+        return None
+    try:
+        with numpy.errstate(all='ignore'):
+            return run(count, plan, inputs)
+    except Fallback:
+        return None
+
+def run(count, plan, inputs):
+    carries = []
+    for step in plan:
+        if step[0] == 'reduce':
+            carries.append(scalar(inputs[step[2]]))
+        else:
+            carries.append(None)
+
+    for start in range(0, count, chunk_size):
+        index = numpy.arange(start, min(start + chunk_size, count), dtype=numpy.float64)
+        for number, step in enumerate(plan):
+            if step[0] == 'reduce':
+                carries[number] = reduce_chunk(step, index, inputs, carries[number])
+            else:
+                value, is_int = evaluate(step[1], index, inputs)
+                carries[number] = (value[-1] if type(value) is numpy.ndarray else value, is_int)
+
+    results = [int(value) if is_int else float(value) for value, is_int in carries]
+    results.append(count - 1)
+    return tuple(results)
+
+def reduce_chunk(step, index, inputs, carry):
+    _, operator, _, terms = step
+    carry_value, is_int = carry
+    columns = []
+    for sign, tree in terms:
+        value, term_int = evaluate(tree, index, inputs)
+        is_int = is_int and term_int
+        value = numpy.broadcast_to(value, index.shape)
+        columns.append(-value if sign < 0 else value)
+
+    # The terms of every iteration follow each other, after the value carried from the last chunk
+    sequence = numpy.empty(len(index) * len(columns) + 1)
+    sequence[0] = carry_value
+    sequence[1:] = numpy.stack(columns, axis=1).ravel()
+    if operator == '+':
+        partial = numpy.add.accumulate(sequence)
+    else:
+        partial = numpy.multiply.accumulate(sequence)
+    check(partial, is_int)
+    return partial[-1], is_int
+
+def scalar(value):
+    # An input value as (float, is_int)
+    if type(value) is int:
+        if abs(value) >= exact_limit:
+            raise Fallback
+        return float(value), True
+    elif type(value) is float:
+        check(value, False)
+        return value, False
+    raise Fallback
+
+def evaluate(tree, index, inputs):
+    # Returns the value of a tree, an array when it depends on i, and whether the scalar loop
+    # would compute it as an int
+    kind = tree[0]
+    if kind == 'i':
+        return index, True
+    elif kind == 'n':
+        return scalar(tree[1])
+    elif kind == 'v':
+        return scalar(inputs[tree[1]])
+
+    left, left_int = evaluate(tree[1], index, inputs)
+    right, right_int = evaluate(tree[2], index, inputs)
+    if kind == '+':
+        value = left + right
+    elif kind == '-':
+        value = left - right
+    elif kind == '*':
+        value = left * right
+    else:
+        if numpy.any(right == 0):
+            raise Fallback
+        value = left / right
+        left_int = right_int = False
+    is_int = left_int and right_int
+    check(value, is_int)
+    return value, is_int
+
+def check(value, is_int):
+    if is_int:
+        if numpy.max(numpy.abs(value)) >= exact_limit:
+            raise Fallback
+    elif not numpy.all(numpy.isfinite(value)):
+        raise Fallback
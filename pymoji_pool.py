@@ -0,0 +1,251 @@
+import io
+import os
+import sys
+import json
+import math
+import time
+import signal
+import marshal
+import argparse
+import resource
+import tempfile
+import concurrent.futures
+
+import pymoji
+import pymoji_runtime
+
+# Execution pool for running many programs against many inputs, like a judge. Every program is
+# compiled once in the parent and its code object is handed to warm worker processes. For each
+# (program, input) pair a worker forks a child, which applies the limits to itself and runs the
+# program on the input, so a run that crashes, loops or eats memory never takes the worker down:
+#   CPU time     RLIMIT_CPU, the kernel sends SIGXCPU
+#   wall time    a real-time interval timer with the default SIGALRM action, which kills the child
+#   memory       RLIMIT_AS, allocations past it raise MemoryError
+#   output       RLIMIT_FSIZE on the captured stdout file, the kernel sends SIGXFSZ
+#   steps        compiled into the program (see pymoji.Transpiler), which raises BudgetExceeded
+# The worker then reaps the child with wait4, which also gives its CPU time and peak memory
+
+class Limits:
+    __slots__ = ('cpu_time', 'wall_time', 'memory', 'output', 'steps')
+
+    def __init__(self, cpu_time=2, wall_time=5.0, memory=256 * 1024 * 1024, output=16 * 1024 * 1024, steps=None):
+        # cpu_time in whole seconds, wall_time in seconds, memory and output in bytes, steps in
+        # 🐳 and 🔂 loop iterations counted together (None for no limit)
+        self.cpu_time = cpu_time
+        self.wall_time = wall_time
+        self.memory = memory
+        self.output = output
+        self.steps = steps
+
+# Characters of an error message kept in a result. The child writes its whole result before the
+# parent reads it, so the result has to fit in the pipe buffer (64 KiB on Linux), which it does
+# even with every character escaped by json.dumps as a \uXXXX surrogate pair
+error_size = 2048
+
+signal_verdicts = {
+    signal.SIGXCPU: 'cpu-time',
+    signal.SIGALRM: 'wall-time',
+    signal.SIGXFSZ: 'output-limit',
+}
+
+# State of a worker process, set up once by init_worker
+programs = {}
+inputs = []
+limits = None
+output_file = None
+result_pipe = None
+
+def init_worker(compiled_programs, worker_inputs, worker_limits):
+    global programs, inputs, limits, output_file, result_pipe
+    programs = {name: marshal.loads(code) for name, code in compiled_programs.items()}
+    inputs = worker_inputs
+    limits = worker_limits
+    output_file = tempfile.TemporaryFile()
+    result_pipe = os.pipe()
+    os.set_blocking(result_pipe[0], False)
+
+def run_child(code, stdin_text):
+    # Runs in the forked child and never returns
+    status = 1
+    try:
+        resource.setrlimit(resource.RLIMIT_CPU, (limits.cpu_time, limits.cpu_time + 1))
+        resource.setrlimit(resource.RLIMIT_AS, (limits.memory, limits.memory))
+        resource.setrlimit(resource.RLIMIT_FSIZE, (limits.output, limits.output))
+        signal.signal(signal.SIGALRM, signal.SIG_DFL)
+        # Python ignores SIGXFSZ, so writes past the output limit would only fail
+        signal.signal(signal.SIGXFSZ, signal.SIG_DFL)
+        signal.setitimer(signal.ITIMER_REAL, limits.wall_time)
+
+        stdout = open(output_file.fileno(), 'w', encoding='utf-8', closefd=False)
+        runtime = pymoji_runtime.Runtime(io.StringIO(stdin_text), stdout)
+        error = pymoji_runtime.execute(code, runtime)
+        runtime.flush()
+        if error is None:
+            result = {'verdict': 'ok', 'error': None}
+            status = 0
+        elif isinstance(error, MemoryError):
+            result = {'verdict': 'memory', 'error': 'MemoryError'}
+        elif isinstance(error, pymoji_runtime.BudgetExceeded):
+            result = {'verdict': 'budget', 'error': str(error)[-error_size:]}
+        else:
+            # The end of the traceback has the exception itself
+            result = {'verdict': 'error', 'error': pymoji_runtime.format_error(error)[-error_size:]}
+        result['lines_read'] = runtime.lines_read
+        data = json.dumps(result).encode('ascii')
+        while data:
+            data = data[os.write(result_pipe[1], data):]
+    except BaseException:
+        pass
+    finally:
+        os._exit(status)
+
+def run_case(case):
+    program_name, input_index = case
+    output_file.seek(0)
+    output_file.truncate()
+    sys.stdout.flush()
+    sys.stderr.flush()
+
+    start = time.perf_counter()
+    pid = os.fork()
+    if pid == 0:
+        run_child(programs[program_name], inputs[input_index][1])
+    _, wait_status, usage = os.wait4(pid, 0)
+    wall_time = time.perf_counter() - start
+
+    try:
+        result = json.loads(read_result())
+    except ValueError:
+        # The child died before reporting
+        result = {'verdict': 'error', 'error': None, 'lines_read': None}
+        if os.WIFSIGNALED(wait_status):
+            number = os.WTERMSIG(wait_status)
+            result['error'] = signal.Signals(number).name
+            if number == signal.SIGKILL and usage.ru_utime + usage.ru_stime >= limits.cpu_time:
+                # Past the hard CPU limit
+                result['verdict'] = 'cpu-time'
+            else:
+                result['verdict'] = signal_verdicts.get(number, 'killed')
+
+    output_file.seek(0)
+    result.update(
+        program=program_name,
+        input=inputs[input_index][0],
+        exit_status=os.waitstatus_to_exitcode(wait_status),
+        stdout=output_file.read().decode('utf-8', 'replace'),
+        wall_time=wall_time,
+        cpu_time=usage.ru_utime + usage.ru_stime,
+        max_rss=usage.ru_maxrss * 1024,
+    )
+    return result
+
+def read_result():
+    # The child is gone, so the pipe holds everything it wrote. All of it is read, so that a
+    # result cut short by the death of its child never runs into the next one
+    chunks = []
+    while True:
+        try:
+            chunk = os.read(result_pipe[0], 65536)
+        except BlockingIOError:
+            break
+        chunks.append(chunk)
+    return b''.join(chunks)
+
+def percentile(sorted_values, percent):
+    # Nearest rank percentile
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(percent / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+class ExecutionPool:
+    def __init__(self, jobs=None, limits=None):
+        if jobs:
+            self.jobs = jobs
+        elif hasattr(os, 'sched_getaffinity'):
+            self.jobs = len(os.sched_getaffinity(0))
+        else:
+            self.jobs = os.cpu_count() or 1
+        self.limits = limits or Limits()
+
+    def compile(self, sources):
+        # Compiles every program once. Returns the marshalled code objects and the compile errors
+        compiled = {}
+        errors = {}
+        for name, source in sources.items():
+            try:
+                compiled[name] = marshal.dumps(pymoji.compile_code(source, filename=f'<{name}>', budget=self.limits.steps))
+            except (RuntimeError, SyntaxError) as error:
+                errors[name] = str(error)
+        return compiled, errors
+
+    def run(self, sources, cases):
+        # sources maps program names to emojicode and cases is a list of (name, stdin text) pairs.
+        # Yields the result of every run, in order, then the compile errors are in self.errors
+        compiled, self.errors = self.compile(sources)
+        tasks = [(name, index) for name in compiled for index in range(len(cases))]
+        if not tasks:
+            return
+        workers = max(1, min(self.jobs, len(tasks)))
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(compiled, cases, self.limits)) as executor:
+            chunksize = max(1, len(tasks) // (workers * 8))
+            yield from executor.map(run_case, tasks, chunksize=chunksize)
+
+def summarize(results, elapsed, workers):
+    verdicts = {}
+    for result in results:
+        verdicts[result['verdict']] = verdicts.get(result['verdict'], 0) + 1
+    latencies = sorted(result['wall_time'] for result in results)
+    max_rss = max((result['max_rss'] for result in results), default=0)
+    lines = [
+        f'{len(results)} runs in {elapsed:.2f} s with {workers} workers, {len(results) / elapsed:.1f} runs/s',
+        'verdicts: ' + ', '.join(f'{verdict} {count}' for verdict, count in sorted(verdicts.items())),
+        f'latency p50 {percentile(latencies, 50) * 1000:.1f} ms, p90 {percentile(latencies, 90) * 1000:.1f} ms, '
+        f'p99 {percentile(latencies, 99) * 1000:.1f} ms, max RSS {max_rss / 1024 / 1024:.1f} MB',
+    ]
+    return '\n'.join(lines)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run emojicode programs against many inputs in a pool of sandboxed workers.')
+    parser.add_argument('programs', nargs='+', metavar='PROGRAM', help='.pye programs to run')
+    parser.add_argument('--inputs', nargs='+', metavar='FILE', default=[], help='stdin files, every program runs once per file (default: one run with empty stdin)')
+    parser.add_argument('--jobs', type=int, default=None, help='number of worker processes (default: available cores)')
+    parser.add_argument('--cpu-time', type=int, default=2, help='CPU time limit per run in seconds (default: 2)')
+    parser.add_argument('--wall-time', type=float, default=5.0, help='wall time limit per run in seconds (default: 5)')
+    parser.add_argument('--memory', type=int, default=256, help='address space limit per run in MB (default: 256)')
+    parser.add_argument('--output-limit', type=int, default=16, help='stdout limit per run in MB (default: 16)')
+    parser.add_argument('--budget', type=int, default=None, help='🐳 and 🔂 loop iterations allowed per run, counted together (default: no limit)')
+    parser.add_argument('--results', default=None, help='write every result, stdout included, to this JSON lines file')
+    args = parser.parse_args()
+
+    sources = {}
+    for path in args.programs:
+        with open(path, 'r', encoding='utf-8') as file:
+            sources[path] = file.read()
+    cases = []
+    for path in args.inputs:
+        with open(path, 'r', encoding='utf-8') as file:
+            cases.append((path, file.read()))
+    if not cases:
+        cases.append(('<empty>', ''))
+
+    pool = ExecutionPool(args.jobs, Limits(args.cpu_time, args.wall_time, args.memory * 1024 * 1024, args.output_limit * 1024 * 1024, args.budget))
+    start = time.perf_counter()
+    results = []
+    results_file = open(args.results, 'w', encoding='utf-8') if args.results else None
+    try:
+        for result in pool.run(sources, cases):
+            results.append(result)
+            print(f'{result["verdict"]:<12} {result["program"]} < {result["input"]} ({result["wall_time"] * 1000:.1f} ms)')
+            if results_file:
+                results_file.write(json.dumps(result, ensure_ascii=False) + '\n')
+    finally:
+        if results_file:
+            results_file.close()
+    elapsed = time.perf_counter() - start
+
+    for name, error in pool.errors.items():
+        print(f'error  {name}: {error}')
+    if results:
+        print(summarize(results, elapsed, max(1, min(pool.jobs, len(results)))))
+    sys.exit(1 if pool.errors else 0)
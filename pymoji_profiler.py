@@ -0,0 +1,133 @@
+import sys
+import dis
+import time
+import threading
+
+import pymoji_runtime
+
+# Sampling profiler behind pymoji.py --profile-run. While the program runs, a background thread
+# looks every interval seconds at the line of the generated code the main thread is on, and the
+# source map turns those lines back into .pye lines. Samples taken inside print and input are
+# charged to the generated line calling them. The report lists the hottest statements, the
+# 🔂/🐳/🍷🗿 blocks with their bodies included and the time per emoji construct
+
+block_emojis = frozenset(('🍷🗿', '🐳', '🔂'))
+
+class LineSampler:
+    def __init__(self, filename, interval=0.001):
+        # filename is the co_filename of the generated code
+        self.filename = filename
+        self.interval = interval
+        self.counts = {}
+        self.lines = {}
+        self.thread_id = threading.get_ident()
+        self.running = False
+        self.thread = None
+        self.switch_interval = None
+
+    def start(self):
+        # The sampler only runs when the main thread releases the GIL, which it does every switch
+        # interval, so that is made as short as the sampling interval
+        self.switch_interval = sys.getswitchinterval()
+        sys.setswitchinterval(min(self.switch_interval, self.interval))
+        self.running = True
+        self.thread = threading.Thread(target=self.sample, name='pymoji-sampler', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        self.thread.join()
+        sys.setswitchinterval(self.switch_interval)
+
+    def sample(self):
+        counts = self.counts
+        while self.running:
+            time.sleep(self.interval)
+            frame = sys._current_frames().get(self.thread_id)
+            while frame is not None and frame.f_code.co_filename != self.filename:
+                frame = frame.f_back
+            # Line 0 stands for samples outside the program
+            if frame is None:
+                line = 0
+            else:
+                line = frame.f_lineno
+                if line is None:
+                    line = self.jump_line(frame.f_code, frame.f_lasti)
+            counts[line] = counts.get(line, 0) + 1
+
+    def jump_line(self, code, offset):
+        # Some instructions have no line, like the jump back of a for loop whose body ends with an
+        # if, and the main thread often releases the GIL right there. A jump is charged to the
+        # line it jumps to, the for loop of that example, anything else to line 0
+        key = (code, offset)
+        line = self.lines.get(key)
+        if line is None:
+            line = 0
+            target = None
+            for instruction in dis.get_instructions(code):
+                if instruction.offset == offset:
+                    if instruction.opcode in dis.hasjrel or instruction.opcode in dis.hasjabs:
+                        target = instruction.argval
+                    break
+            if target is not None:
+                for start, end, number in code.co_lines():
+                    if start <= target < end and number is not None:
+                        line = number
+                        break
+            self.lines[key] = line
+        return line
+
+def profile_run(code, filename, interval=0.001):
+    # Runs a program like pymoji_runtime.run and returns its exit status with the sample counts
+    # of every generated line
+    sampler = LineSampler(filename, interval)
+    sampler.start()
+    try:
+        status = pymoji_runtime.run(code)
+    finally:
+        sampler.stop()
+    return status, sampler.counts
+
+def attribute(counts, mappings):
+    # Spreads the samples of generated lines over the .pye lines. Returns the samples of every
+    # statement, of every block statement with its body and of every emoji, plus the samples
+    # outside the program
+    lines = {}
+    blocks = {}
+    emojis = {}
+    outside = 0
+    for generated_line, count in counts.items():
+        entry = mappings[generated_line - 1] if 0 < generated_line <= len(mappings) else None
+        if entry is None:
+            outside += count
+            continue
+        line, _, emoji, _ = entry
+        lines[line] = lines.get(line, 0) + count
+        emojis[emoji] = emojis.get(emoji, 0) + count
+        while entry is not None:
+            if entry[2] in block_emojis:
+                blocks[entry[0]] = blocks.get(entry[0], 0) + count
+            entry = mappings[entry[3] - 1] if entry[3] else None
+    return lines, blocks, emojis, outside
+
+def format_report(counts, mappings, source_lines, interval=0.001, top=10):
+    total = sum(counts.values())
+    lines, blocks, emojis, outside = attribute(counts, mappings)
+
+    def percent(count):
+        return f'{count / total * 100:6.1f}%' if total else '     -'
+
+    def table(title, samples):
+        rows = [title, f'{"line":>6} {"samples":>8} {"%":>7}  source']
+        for line, count in sorted(samples.items(), key=lambda item: (-item[1], item[0]))[:top]:
+            text = source_lines[line - 1].strip() if line <= len(source_lines) else ''
+            rows.append(f'{line:>6} {count:>8} {percent(count)}  {text}')
+        return rows
+
+    report = [f'{total} samples every {interval * 1000:g} ms, {outside} outside the program']
+    report += table('Hottest statements', lines)
+    report += table('Blocks, bodies included', blocks)
+    report.append('Constructs')
+    for emoji, count in sorted(emojis.items(), key=lambda item: -item[1]):
+        report.append(f'{emoji:>6} {count:>8} {percent(count)}')
+    return '\n'.join(report)
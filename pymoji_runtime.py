@@ -0,0 +1,123 @@
+import os
+import sys
+import builtins
+import traceback
+
+# Runtime of the programs run in-process by pymoji.py --run. The generated code calls print and
+# input, which are bound here to a Runtime:
+#   📤 values are collected and written in blocks of buffer_lines lines
+#   📥 reads stdin in large chunks and splits the lines itself
+# so a program printing or reading a million lines does a handful of writes and reads instead
+# of one per line. When stdin is a terminal the output is flushed and one line is read at a time
+# before every 📥, so prompts still show up in order
+
+class BudgetExceeded(RuntimeError):
+    # Raised by the programs compiled with a budget (pymoji.py --budget) when they have run out of
+    # loop iterations
+    pass
+
+class Runtime:
+    def __init__(self, stdin=None, stdout=None, buffer_lines=4096, chunk_size=1 << 16):
+        self.stdin = stdin if stdin is not None else sys.stdin
+        self.stdout = stdout if stdout is not None else sys.stdout
+        self.buffer_lines = buffer_lines
+        self.chunk_size = chunk_size
+        self.values = []
+        self.pending = ''
+        self.position = 0
+        self.lines_read = 0
+        self.interactive = self.stdin.isatty()
+
+    def print(self, value):
+        self.values.append(value)
+        if len(self.values) >= self.buffer_lines:
+            self.write_values()
+
+    def input(self, prompt=''):
+        # Same behaviour as the input builtin: the prompt has no newline and EOFError is raised
+        # once stdin is exhausted
+        self.lines_read += 1
+        if prompt:
+            self.write_values()
+            self.stdout.write(str(prompt))
+        if self.interactive:
+            self.write_values()
+            self.stdout.flush()
+            line = self.stdin.readline()
+            if not line:
+                raise EOFError('EOF when reading a line')
+            return line[:-1] if line.endswith('\n') else line
+        return self.read_line()
+
+    def read_line(self):
+        while True:
+            newline = self.pending.find('\n', self.position)
+            if newline != -1:
+                line = self.pending[self.position:newline]
+                self.position = newline + 1
+                return line
+            chunk = self.stdin.read(self.chunk_size)
+            if not chunk:
+                if self.position < len(self.pending):
+                    # Last line without a newline
+                    line = self.pending[self.position:]
+                    self.position = len(self.pending)
+                    return line
+                raise EOFError('EOF when reading a line')
+            self.pending = self.pending[self.position:] + chunk
+            self.position = 0
+
+    def write_values(self):
+        if self.values:
+            self.stdout.write('\n'.join(map(str, self.values)))
+            self.stdout.write('\n')
+            self.values.clear()
+
+    def flush(self):
+        self.write_values()
+        self.stdout.flush()
+
+def execute(code, runtime):
+    # Executes a compiled program in a fresh namespace whose print and input go to runtime.
+    # Returns the exception that ended the program, or None when it finished
+    namespace = {
+        '__name__': '__main__',
+        '__builtins__': builtins,
+        'print': runtime.print,
+        'input': runtime.input,
+    }
+    try:
+        exec(code, namespace)
+    except (Exception, KeyboardInterrupt) as error:
+        return error
+    return None
+
+def format_error(error):
+    # The traceback of a failed program, without the frames of this module
+    report = traceback.TracebackException.from_exception(error)
+    report.stack = traceback.StackSummary.from_list([frame for frame in report.stack if frame.filename != __file__])
+    return ''.join(report.format())
+
+def run(code, stdin=None, stdout=None):
+    # Runs a program on the process stdin and stdout and returns its exit status: 0 on success,
+    # 1 when it raised (the traceback goes to stderr after the buffered output) and 130 when it
+    # was interrupted
+    runtime = Runtime(stdin, stdout)
+    error = execute(code, runtime)
+    if error is None:
+        status = 0
+    elif isinstance(error, KeyboardInterrupt):
+        status = 130
+    else:
+        status = 1
+    try:
+        runtime.flush()
+    except BrokenPipeError:
+        # The reader went away (e.g. `| head`). What is left in the stdout buffer is dropped, so
+        # the interpreter does not fail again flushing it at exit
+        if runtime.stdout is sys.stdout:
+            os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        return status or 1
+    if status == 1:
+        sys.stderr.write(format_error(error))
+    return status
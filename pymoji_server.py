@@ -0,0 +1,153 @@
+import os
+import sys
+import json
+import socket
+import struct
+import signal
+import asyncio
+import argparse
+import concurrent.futures
+
+# Warm compile server. Requests and responses are JSON objects framed by a 4 byte big-endian
+# length over a Unix socket:
+#   request:  {"source": "<emojicode>"}
+#   response: {"ok": true, "python": "<python code>"} or {"ok": false, "error": "<message>"}
+# A connection may send any number of requests. The client side only uses the standard
+# library, so it does not pay for importing the compiler
+
+header = struct.Struct('>I')
+max_message_size = 256 * 1024 * 1024
+
+def default_socket_path():
+    directory = os.environ.get('XDG_RUNTIME_DIR') or '/tmp'
+    return os.path.join(directory, f'pymoji-{os.getuid()}.sock')
+
+def encode_message(message):
+    data = json.dumps(message, ensure_ascii=False).encode('utf-8')
+    return header.pack(len(data)) + data
+
+async def read_message(reader):
+    try:
+        size, = header.unpack(await reader.readexactly(header.size))
+    except asyncio.IncompleteReadError:
+        return None
+    if size > max_message_size:
+        raise RuntimeError(f'Message too large: {size} bytes')
+    return json.loads(await reader.readexactly(size))
+
+def worker_compile(source):
+    # Runs in the pool processes, where the compiler module and its tables stay imported
+    import pymoji
+    try:
+        return {'ok': True, 'python': pymoji.compile_source(source)}
+    except RuntimeError as error:
+        return {'ok': False, 'error': str(error)}
+
+class CompileServer:
+    def __init__(self, socket_path, workers=None):
+        self.socket_path = socket_path
+        self.workers = workers or (len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else os.cpu_count() or 1)
+        self.pool = None
+
+    async def handle_connection(self, reader, writer):
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                try:
+                    request = await read_message(reader)
+                except (RuntimeError, ValueError) as error:
+                    writer.write(encode_message({'ok': False, 'error': str(error)}))
+                    break
+                if request is None:
+                    break
+                if not isinstance(request, dict) or not isinstance(request.get('source'), str):
+                    response = {'ok': False, 'error': 'Request must be an object with a "source" string'}
+                else:
+                    response = await loop.run_in_executor(self.pool, worker_compile, request['source'])
+                writer.write(encode_message(response))
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    def remove_stale_socket(self):
+        if not os.path.exists(self.socket_path):
+            return
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(self.socket_path)
+        except (ConnectionRefusedError, FileNotFoundError):
+            os.remove(self.socket_path)
+        else:
+            raise RuntimeError(f'A compile server is already listening on {self.socket_path}')
+        finally:
+            probe.close()
+
+    async def serve(self):
+        self.remove_stale_socket()
+        loop = asyncio.get_running_loop()
+        with concurrent.futures.ProcessPoolExecutor(max_workers=self.workers) as pool:
+            self.pool = pool
+            # Start every worker and import the compiler now instead of on the first requests
+            await asyncio.gather(*(loop.run_in_executor(pool, worker_compile, '▶️\n⏹️') for _ in range(self.workers)))
+
+            server = await asyncio.start_unix_server(self.handle_connection, path=self.socket_path)
+            stop = loop.create_future()
+            for signum in (signal.SIGINT, signal.SIGTERM):
+                loop.add_signal_handler(signum, stop.set_result, None)
+            print(f'pymoji compile server listening on {self.socket_path} with {self.workers} workers', flush=True)
+            try:
+                async with server:
+                    await stop
+            finally:
+                if os.path.exists(self.socket_path):
+                    os.remove(self.socket_path)
+
+def receive_exactly(connection, size):
+    chunks = []
+    while size:
+        chunk = connection.recv(min(size, 1 << 20))
+        if not chunk:
+            raise ConnectionError('Compile server closed the connection')
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b''.join(chunks)
+
+def compile_remote(source, socket_path=None):
+    # Sends one program to a running server and returns its response object
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+        connection.connect(socket_path or default_socket_path())
+        connection.sendall(encode_message({'source': source}))
+        size, = header.unpack(receive_exactly(connection, header.size))
+        return json.loads(receive_exactly(connection, size))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Warm emojicode compile server and its client.')
+    parser.add_argument('--socket', default=default_socket_path(), help='Unix socket path (default: %(default)s)')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    serve_parser = commands.add_parser('serve', help='run the compile server')
+    serve_parser.add_argument('--workers', type=int, default=None, help='number of compiler processes (default: available cores)')
+
+    compile_parser = commands.add_parser('compile', help='compile a file through a running server')
+    compile_parser.add_argument('--in', dest='input_file', default='example.pye', help='input emojicode file path (default: example.pye)')
+    compile_parser.add_argument('--out', dest='output_file', default=None, help='output file path (default: print to stdout)')
+
+    args = parser.parse_args()
+
+    if args.command == 'serve':
+        try:
+            asyncio.run(CompileServer(args.socket, args.workers).serve())
+        except RuntimeError as error:
+            sys.exit(str(error))
+    else:
+        with open(args.input_file, 'r', encoding='utf-8') as file:
+            response = compile_remote(file.read(), args.socket)
+        if not response['ok']:
+            sys.exit(f'{args.input_file}: {response["error"]}')
+        if args.output_file:
+            with open(args.output_file, 'w', encoding='utf-8') as file:
+                file.write(response['python'])
+        else:
+            sys.stdout.write(response['python'] + '\n')
@@ -0,0 +1,77 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmarks'))
+
+import pymoji
+import pymoji_binary
+from program_generator import ProgramGenerator
+
+# Round trips through the files of --emit-tokens and --emit-ast: reading them back must give the
+# tokens and the tree of the source, spans included, walking a file with BinaryFile must reach
+# every node, and --from-ast must generate the code of compiling the source
+
+def nodes(ast):
+    # Every node of a tree with its span, depth first
+    found = []
+    stack = list(reversed(ast))
+    while stack:
+        node = stack.pop()
+        found.append((type(node).__name__, node.span))
+        children = []
+        for field in node.__slots__:
+            value = getattr(node, field)
+            if type(value) is list:
+                children.extend(value)
+            elif isinstance(value, pymoji.Node):
+                children.append(value)
+        stack.extend(reversed(children))
+    return found
+
+def emitted(tmp_path, source):
+    input_file = tmp_path / 'program.pye'
+    input_file.write_text(source, encoding='utf-8')
+    tokens_file, ast_file = str(tmp_path / 'program.pytok'), str(tmp_path / 'program.pyast')
+    pymoji.emit_file(str(input_file), tokens_file, ast_file)
+    return tokens_file, ast_file
+
+def test_round_trips(tmp_path):
+    for seed in range(40):
+        source = ProgramGenerator(seed).generate(4000)
+        tokens_file, ast_file = emitted(tmp_path, source)
+
+        tokens = pymoji.tokenize(source)
+        assert [(pymoji.TokenKind[kind], text, offset) for kind, text, offset in pymoji_binary.load_tokens(tokens_file)] == [tuple(token) for token in tokens], seed
+
+        ast = pymoji.Parser(tokens).parse()
+        loaded = pymoji_binary.load_ast(ast_file)
+        assert loaded == ast, seed
+        assert nodes(loaded) == nodes(ast), seed
+
+        with pymoji_binary.BinaryFile(ast_file) as tree:
+            walked = []
+            stack = list(reversed(tree.program()))
+            while stack:
+                index = stack.pop()
+                walked.append(tree.span(index))
+                stack.extend(reversed(tree.children(index)))
+        assert walked == [span for _, span in nodes(ast)], seed
+
+        for level in (0, 3):
+            output_file = str(tmp_path / 'program.py')
+            assert pymoji.compile_tree_file(ast_file, output_file, level, True) == pymoji.compile_source(source, optimize=level, function=True), (seed, level)
+
+def test_invalid_files(tmp_path):
+    tokens_file, ast_file = emitted(tmp_path, '▶️\n📤 1\n⏹️\n')
+    empty = tmp_path / 'empty.pyast'
+    empty.write_bytes(b'')
+    for path in (str(empty), str(tmp_path / 'program.pye')):
+        with pytest.raises(RuntimeError, match='is not a pymoji binary file'):
+            pymoji_binary.load_ast(path)
+    with pytest.raises(RuntimeError, match='not an AST file'):
+        pymoji_binary.load_ast(tokens_file)
+    with pytest.raises(RuntimeError, match='not a tokens file'):
+        pymoji_binary.load_tokens(ast_file)
@@ -0,0 +1,84 @@
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmarks'))
+
+import pymoji
+from program_generator import ProgramGenerator
+
+# Tests of CompilationCache: a hit must give what compiling the program again gives, entries are
+# only shared by compilations with the same options, the AST stored with cache_ast is the one of
+# the source, and broken entries, leftover temporary files and a full directory are dealt with
+
+def compiled(cache, source, cache_ast=False, **options):
+    # The generated code, its source map, its code object and whether the cache had it
+    stats = pymoji.CompileStats()
+    python, mappings = pymoji.compile_mapped(source, cache, cache_ast, stats=stats, **options)
+    code = pymoji.compile_code(source, cache, cache_ast, **options)
+    return python, mappings, code, stats.cache
+
+def test_hits_and_misses(tmp_path):
+    cache = pymoji.CompilationCache(str(tmp_path))
+    for seed in range(10):
+        source = ProgramGenerator(seed).generate(2000)
+        for options in ({}, {'optimize': 3, 'function': True}, {'vectorize': True}, {'budget': 100}):
+            expected = pymoji.compile_mapped(source, **options)
+            python, mappings, code, first = compiled(cache, source, **options)
+            assert (python, mappings) == expected, (seed, options)
+            assert code == compile(python, '<emojicode>', 'exec'), (seed, options)
+            assert first == 'miss', (seed, options)
+            assert compiled(cache, source, **options) == (python, mappings, code, 'hit'), (seed, options)
+    # One entry per program and options
+    assert len([name for name in os.listdir(tmp_path) if name.endswith(cache.suffix)]) == 40
+
+def test_cached_ast(tmp_path):
+    cache = pymoji.CompilationCache(str(tmp_path))
+    source = ProgramGenerator(0).generate(2000)
+    # Entries stored without the AST do not serve compilations that want it
+    assert compiled(cache, source)[3] == 'miss'
+    assert compiled(cache, source, cache_ast=True)[3] == 'miss'
+    assert compiled(cache, source, cache_ast=True)[3] == 'hit'
+
+    for optimize in (0, 2):
+        expected = pymoji.parse_source(source, optimize)
+        entry = pymoji.cached_compile(source, cache, True, optimize=optimize)
+        assert cache.entry_ast(entry) == expected
+        session = pymoji.CompilerSession(optimize, cache=cache, cache_ast=True)
+        stats = pymoji.CompileStats()
+        assert session.parse(source, stats) == expected
+        assert stats.cache == 'hit'
+    assert cache.entry_ast(pymoji.cached_compile(source, cache)) is None
+
+def test_broken_entries(tmp_path):
+    cache = pymoji.CompilationCache(str(tmp_path))
+    source = '▶️\n📤 1\n⏹️\n'
+    python = compiled(cache, source)[0]
+    path = cache.path(cache.key(source, (('optimize', 0), ('function', False))))
+    for data in (b'', b'junk', cache.magic + b'\x00\x01'):
+        with open(path, 'wb') as file:
+            file.write(data)
+        assert compiled(cache, source)[0::3] == (python, 'miss'), data
+        assert compiled(cache, source)[0::3] == (python, 'hit'), data
+
+def test_eviction(tmp_path):
+    cache = pymoji.CompilationCache(str(tmp_path), max_size=20000)
+    stale = tmp_path / f'{cache.temp_prefix}stale'
+    stale.write_bytes(b'x')
+    old = time.time() - 2 * cache.stale_age
+    os.utime(stale, (old, old))
+    recent = tmp_path / f'{cache.temp_prefix}recent'
+    recent.write_bytes(b'x')
+
+    sources = [ProgramGenerator(seed).generate(2000) for seed in range(20)]
+    for source in sources:
+        pymoji.compile_source(source, cache)
+    entries = [entry for entry in os.scandir(tmp_path) if entry.name.endswith(cache.suffix)]
+    assert 0 < len(entries) < len(sources)
+    assert sum(entry.stat().st_size for entry in entries) <= cache.max_size
+    # The last program is the most recently used, it is never the one evicted
+    assert os.path.exists(cache.path(cache.key(sources[-1], (('optimize', 0), ('function', False)))))
+    # Only the temporary file of a write that never finished is removed
+    assert not stale.exists()
+    assert recent.exists()
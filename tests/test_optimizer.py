@@ -0,0 +1,133 @@
+import io
+import os
+import sys
+import random
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmarks'))
+
+import pymoji
+import pymoji_numpy
+import pymoji_runtime
+from program_generator import ProgramGenerator
+
+# Differential test of the optimizer, of the code motion of -O 3 and of the --numpy backend: at
+# every -O level a program must print the same values and end with the same kind of error as
+# without optimization, and a vectorized loop must give the values of the scalar one. The
+# generated programs also declare variables in branches that may not run, so the NameErrors of
+# the reads that are folded away must be kept. Their 🐳 loops may never end, so they run with a
+# budget
+
+stdin = 'abc\n' * 1000
+
+def run(source, budget=5000, **options):
+    # What the program prints and the name of the exception that ended it
+    code = pymoji.compile_code(source, budget=budget, **options)
+    runtime = pymoji_runtime.Runtime(io.StringIO(stdin), io.StringIO())
+    error = pymoji_runtime.execute(code, runtime)
+    runtime.flush()
+    if isinstance(error, NameError):
+        # In main() a name the optimizer removed every assignment of is no longer a local, so
+        # reading it raises NameError instead of UnboundLocalError
+        return runtime.stdout.getvalue(), 'NameError'
+    return runtime.stdout.getvalue(), type(error).__name__ if error is not None else None
+
+def test_generated_programs():
+    hoisted = 0
+    for seed in range(150):
+        source = ProgramGenerator(seed).generate(1500)
+        for function in (False, True):
+            expected = run(source, function=function)
+            for level in (1, 2, 3):
+                assert run(source, optimize=level, function=function) == expected, (seed, level, function)
+        hoisted += '_t0' in pymoji.compile_source(source, optimize=3)
+    # Most of them have loop invariant or repeated operations for -O 3 to move into temporaries
+    assert hoisted > 100
+
+# b and n are declared in a branch that never runs, so every read of them raises NameError unless
+# the other operand of 😍😍/😘🤨 decides the result first
+short_circuits = {
+    '📤 b 😍😍 ❎': 'NameError',
+    '📤 b 😘🤨 ✅': 'NameError',
+    '📤 n 🙅 0': 'NameError',
+    '📤 n 🔫 n': 'NameError',
+    '📤 ❎ 😍😍 b': None,
+    '📤 ✅ 😘🤨 b': None,
+    '📤 ❎ 😍😍 n ♊ n': None,
+}
+
+def test_unbound_reads():
+    for statement, error in short_circuits.items():
+        source = f'▶️\n🍷🗿 ❎ 🔓\n✳️ b = ✅\n🔢 n = 1\n🔒\n{statement}\n⏹️\n'
+        expected = run(source, budget=None)
+        assert expected[1] == error, statement
+        for level in (1, 2, 3):
+            assert run(source, budget=None, optimize=level) == expected, (statement, level)
+
+def test_temporary_names_are_reserved():
+    # The temporaries of -O 3 start with _, which no declared or 🔂 variable can
+    for source in ('▶️\n🔢 _t0 = 1\n⏹️\n', '▶️\n🔂 _t0 ⛳ 3 🔓\n📤 _t0\n🔒\n⏹️\n'):
+        with pytest.raises(RuntimeError, match='must start with an alphabetical character'):
+            pymoji.compile_source(source, optimize=3)
+
+def vector_program(seed):
+    # A 🔂 loop long enough for --numpy, whose body only does arithmetic on accumulators, on the
+    # loop variable and on variables set before it. Values past 2**53, divisions by zero and
+    # infinities make the vectorized loop fall back to the scalar one
+    rng = random.Random(seed)
+
+    def expression(names, depth=0):
+        if depth > 2 or rng.random() < 0.3:
+            choice = rng.random()
+            if choice < 0.4:
+                return 'i'
+            elif choice < 0.7 and names:
+                return rng.choice(names)
+            return str(rng.choice((0, 1, 2, 3, 7, 100, 12345, 2 ** 40, 2 ** 60)))
+        return f'{expression(names, depth + 1)} {rng.choice(("🤰", "🔫", "🙅", "🇦🇴"))} {expression(names, depth + 1)}'
+
+    lines = ['▶️']
+    constants = [f'c{index}' for index in range(rng.randint(0, 3))]
+    for name in constants:
+        lines.append(f'🔢 {name} = {rng.choice(("0", "1", "5", "3 🇦🇴 4", "2 🙅 1000000"))}')
+    accumulators = [f'a{index}' for index in range(rng.randint(1, 3))]
+    for name in accumulators:
+        lines.append(f'🔢 {name} = {rng.choice(("0", "1", "2", "1 🇦🇴 3", "1000"))}')
+    # 70000 iterations take more than one chunk of pymoji_numpy
+    count = rng.choice((1000, 1500, 70000))
+    lines.append(f'🔂 i ⛳ {count} 🔓')
+    for name in accumulators:
+        choice = rng.random()
+        if choice < 0.5:
+            lines.append(f'  {name} = {name} {rng.choice(("🤰", "🔫"))} {expression(constants)}')
+        elif choice < 0.65 and count < 70000:
+            # Products of small factors, the ints stay printable
+            lines.append(f'  {name} = {name} 🙅 {rng.choice(("1", "2", "3 🇦🇴 4", "1 🇦🇴 3"))}')
+        elif choice < 0.8:
+            lines.append(f'  {name} = {expression(constants)} 🤰 {name}')
+        else:
+            lines.append(f'  {name} = {expression(constants)}')
+    lines.append('🔒')
+    lines.extend(f'📤 {name}' for name in accumulators + ['i'])
+    lines.append('⏹️')
+    return '\n'.join(lines) + '\n'
+
+def test_vectorized_loops(monkeypatch):
+    # The --numpy backend must give the results of the scalar loops, NumPy or not
+    vectorized = []
+    vectorize = pymoji_numpy.vectorize
+    monkeypatch.setattr(pymoji_numpy, 'vectorize', lambda *args: vectorized.append(vectorize(*args)) or vectorized[-1])
+    compiled = 0
+    for seed in range(200):
+        source = vector_program(seed)
+        compiled += '_pymoji_vectorize' in pymoji.compile_source(source, vectorize=True)
+        for level in (0, 1):
+            for function in (False, True):
+                expected = run(source, budget=None, optimize=level, function=function)
+                assert run(source, budget=None, optimize=level, function=function, vectorize=True) == expected, (seed, level, function)
+    # Loops that are not sums or products of their accumulators stay scalar
+    assert compiled > 100
+    if pymoji_numpy.numpy is not None:
+        assert sum(result is not None for result in vectorized) > 30
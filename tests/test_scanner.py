@@ -0,0 +1,52 @@
+import os
+import sys
+import random
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmarks'))
+
+import pymoji
+from program_generator import ProgramGenerator
+
+# Differential test of the scanner (scan) against the reference regex scanner (scan_regex): both
+# must give the same tokens, kinds, values and offsets, or the same error. The fuzzed inputs are
+# random strings over the emoji of the language, their prefixes and variation selectors, and
+# words, digits and blanks that the two scanners classify with different code
+
+fragments = [
+    '▶️', '⏹️', '🧵', '🔢', '✳️', '✳', '▶', '=', '📥', '📤', '🌪️', '🌪', '✅', '❎', '🍷🗿', '🍷',
+    '🗿', '☝️🤓', '☝', '🤓', '🔓', '🔒', '😍😍', '😍', '😘🤨', '😘', '♊', '♓', '🐜', '🐞', '🐘',
+    '🦣', '🐜🐞', '🐘🦣', '🤰', '🔫', '🙅', '🇦🇴', '🇦', '🐳', '🔂', '⛳', ' ', '\t', '\n', 'x',
+    'abc', '_a', 'é', '12', '٣', '²', '0', 'a1', "'", '\r', '#', '️', '🌪️hi there🌪️',
+]
+
+def scanned(scanner, source, offset=0):
+    try:
+        return list(scanner(source, offset))
+    except RuntimeError as error:
+        return str(error)
+
+def fuzzed_sources(seed, count, length=30):
+    rng = random.Random(seed)
+    for _ in range(count):
+        yield ''.join(rng.choice(fragments) for _ in range(rng.randint(0, length)))
+
+def test_fuzzed_sources():
+    valid = 0
+    for source in fuzzed_sources(2024, 20000):
+        expected = scanned(pymoji.scan_regex, source)
+        assert scanned(pymoji.scan, source) == expected, source
+        valid += type(expected) is list
+    # Both outcomes must be exercised
+    assert 0 < valid < 20000
+
+def test_offsets():
+    for source in fuzzed_sources(7, 2000):
+        assert scanned(pymoji.scan, source, 1000) == scanned(pymoji.scan_regex, source, 1000), source
+
+def test_generated_programs():
+    for seed in range(20):
+        source = ProgramGenerator(seed).generate(20000)
+        expected = list(pymoji.scan_regex(source))
+        assert list(pymoji.scan(source)) == expected
+        assert list(pymoji.tokenize(source)) == expected
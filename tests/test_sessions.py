@@ -0,0 +1,77 @@
+import os
+import gc
+import sys
+import time
+import threading
+import tracemalloc
+import concurrent.futures
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmarks'))
+
+import pymoji
+from program_generator import ProgramGenerator
+
+# Stress test of CompilerSession: sessions with different options (cache, optimization levels,
+# --function, --numpy, budgets, memory tracing) compile generated programs from a pool of threads
+# at once while another thread keeps adding and removing a global compile hook. Every result must
+# be the one of a sequential compilation, and the garbage collector and tracemalloc must be back
+# as they were
+
+def session_options(cache_dir):
+    return {
+        'plain': {},
+        'cached': {'cache': pymoji.CompilationCache(cache_dir), 'cache_ast': True},
+        'optimized': {'optimize': 3, 'function': True},
+        'numpy': {'optimize': 1, 'vectorize': True},
+        'budget': {'optimize': 2, 'budget': 1000},
+    }
+
+def compile_all(session, source, trace_memory=False):
+    # Everything a session gives for a program, in a form that compares by value
+    stats = pymoji.CompileStats(trace_memory) if trace_memory else None
+    try:
+        python, mappings = session.compile_mapped(source, stats=stats)
+    finally:
+        if stats is not None:
+            stats.finish()
+    # Code objects compare by their bytecode, constants and names. Their marshal data would not
+    # do, it depends on reference counts that other threads change
+    code = session.compile_code(source, filename='<program>')
+    return python, mappings, code
+
+def test_concurrent_sessions(tmp_path):
+    sources = [ProgramGenerator(seed).generate(4000) for seed in range(12)]
+    sessions = {name: pymoji.CompilerSession(**options) for name, options in session_options(str(tmp_path)).items()}
+    expected = {(name, index): compile_all(session, source) for name, session in sessions.items() for index, source in enumerate(sources)}
+
+    collecting = gc.isenabled()
+    tracing = tracemalloc.is_tracing()
+    stop = threading.Event()
+    events = []
+
+    def toggle_hook():
+        hook = lambda event, data: events.append(event)
+        while not stop.is_set():
+            pymoji.add_compile_hook(hook)
+            time.sleep(0.0005)
+            pymoji.remove_compile_hook(hook)
+
+    def job(task):
+        name, index, trace_memory = task
+        return (name, index), compile_all(sessions[name], sources[index], trace_memory)
+
+    tasks = [(name, index, (index + round) % 4 == 0) for round in range(2) for name in sessions for index in range(len(sources))]
+    toggler = threading.Thread(target=toggle_hook)
+    toggler.start()
+    try:
+        with concurrent.futures.ThreadPoolExecutor(8) as executor:
+            mismatches = [key for key, result in executor.map(job, tasks) if result != expected[key]]
+    finally:
+        stop.set()
+        toggler.join()
+
+    assert mismatches == []
+    assert events
+    assert gc.isenabled() == collecting
+    assert tracemalloc.is_tracing() == tracing
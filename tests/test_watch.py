@@ -0,0 +1,65 @@
+import os
+import sys
+import random
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmarks'))
+
+import pymoji
+from program_generator import ProgramGenerator
+
+# Differential test of --watch: after every random edit of a generated program, the output of
+# IncrementalCompiler.update must be the one of compiling the edited program from scratch, or
+# the same error. The edits insert and delete text anywhere, statements, block markers and parts
+# of names included, so they also break and repair the program
+
+fragments = [
+    '📤 1\n', '🔢 q = 3\n', 'x', '🔒', '🔓', '🍷🗿 ✅ 🔓\n', '\n', ' ', '🤰 2', 'v1', '🔢 v2 = 5\n',
+    '⏹️', '=', '🌪️', 'a',
+]
+
+def compiled(update, source):
+    try:
+        return update(source)
+    except RuntimeError as error:
+        return f'error: {error}'
+
+def edit(rng, source):
+    choice = rng.random()
+    digits = [index for index, character in enumerate(source) if character.isdigit()]
+    if choice < 0.3 and digits:
+        # Keeps the program valid
+        index = rng.choice(digits)
+        return source[:index] + str(rng.randint(0, 9)) + source[index + 1:]
+    elif choice < 0.6:
+        start = rng.randint(0, len(source))
+        return source[:start] + source[start + rng.randint(0, 8):]
+    elif choice < 0.85:
+        start = rng.randint(0, len(source))
+        return source[:start] + rng.choice(fragments) + source[start:]
+    lines = source.split('\n')
+    lines[rng.randrange(len(lines))] = rng.choice(lines)
+    return '\n'.join(lines)
+
+def test_edits():
+    incremental = errors = 0
+    for seed in range(150):
+        rng = random.Random(seed)
+        function = seed % 2 == 1
+        source = ProgramGenerator(seed, max_depth=2).generate(600)
+        compiler = pymoji.IncrementalCompiler(function)
+        valid = source
+        for step in range(25):
+            # Half of the edits start again from the last program that compiled, like an editor
+            # session that fixes its mistakes
+            source = edit(rng, source if rng.random() < 0.5 else valid)
+            result = compiled(compiler.update, source)
+            assert result == compiled(lambda source: pymoji.compile_source(source, function=function), source), (seed, step)
+            if result.startswith('error: '):
+                errors += 1
+            else:
+                valid = source
+                incremental += compiler.reparsed < len(compiler.records)
+    # Both the local updates and the errors must be exercised
+    assert incremental > 200
+    assert errors > 500